@@ -1,4 +1,6 @@
+from app import storage
 from app.auth.schema import TokenData
+from app.model import services as model_services
 from app.user.models import User
 from sqlalchemy.orm import Session
 
@@ -39,6 +41,8 @@ async def new_feedback(
     database.add(new_feedback)
     database.commit()
     database.refresh(new_feedback)
+    # Images with feedback are kept, whatever the upload store budget
+    await storage.pin(model_services.db, request.image_file_name)
     return new_feedback
 
 
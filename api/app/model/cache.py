@@ -0,0 +1,140 @@
+import json
+import time
+
+from .. import settings
+
+# Sorted set tracking every cached entry by last access time (LRU order)
+INDEX_KEY = f"{settings.CACHE_PREFIX}:index"
+HITS_KEY = f"{settings.CACHE_PREFIX}:hits"
+MISSES_KEY = f"{settings.CACHE_PREFIX}:misses"
+
+
+def cache_key(file_hash):
+    """
+    Builds the Redis key for a cached prediction. The model version is part
+    of the key so a new model never serves results from the previous one.
+
+    Parameters
+    ----------
+    file_hash : str
+        Hash of the image content.
+
+    Returns
+    -------
+    str
+        Redis key for the prediction.
+    """
+    return f"{settings.CACHE_PREFIX}:{settings.MODEL_VERSION}:{file_hash}"
+
+
+async def lookup(db, file_hash):
+    """
+    Looks up the prediction for an image, refreshing its TTL and LRU
+    position and counting the hit when found. Misses are counted by the
+    caller, see count_miss(), as a request may look up the same image more
+    than once.
+
+    Parameters
+    ----------
+    db : redis.asyncio.Redis
+        Redis client.
+    file_hash : str
+        Hash of the image content.
+
+    Returns
+    -------
+    dict or None
+        Cached ML service output, None if the image isn't in the cache.
+    """
+    key = cache_key(file_hash)
+    output = await db.get(key)
+    if output is None:
+        return None
+
+    async with db.pipeline(transaction=False) as pipe:
+        pipe.incr(HITS_KEY)
+        pipe.expire(key, settings.CACHE_TTL)
+        pipe.zadd(INDEX_KEY, {key: time.time()})
+        await pipe.execute()
+
+    return json.loads(output.decode("utf-8"))
+
+
+def count_miss(pipe):
+    """
+    Counts a request the cache couldn't answer, as part of the caller's
+    pipeline.
+
+    Parameters
+    ----------
+    pipe : redis.asyncio.client.Pipeline
+        Pipeline the command is added to.
+    """
+    pipe.incr(MISSES_KEY)
+
+
+async def store(db, file_hash, output):
+    """
+    Stores the prediction for an image. Once the cache holds more than
+    `settings.CACHE_MAX_ENTRIES` predictions the least recently used ones
+    are evicted.
+
+    Parameters
+    ----------
+    db : redis.asyncio.Redis
+        Redis client.
+    file_hash : str
+        Hash of the image content.
+    output : dict
+        ML service output: prediction, score, most likely classes and the
+        model which answered.
+    """
+    key = cache_key(file_hash)
+    now = time.time()
+
+    async with db.pipeline(transaction=False) as pipe:
+        pipe.set(key, json.dumps(output))
+        pipe.expire(key, settings.CACHE_TTL)
+        pipe.zadd(INDEX_KEY, {key: now})
+        # Forget entries whose key already expired
+        pipe.zremrangebyscore(INDEX_KEY, 0, now - settings.CACHE_TTL)
+        pipe.zcard(INDEX_KEY)
+        size = (await pipe.execute())[-1]
+
+    # Evict the least recently used entries over the limit
+    if size > settings.CACHE_MAX_ENTRIES:
+        evicted = await db.zpopmin(INDEX_KEY, size - settings.CACHE_MAX_ENTRIES)
+        await db.delete(*[key for key, _ in evicted])
+
+
+async def stats(db):
+    """
+    Returns the cache usage counters, used to size the cache.
+
+    Parameters
+    ----------
+    db : redis.asyncio.Redis
+        Redis client.
+
+    Returns
+    -------
+    dict
+        Number of hits, misses, cached entries and the hit rate.
+    """
+    async with db.pipeline(transaction=False) as pipe:
+        pipe.get(HITS_KEY)
+        pipe.get(MISSES_KEY)
+        pipe.zcard(INDEX_KEY)
+        hits, misses, size = await pipe.execute()
+
+    hits = int(hits or 0)
+    misses = int(misses or 0)
+    lookups = hits + misses
+
+    return {
+        "hits": hits,
+        "misses": misses,
+        "size": size,
+        "max_size": settings.CACHE_MAX_ENTRIES,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+    }
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from .. import settings, storage
+
+
+def load_model_input(path):
+    """
+    Decode an image and resize it to the model input, with the same steps
+    as the ML service load_image(): JPEG images are decoded straight to a
+    reduced resolution, then everything is converted to RGB and resized
+    with nearest neighbour resampling.
+
+    Parameters
+    ----------
+    path : str
+        Image path.
+
+    Returns
+    -------
+    img : PIL.Image.Image
+        RGB image of `settings.EDGE_IMAGE_SIZE` pixels per side.
+
+    Raises
+    ------
+    ValueError
+        If the file isn't an image in one of `settings.EDGE_FORMATS`, or
+        has more than `settings.MAX_IMAGE_PIXELS` pixels, or can't be
+        decoded.
+    """
+    size = settings.EDGE_IMAGE_SIZE
+    try:
+        # Opening only reads the header, the format comes from the content
+        with Image.open(path) as img:
+            if img.format not in settings.EDGE_FORMATS:
+                raise ValueError(f"{img.format} images aren't supported")
+            if img.width * img.height > settings.MAX_IMAGE_PIXELS:
+                raise ValueError(
+                    f"Image is {img.width}x{img.height}, more than the "
+                    f"{settings.MAX_IMAGE_PIXELS} pixels allowed"
+                )
+
+            img.draft("RGB", (size, size))
+            return img.convert("RGB").resize((size, size), Image.NEAREST)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Image could not be decoded: {e}")
+
+
+def is_canonical(path):
+    """
+    Whether an image is already the model input, an RGB PNG of
+    `settings.EDGE_IMAGE_SIZE` pixels per side.
+    """
+    size = settings.EDGE_IMAGE_SIZE
+    try:
+        with Image.open(path) as img:
+            return (
+                img.format == "PNG" and img.mode == "RGB" and img.size == (size, size)
+            )
+    except (OSError, Image.DecompressionBombError):
+        return False
+
+
+def canonicalize(tmp_path, filename):
+    """
+    Store the canonical copy of an upload instead of the upload: the model
+    input, as a lossless PNG named after the hash of the upload. The ML
+    service decodes the small copy to the exact pixels it would get from
+    the original, so predictions don't change, and only the small copy is
+    written to the store. Run it in the threadpool, decoding blocks.
+
+    Parameters
+    ----------
+    tmp_path : str
+        Upload received by utils.spool_upload(), deleted once done.
+    filename : str
+        Upload name returned by utils.spool_upload().
+
+    Returns
+    -------
+    new_filename : str
+        Name of the canonical copy in the upload store.
+    stats : dict
+        Bytes of the upload and of the copy, time spent here and decode
+        time the ML service saves, in seconds. None if the copy was
+        already stored.
+
+    Raises
+    ------
+    ValueError
+        If the upload isn't a supported image, see load_model_input().
+        Nothing is stored.
+    """
+    start = time.perf_counter()
+    new_filename = f"{os.path.splitext(filename)[0]}.png"
+
+    try:
+        # Same image uploaded before, it was already converted
+        if storage.exists(new_filename):
+            return new_filename, None
+        if is_canonical(tmp_path):
+            storage.put(tmp_path, new_filename)
+            return new_filename, None
+
+        bytes_in = os.path.getsize(tmp_path)
+        try:
+            img = load_model_input(tmp_path)
+        except ValueError as e:
+            raise ValueError(f"Image {filename} could not be processed: {e}")
+        decode_seconds = time.perf_counter() - start
+
+        with tempfile.NamedTemporaryFile(
+            dir=settings.UPLOAD_FOLDER, suffix=".part", delete=False
+        ) as f:
+            img.save(f, format="PNG", compress_level=1)
+        try:
+            # What decoding takes now for the ML service
+            decode_start = time.perf_counter()
+            load_model_input(f.name)
+            decode_seconds -= time.perf_counter() - decode_start
+
+            bytes_out = os.path.getsize(f.name)
+            storage.put(f.name, new_filename)
+        finally:
+            if os.path.exists(f.name):
+                os.remove(f.name)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return new_filename, {
+        "images": 1,
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "seconds": time.perf_counter() - start,
+        "decode_seconds_saved": decode_seconds,
+    }
@@ -1,17 +1,37 @@
-import os
+from typing import Optional
 
 from app import settings as config
-from app import utils
+from app import storage, utils
 from app.auth.jwt import get_current_user
-from app.model.schema import PredictResponse
-from app.model.services import model_predict
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, status  # File
+from app.model import preprocess
+from app.model.schema import (
+    CacheStats,
+    CascadeStats,
+    EdgeStats,
+    PredictResponse,
+    StorageStats,
+)
+from app.model.services import (
+    cache_stats,
+    cascade_stats,
+    edge_stats,
+    model_predict,
+    record_edge,
+    record_upload,
+    storage_stats,
+)
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 
 router = APIRouter(tags=["Model"], prefix="/model")
 
 
 @router.post("/predict")
-async def predict(file: UploadFile, current_user=Depends(get_current_user)):
+async def predict(
+    file: UploadFile,
+    top_k: Optional[int] = Query(None, ge=1, le=config.TOP_K),
+    current_user=Depends(get_current_user),
+):
     rpse = {"success": False, "prediction": None, "score": None}
 
     # Check a file was sent and that file is an image
@@ -21,25 +41,75 @@ async def predict(file: UploadFile, current_user=Depends(get_current_user)):
             detail="File type is not supported.",
         )
 
-    # Store the image to disk, calculate hash before to avoid re-writing an image already uploaded.
-    new_filename = await utils.get_file_hash(file)
-    file_path = os.path.join(config.UPLOAD_FOLDER, new_filename)
+    # Check it's an image and keep only what the model needs, the ML service
+    # gets a small file and bad images are rejected before being stored
+    if config.EDGE_PREPROCESS:
+        tmp_path, new_filename = await utils.spool_upload(file)
+        try:
+            new_filename, stats = await run_in_threadpool(
+                preprocess.canonicalize, tmp_path, new_filename
+            )
+        except ValueError:
+            await record_edge({"rejected": 1})
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Image could not be processed.",
+            )
+        if stats is not None:
+            await record_edge(stats)
+    else:
+        # Store the image under its content hash, in one pass. An image
+        # already uploaded isn't re-written.
+        new_filename = await utils.save_upload(file)
 
-    if not os.path.exists(file_path):
-        with open(file_path, "wb") as out_file:
-            content = await file.read()
-            out_file.write(content)
+    # Count the use, images unused for long get deleted when the upload
+    # store is over budget
+    await record_upload(new_filename)
 
-        # Reset file pointer to the beginning
-        await file.seek(0)
-
-    # Send the file to be processed by the model service
-    prediction, score = await model_predict(file_path)
+    # Send the file to be processed by the model service, which reads it
+    # from the same store under the same key
+    try:
+        output = await model_predict(storage.relative_path(new_filename), top_k or 1)
+    except TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Model service did not answer in time.",
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Image could not be processed.",
+        )
 
     # Update and return rpse dict with the corresponding values
     rpse["success"] = True
-    rpse["prediction"] = prediction
-    rpse["score"] = score
+    rpse["prediction"] = output["prediction"]
+    rpse["score"] = output["score"]
     rpse["image_file_name"] = new_filename
+    rpse["stage"] = output["stage"]
+    if top_k is not None:
+        rpse["top_k"] = [
+            {"prediction": label, "score": p} for label, p in output["top"]
+        ]
 
     return PredictResponse(**rpse)
+
+
+@router.get("/cache/stats", response_model=CacheStats)
+async def get_cache_stats(current_user=Depends(get_current_user)):
+    return await cache_stats()
+
+
+@router.get("/cascade/stats", response_model=CascadeStats)
+async def get_cascade_stats(current_user=Depends(get_current_user)):
+    return await cascade_stats()
+
+
+@router.get("/edge/stats", response_model=EdgeStats)
+async def get_edge_stats(current_user=Depends(get_current_user)):
+    return await edge_stats()
+
+
+@router.get("/storage/stats", response_model=StorageStats)
+async def get_storage_stats(current_user=Depends(get_current_user)):
+    return await storage_stats()
@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
@@ -5,8 +7,56 @@ class PredictRequest(BaseModel):
     file: str
 
 
+class TopPrediction(BaseModel):
+    prediction: str
+    score: float
+
+
 class PredictResponse(BaseModel):
     success: bool
     prediction: str
     score: float
     image_file_name: str
+    # Most likely classes first, only when the request asked for top_k
+    top_k: Optional[List[TopPrediction]] = None
+    # Model which answered, the cheap one or ResNet50 when the cascade is on
+    stage: Optional[str] = None
+
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+    hit_rate: float
+
+
+class CascadeStats(BaseModel):
+    first_stage: int
+    escalated: int
+    escalation_rate: float
+    first_stage_seconds: float
+    second_stage_seconds: float
+    latency_saved_seconds: float
+
+
+class EdgeStats(BaseModel):
+    images: int
+    rejected: int
+    bytes_in: int
+    bytes_out: int
+    bytes_saved_per_image: int
+    seconds_per_image: float
+    decode_seconds_saved_per_image: float
+
+
+class StorageStats(BaseModel):
+    files: int
+    bytes: int
+    pinned: int
+    # 0 when there is no limit
+    max_files: int
+    max_bytes: int
+    eviction: str
+    evicted: int
+    evicted_bytes: int
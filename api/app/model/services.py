@@ -1,61 +1,346 @@
+import contextlib
 import json
+import os
 import time
 from uuid import uuid4
 
-import redis
+import redis.asyncio as redis
 
-from .. import settings
+from .. import settings, storage
+from . import cache, transport
 
-# Connect to Redis
-db = redis.Redis(
-    host=settings.REDIS_IP, port=settings.REDIS_PORT, db=settings.REDIS_DB_ID
-)
+# Redis client sharing one connection pool, created on app startup
+db = None
 
 
-async def model_predict(image_name):
+def connect():
+    """
+    Creates the Redis client used by the model service. It's called once
+    on app startup so every request shares the same connection pool.
+    """
+    global db
+
+    pool = redis.BlockingConnectionPool(
+        host=settings.REDIS_IP,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB_ID,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+    )
+    db = redis.Redis(connection_pool=pool)
+
+
+async def disconnect():
+    """
+    Closes the Redis client and every connection in its pool, called on
+    app shutdown.
+    """
+    global db
+
+    if db is not None:
+        await db.close()
+        await db.connection_pool.disconnect()
+        db = None
+
+
+async def model_predict(image_name, top_k=1):
     print(f"Processing image {image_name}...")
     """
     Receives an image name and queues the job into Redis.
-    Will loop until getting the answer from our ML service.
+    Will wait until getting the answer from our ML service. Predictions are
+    cached by image content hash, so known images are answered right away,
+    and concurrent requests for the same image share a single job.
 
     Parameters
     ----------
     image_name : str
-        Name for the image uploaded by the user.
+        Key of the image uploaded by the user in the upload store (see
+        storage.relative_path()).
+    top_k : int
+        Number of most likely classes to return, up to `settings.TOP_K`.
+
+    Returns
+    -------
+    dict
+        Model predicted class ("prediction") and the corresponding
+        confidence score ("score"), the `top_k` most likely classes and
+        their scores ("top"), most likely first, and the model which
+        answered ("stage").
+
+    Raises
+    ------
+    TimeoutError
+        If the ML service didn't answer within `settings.API_TIMEOUT` seconds.
+    ValueError
+        If the ML service couldn't load the image.
+    """
+    # Images are named after their content hash
+    file_hash = os.path.splitext(os.path.basename(image_name))[0]
+    inflight_key = f"{settings.INFLIGHT_PREFIX}:{file_hash}"
+    miss_counted = False
+
+    async with contextlib.AsyncExitStack() as payload:
+        while True:
+            # Reuse the prediction if the same image was already classified
+            cached = await cache.lookup(db, file_hash)
+            if cached is not None:
+                return select_top(cached, top_k)
+
+            # Assign an unique ID for this job and claim the image, only the
+            # first request (from any API process) gets to queue a job for it
+            job_id = str(uuid4())
+            owner = await db.set(inflight_key, job_id, nx=True, ex=settings.API_TIMEOUT)
+            if owner:
+                # Create a dict with the job data we will send through Redis, the
+                # time it was queued tells the ML service how long jobs wait
+                job_data = {"id": job_id, "image_name": image_name, "time": time.time()}
+
+                # Send the image along unless the ML service reads it from the
+                # shared folder, kept until the results arrive
+                await payload.enter_async_context(
+                    transport.attach(job_data, image_name)
+                )
+
+                # Send the job to the model service using Redis
+                async with db.pipeline(transaction=False) as pipe:
+                    pipe.lpush(settings.REDIS_QUEUE, json.dumps(job_data))
+                    if not miss_counted:
+                        cache.count_miss(pipe)
+                    await pipe.execute()
+                break
+
+            # The same image is already being processed, wait for that job.
+            # If it finished in the meantime its prediction is in the cache.
+            inflight_job_id = await db.get(inflight_key)
+            if inflight_job_id is not None:
+                job_id = inflight_job_id.decode("utf-8")
+                if await join_job(inflight_key, job_id, count_miss=not miss_counted):
+                    break
+                miss_counted = True
+
+        # Wait for the ML service to push the results, or the request owning
+        # the job to pass them on (on their own list, so only the owner gets
+        # them from the ML service). BRPOP blocks until they arrive so there
+        # is no need to poll. Awaiting it hands the event loop back to other
+        # requests in the meantime.
+        results_key = job_id if owner else handoff_key(job_id)
+        output = await db.brpop(results_key, timeout=settings.API_TIMEOUT)
+        if output is None:
+            raise TimeoutError(f"No results for job {job_id}")
+
+    result = json.loads(output[1].decode("utf-8"))
+
+    if owner:
+        # Cache before releasing the image so late requests find the result,
+        # the ML service couldn't load the image if there is an error
+        if "error" not in result:
+            await cache.store(db, file_hash, result)
+        await hand_off(inflight_key, job_id, output[1])
+
+    if "error" in result:
+        raise ValueError(result["error"])
+
+    return select_top(result, top_k)
+
+
+def waiters_key(job_id):
+    """
+    Redis key counting the requests waiting on another request's job.
+    """
+    return f"{job_id}:waiters"
+
+
+def handoff_key(job_id):
+    """
+    Redis list the job owner pushes the results to for those requests.
+    """
+    return f"{job_id}:handoff"
+
+
+async def join_job(inflight_key, job_id, count_miss=True):
+    """
+    Registers a request as waiting for the results of the job another
+    request queued for the same image. Atomic with hand_off(): either the
+    job owner counts this request and pushes it a copy of the results, or
+    the job was already done.
+
+    Parameters
+    ----------
+    inflight_key : str
+        Key holding the ID of the job processing the image.
+    job_id : str
+        ID of that job, as read from `inflight_key`.
+    count_miss : bool
+        Count the request as a cache miss, once per request.
+
+    Returns
+    -------
+    bool
+        True if the results will be pushed to handoff_key() for this
+        request.
+    """
+    async with db.pipeline(transaction=True) as pipe:
+        pipe.incr(waiters_key(job_id))
+        pipe.expire(waiters_key(job_id), settings.API_TIMEOUT)
+        pipe.get(inflight_key)
+        if count_miss:
+            cache.count_miss(pipe)
+        current = (await pipe.execute())[2]
+
+    return current is not None and current.decode("utf-8") == job_id
+
+
+async def hand_off(inflight_key, job_id, output):
+    """
+    Releases an image once its job is done and pushes one copy of the
+    results per request waiting on it (see join_job()), so they all get
+    them at once. Nothing is pushed when nobody waits.
+
+    Parameters
+    ----------
+    inflight_key : str
+        Key holding the ID of the job processing the image.
+    job_id : str
+        ID of that job.
+    output : bytes
+        Results as sent by the ML service.
+    """
+    async with db.pipeline(transaction=True) as pipe:
+        pipe.delete(inflight_key)
+        pipe.get(waiters_key(job_id))
+        pipe.delete(waiters_key(job_id))
+        waiters = int((await pipe.execute())[1] or 0)
+
+    if waiters:
+        async with db.pipeline(transaction=False) as pipe:
+            pipe.lpush(handoff_key(job_id), *[output] * waiters)
+            pipe.expire(handoff_key(job_id), settings.RESULT_TTL)
+            await pipe.execute()
+
+
+def select_top(output, top_k):
+    """
+    Keeps the `top_k` most likely classes of an ML service output. The
+    service always sends its `settings.TOP_K` best ones, whatever was asked,
+    so one job and one cache entry serve every request for an image.
+    Outputs from before top-k and cascade support lack those fields.
+    """
+    top = output.get("top", [[output["prediction"], output["score"]]])
+    return {
+        "prediction": output["prediction"],
+        "score": output["score"],
+        "top": [tuple(pred) for pred in top[:top_k]],
+        "stage": output.get("stage"),
+    }
+
+
+async def cache_stats():
+    """
+    Returns the prediction cache usage counters.
 
     Returns
     -------
-    prediction, score : tuple(str, float)
-        Model predicted class as a string and the corresponding confidence
-        score as a number.
+    dict
+        Number of hits, misses, cached entries and the hit rate.
     """
-    prediction = None
-    score = None
+    return await cache.stats(db)
 
-    # Assign an unique ID for this job and add it to the queue.
-    job_id = str(uuid4())
 
-    # Create a dict with the job data we will send through Redis
-    job_data = {"id": job_id, "image_name": image_name}
+async def cascade_stats():
+    """
+    Returns how many images the ML service cascade answered with its cheap
+    first stage and how many it escalated to ResNet50.
 
-    # Send the job to the model service using Redis
-    db.lpush(settings.REDIS_QUEUE, json.dumps(job_data))
+    The time saved is an estimate: the images answered by the first stage
+    times the average ResNet50 time per escalated image, minus the time
+    spent running the first stage on every image.
 
-    # Loop until we received the response from our ML model
-    while True:
-        # Attempt to get model predictions using job_id
-        output = db.get(job_id)
+    Returns
+    -------
+    dict
+        Answered and escalated images, escalation rate, time spent in each
+        stage and time saved, in seconds.
+    """
+    first, second = settings.CASCADE_FIRST_STAGE, settings.CASCADE_SECOND_STAGE
+    metrics = {
+        key.decode("utf-8"): float(value)
+        for key, value in (await db.hgetall(settings.CASCADE_METRICS)).items()
+    }
+
+    answered = int(metrics.get(f"answered:{first}", 0))
+    escalated = int(metrics.get(f"answered:{second}", 0))
+    first_seconds = metrics.get(f"seconds:{first}", 0.0)
+    second_seconds = metrics.get(f"seconds:{second}", 0.0)
+
+    saved = 0.0
+    if escalated:
+        saved = answered * second_seconds / escalated - first_seconds
+
+    total = answered + escalated
+    return {
+        "first_stage": answered,
+        "escalated": escalated,
+        "escalation_rate": round(escalated / total, 4) if total else 0.0,
+        "first_stage_seconds": round(first_seconds, 3),
+        "second_stage_seconds": round(second_seconds, 3),
+        "latency_saved_seconds": round(saved, 3),
+    }
+
+
+async def record_edge(counts):
+    """
+    Adds the counts of one request to the edge preprocessing metrics, e.g.
+    the stats returned by preprocess.canonicalize() or {"rejected": 1}.
+    """
+    async with db.pipeline(transaction=False) as pipe:
+        for key, value in counts.items():
+            pipe.hincrbyfloat(settings.EDGE_METRICS, key, value)
+        await pipe.execute()
+
+
+async def edge_stats():
+    """
+    Returns how many uploads the edge preprocessing stage converted or
+    rejected, and what it saved per converted image.
+
+    Returns
+    -------
+    dict
+        Converted and rejected images, bytes received and stored, bytes
+        saved per image, time spent converting and ML service decode time
+        saved per image, in seconds.
+    """
+    metrics = {
+        key.decode("utf-8"): float(value)
+        for key, value in (await db.hgetall(settings.EDGE_METRICS)).items()
+    }
 
-        # Check if the text was correctly processed by the ML model
-        if output is not None:
-            output = json.loads(output.decode("utf-8"))
-            prediction = output["prediction"]
-            score = output["score"]
+    images = int(metrics.get("images", 0))
+    bytes_in = int(metrics.get("bytes_in", 0))
+    bytes_out = int(metrics.get("bytes_out", 0))
+    per_image = 1 / images if images else 0.0
+    return {
+        "images": images,
+        "rejected": int(metrics.get("rejected", 0)),
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "bytes_saved_per_image": round((bytes_in - bytes_out) * per_image),
+        "seconds_per_image": round(metrics.get("seconds", 0.0) * per_image, 6),
+        "decode_seconds_saved_per_image": round(
+            metrics.get("decode_seconds_saved", 0.0) * per_image, 6
+        ),
+    }
 
-            db.delete(job_id)
-            break
 
-        # Sleep some time waiting for model results
-        time.sleep(settings.API_SLEEP)
+async def record_upload(filename):
+    """
+    Records a use of an image in the upload store, deleting the least used
+    images if that took the store over budget.
+    """
+    await storage.record(db, filename)
+
 
-    return prediction, score
+async def storage_stats():
+    """
+    Returns the upload store usage, see storage.stats().
+    """
+    return await storage.stats(db)
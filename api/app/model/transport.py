@@ -0,0 +1,72 @@
+import base64
+import contextlib
+from multiprocessing import shared_memory
+
+from fastapi.concurrency import run_in_threadpool
+
+from .. import settings, storage
+
+
+def read_file(key):
+    with storage.objects.open(key) as f:
+        return f.read()
+
+
+def copy_to_shared_memory(key, size):
+    """
+    Create a POSIX shared memory block holding the content of a stored
+    image, read straight into it.
+    """
+    block = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        with storage.objects.open(key) as f:
+            f.readinto(block.buf[:size])
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    return block
+
+
+@contextlib.asynccontextmanager
+async def attach(job_data, key):
+    """
+    Add the image to a job, the way `settings.JOB_TRANSPORT` says the ML
+    service gets it:
+
+    - "shared_fs": nothing is added, the ML service reads the image from
+      the upload store both services share (see object_store.py).
+    - "inband": the image bytes, base64 encoded, under "image". Images over
+      `settings.JOB_INBAND_MAX_BYTES` go through the shared folder instead.
+    - "shm": the name and size of a POSIX shared memory block holding the
+      image bytes, under "shm". The ML service must run on the same host,
+      in the same IPC namespace.
+
+    Whatever the job points to stays allocated until the context exits,
+    i.e. once the results arrived.
+
+    Parameters
+    ----------
+    job_data : dict
+        Job about to be queued, updated in place.
+    key : str
+        Key of the image in the upload store.
+    """
+    size = 0
+    if settings.JOB_TRANSPORT in ("inband", "shm"):
+        size = await run_in_threadpool(storage.objects.size, key)
+
+    if settings.JOB_TRANSPORT == "inband" and 0 < size <= settings.JOB_INBAND_MAX_BYTES:
+        content = await run_in_threadpool(read_file, key)
+        job_data["image"] = base64.b64encode(content).decode("ascii")
+        yield
+    elif settings.JOB_TRANSPORT == "shm" and size > 0:
+        block = await run_in_threadpool(copy_to_shared_memory, key, size)
+        job_data["shm"] = {"name": block.name, "size": size}
+        try:
+            yield
+        finally:
+            block.close()
+            block.unlink()
+    else:
+        yield
@@ -0,0 +1,330 @@
+"""
+Backends holding the bytes of the uploaded images, chosen by
+`settings.STORAGE_BACKEND`:
+
+- "local": files in `settings.UPLOAD_FOLDER`, shared with the ML service
+  through a volume, so both must run on the same host.
+- "s3": objects in an S3-compatible bucket, so the API and the ML service
+  can run on any number of hosts. Large images are uploaded in parts and
+  reads are ranged GETs, only the bytes actually read are transferred.
+
+Objects are named by keys relative to the store root, see
+storage.relative_path(). Every method blocks, the API runs them in the
+threadpool.
+"""
+import io
+import os
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app import settings
+
+
+class ObjectStore:
+    """
+    Where the upload store keeps images.
+    """
+
+    def put(self, tmp_path, key):
+        """
+        Store a complete local file under `key`, readers see either no
+        object or the whole of it. The file is deleted either way, without
+        uploading it if the store already has the object.
+
+        Parameters
+        ----------
+        tmp_path : str
+            File to store, in `settings.UPLOAD_FOLDER`.
+        key : str
+            Object key.
+
+        Returns
+        -------
+        bool
+            True if the object is new.
+        """
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def size(self, key):
+        """
+        Size of an object in bytes.
+
+        Raises
+        ------
+        FileNotFoundError
+            If there is no such object.
+        """
+        raise NotImplementedError
+
+    def open(self, key):
+        """
+        Open an object for reading.
+
+        Returns
+        -------
+        file object
+            Seekable binary file.
+
+        Raises
+        ------
+        OSError
+            If the object can't be read, FileNotFoundError if there is no
+            such object, on open or on the first read.
+        """
+        raise NotImplementedError
+
+    def remove(self, key):
+        """
+        Delete an object unless it's already gone.
+        """
+        raise NotImplementedError
+
+    def keys(self):
+        """
+        Iterate over the keys of every stored object.
+        """
+        raise NotImplementedError
+
+
+class LocalObjectStore(ObjectStore):
+    """
+    Images stored as files under `settings.UPLOAD_FOLDER`.
+    """
+
+    def path(self, key):
+        return os.path.join(settings.UPLOAD_FOLDER, key)
+
+    def put(self, tmp_path, key):
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Same filesystem, the rename is atomic
+        os.replace(tmp_path, path)
+        return True
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self):
+        for folder, _, filenames in os.walk(settings.UPLOAD_FOLDER):
+            for filename in filenames:
+                # Uploads being received
+                if not filename.endswith(".part"):
+                    path = os.path.join(folder, filename)
+                    yield os.path.relpath(path, settings.UPLOAD_FOLDER)
+
+
+# Same class as in model/object_store.py, both services are built from
+# their own folder. Change both, tests/test_object_store.py checks they match.
+class S3Reader(io.RawIOBase):
+    """
+    Seekable binary file over an S3 object, every read is a ranged GET of
+    the bytes asked for. Buffered (see S3ObjectStore.open()), the many
+    small reads of e.g. Pillow parsing the header share a single request.
+    Errors are raised as OSError, like reading a local file.
+    """
+
+    def __init__(self, client, bucket, key):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.position = 0
+        # Learnt from the first response
+        self.length = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            if self.length is None:
+                self.length = self.request("head_object")["ContentLength"]
+            offset += self.length
+        self.position = offset
+        return offset
+
+    def request(self, operation, **kwargs):
+        try:
+            return getattr(self.client, operation)(
+                Bucket=self.bucket, Key=self.key, **kwargs
+            )
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(f"No object {self.key}") from e
+            # The range starts past the end
+            if code == "InvalidRange":
+                return None
+            raise OSError(f"Could not read {self.key}: {e}") from e
+        except BotoCoreError as e:
+            raise OSError(f"Could not read {self.key}: {e}") from e
+
+    def read_range(self, last=""):
+        """
+        GET the bytes from the current position to `last` included, to the
+        end by default.
+        """
+        if self.length is not None and self.position >= self.length:
+            return b""
+        response = self.request("get_object", Range=f"bytes={self.position}-{last}")
+        if response is None:
+            return b""
+
+        self.length = int(response["ContentRange"].rsplit("/", 1)[1])
+        data = response["Body"].read()
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        if not len(buffer):
+            return 0
+        data = self.read_range(self.position + len(buffer) - 1)
+        buffer[: len(data)] = data
+        return len(data)
+
+    def readall(self):
+        # A single request, not one per buffer
+        return self.read_range()
+
+
+class S3ObjectStore(ObjectStore):
+    """
+    Images stored in an S3-compatible bucket.
+
+    Parameters
+    ----------
+    bucket : str
+        Bucket name, it must exist.
+    endpoint_url : str
+        URL of the S3-compatible service, None for AWS.
+    """
+
+    def __init__(
+        self, bucket=settings.S3_BUCKET, endpoint_url=settings.S3_ENDPOINT_URL
+    ):
+        self.bucket = bucket
+        # Credentials are read the usual boto3 way, e.g. AWS_ACCESS_KEY_ID
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=settings.S3_REGION,
+            config=Config(
+                max_pool_connections=settings.S3_MAX_CONNECTIONS,
+                s3={"addressing_style": settings.S3_ADDRESSING_STYLE},
+            ),
+        )
+
+    def put(self, tmp_path, key):
+        if self.exists(key):
+            os.remove(tmp_path)
+            return False
+
+        with open(tmp_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size <= settings.S3_PART_SIZE:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=f)
+            else:
+                self.put_multipart(f, key)
+        os.remove(tmp_path)
+        return True
+
+    def put_multipart(self, f, key):
+        """
+        Upload a file in parts of `settings.S3_PART_SIZE` bytes, so only
+        one part is in memory at a time. The object only appears once every
+        part arrived.
+        """
+        upload = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)
+        parts = []
+        try:
+            while chunk := f.read(settings.S3_PART_SIZE):
+                response = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload["UploadId"],
+                    PartNumber=len(parts) + 1,
+                    Body=chunk,
+                )
+                parts.append({"ETag": response["ETag"], "PartNumber": len(parts) + 1})
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload["UploadId"],
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            # Stored parts are billed until the upload is aborted
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload["UploadId"]
+            )
+            raise
+
+    def exists(self, key):
+        try:
+            self.size(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, key):
+        reader = S3Reader(self.client, self.bucket, key)
+        return reader.request("head_object")["ContentLength"]
+
+    def open(self, key):
+        return io.BufferedReader(
+            S3Reader(self.client, self.bucket, key),
+            buffer_size=settings.S3_READ_SIZE,
+        )
+
+    def remove(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def keys(self):
+        pages = self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket
+        )
+        for page in pages:
+            for item in page.get("Contents", []):
+                yield item["Key"]
+
+
+def load_object_store(name=settings.STORAGE_BACKEND):
+    """
+    Build the object store called `name`, "local" or "s3".
+
+    Returns
+    -------
+    store : ObjectStore
+    """
+    if name == "local":
+        return LocalObjectStore()
+    if name == "s3":
+        return S3ObjectStore()
+    raise ValueError(f"Unknown storage backend {name!r}")
@@ -11,20 +11,104 @@ API_DEBUG = True
 # We will store images uploaded by the user on this folder
 UPLOAD_FOLDER = "uploads/"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Images are stored in subfolders named after the first characters of their
+# hash, this many levels of 2 characters (see storage.py)
+STORE_SHARD_LEVELS = 2
+# Budget of the upload store, images are deleted over it (0 for no limit).
+# Images users gave feedback on are never deleted.
+STORE_MAX_BYTES = int(os.getenv("STORE_MAX_BYTES", 0))
+STORE_MAX_FILES = int(os.getenv("STORE_MAX_FILES", 0))
+# Images deleted first: "lru" least recently used, "lfu" least used
+STORE_EVICTION = os.getenv("STORE_EVICTION", "lru")
+# Images looked at per Redis round trip while evicting
+STORE_EVICT_BATCH = 100
+# Prefix for the Redis keys indexing the stored images
+STORE_PREFIX = "upload_store"
+# Where stored images live (see object_store.py): "local" in UPLOAD_FOLDER,
+# shared with the ML service through a volume, or "s3" in an S3-compatible
+# bucket, UPLOAD_FOLDER then only holds the uploads being received
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+S3_BUCKET = os.getenv("S3_BUCKET", "uploads")
+# None for AWS, else the URL of the S3-compatible service
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+# "path" (http://host/bucket/key) works with every S3-compatible service
+S3_ADDRESSING_STYLE = os.getenv("S3_ADDRESSING_STYLE", "path")
+# Images over this size are uploaded in parts of this size, 5 MiB at least
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", 8 * 1024 * 1024))
+# Bytes fetched by each ranged GET, whole canonical images fit in one
+S3_READ_SIZE = int(os.getenv("S3_READ_SIZE", 1024 * 1024))
+# Connections kept open to the service, shared by the threadpool
+S3_MAX_CONNECTIONS = int(os.getenv("S3_MAX_CONNECTIONS", 32))
+# Uploads are read, hashed and written in chunks of this many bytes, so
+# memory use doesn't grow with the file size
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# hashlib algorithm naming uploaded images after their content. "sha256" is
+# faster than "md5" on CPUs with SHA extensions. Stored images and cached
+# predictions are keyed by it, changing it starts both afresh.
+UPLOAD_HASH = os.getenv("UPLOAD_HASH", "md5")
 
 # REDIS settings
 
 # Queue name
 REDIS_QUEUE = "service_queue"
 # Port
-REDIS_PORT = 6379
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 # DB Id
 REDIS_DB_ID = 0
 # Host IP
 REDIS_IP = os.getenv("REDIS_IP", "redis")
-# Sleep parameters which manages the
-# interval between requests to our redis queue
-API_SLEEP = 0.05
+# Maximum number of connections in the pool shared by the API requests,
+# each in-flight prediction holds one while waiting for its results
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 1000))
+# Maximum time (in seconds) to wait for the model results
+API_TIMEOUT = int(os.getenv("API_TIMEOUT", 30))
+# Time (in seconds) a result is kept in Redis if nobody picks it up
+RESULT_TTL = int(os.getenv("RESULT_TTL", 60))
+# Maximum number of most likely classes a request can ask for, the ML
+# service returns this many with every prediction (its TOP_K setting)
+TOP_K = int(os.getenv("TOP_K", 5))
+# Images answered by and time spent in each model of the ML service
+# cascade, written by the workers
+CASCADE_METRICS = "service_queue:cascade"
+CASCADE_FIRST_STAGE = "mobilenet_v2"
+CASCADE_SECOND_STAGE = "resnet50"
+# How jobs carry their image to the ML service: "shared_fs" (the image name,
+# read from the uploads folder both services mount), "inband" (the image
+# bytes in the Redis job, up to JOB_INBAND_MAX_BYTES, larger images go
+# through the shared folder) or "shm" (a POSIX shared memory block, the ML
+# service must run on the same host and IPC namespace)
+JOB_TRANSPORT = os.getenv("JOB_TRANSPORT", "shared_fs")
+JOB_INBAND_MAX_BYTES = int(os.getenv("JOB_INBAND_MAX_BYTES", 256 * 1024))
+# Prefix for the keys marking an image as being processed, so concurrent
+# requests for the same image wait on a single job
+INFLIGHT_PREFIX = "inflight"
+
+# Edge preprocessing settings
+
+# Check uploads are images from their content, not their extension, and
+# store a copy resized to the model input instead of the file sent
+EDGE_PREPROCESS = os.getenv("EDGE_PREPROCESS", "0") == "1"
+# Image formats accepted, as detected by Pillow
+EDGE_FORMATS = ["JPEG", "PNG", "GIF"]
+# Images with more pixels are rejected before being decoded, same limit as
+# the ML service
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 100_000_000))
+# Model input size, copies are resized to it the way the ML service does
+EDGE_IMAGE_SIZE = 224
+# Images processed or rejected, bytes and time saved by the edge stage
+EDGE_METRICS = "edge_preprocess"
+
+# Prediction cache settings
+
+# Prefix for every cache key in Redis
+CACHE_PREFIX = "prediction_cache"
+# Version of the model answering predictions, part of the cache key
+MODEL_VERSION = os.getenv("MODEL_VERSION", "resnet50-imagenet")
+# Time (in seconds) a prediction stays cached since it was last used
+CACHE_TTL = int(os.getenv("CACHE_TTL", 24 * 60 * 60))
+# Maximum number of cached predictions, least recently used are evicted
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 100_000))
 
 # Database settings
 DATABASE_USERNAME = os.getenv("POSTGRES_USER")
@@ -0,0 +1,360 @@
+"""
+Content-addressed store for the uploaded images.
+
+Images are named after their content hash and stored under keys
+starting with the first characters of the hash (e.g.
+"0a/7c/0a7c757a....jpeg"), so no folder grows large enough to slow down
+lookups. Where the bytes live, the shared upload folder or an S3 bucket,
+depends on `settings.STORAGE_BACKEND` (see object_store.py). The ML
+service gets the key in the job and reads it from the same backend.
+
+Redis keeps the size, last access time and number of uses of every image.
+Once the store is over `settings.STORE_MAX_BYTES` or
+`settings.STORE_MAX_FILES`, the least recently (LRU) or least frequently
+(LFU) used images are deleted. Images users gave feedback on are pinned,
+never deleted.
+
+💡 NOTE Run with: python3 -m app.storage
+    Moves images stored before in the upload folder into the store, indexes
+    every stored image and pins the ones referenced by feedback.
+"""
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from app import object_store, settings
+
+SIZES_KEY = f"{settings.STORE_PREFIX}:sizes"
+# Sorted sets of the images, by last access time and by number of uses
+ATIME_KEY = f"{settings.STORE_PREFIX}:atime"
+USES_KEY = f"{settings.STORE_PREFIX}:uses"
+PINNED_KEY = f"{settings.STORE_PREFIX}:pinned"
+BYTES_KEY = f"{settings.STORE_PREFIX}:bytes"
+EVICTED_KEY = f"{settings.STORE_PREFIX}:evicted"
+EVICTED_BYTES_KEY = f"{settings.STORE_PREFIX}:evicted_bytes"
+
+objects = object_store.load_object_store()
+
+
+def relative_path(filename):
+    """
+    Path of an image relative to the upload folder, e.g. "0a/7c/0a7c...".
+
+    Parameters
+    ----------
+    filename : str
+        Image name, its content hash and extension.
+
+    Returns
+    -------
+    str
+        Path with `settings.STORE_SHARD_LEVELS` subfolders of two
+        characters each.
+    """
+    shards = [filename[2 * i : 2 * i + 2] for i in range(settings.STORE_SHARD_LEVELS)]
+    return os.path.join(*shards, filename)
+
+
+def put(tmp_path, filename):
+    """
+    Move a complete local file into the store under `filename`, readers
+    see either no image or the whole image. If the store already has it,
+    the file is deleted instead. Blocks, see object_store.py.
+
+    Parameters
+    ----------
+    tmp_path : str
+        File to store, in the upload folder.
+    filename : str
+        Image name, its content hash and extension.
+
+    Returns
+    -------
+    bool
+        True if the image is new.
+    """
+    return objects.put(tmp_path, relative_path(filename))
+
+
+def exists(filename):
+    return objects.exists(relative_path(filename))
+
+
+def remove(filename):
+    """
+    Delete an image from the store unless it's already gone.
+    """
+    objects.remove(relative_path(filename))
+
+
+async def record(db, filename):
+    """
+    Record a use of a stored image, indexing it if it's new. Evicts images
+    when the store went over budget.
+
+    Parameters
+    ----------
+    db : redis.asyncio.Redis
+        Redis client.
+    filename : str
+        Image name, its content hash and extension.
+    """
+    async with db.pipeline(transaction=False) as pipe:
+        pipe.zadd(ATIME_KEY, {filename: time.time()})
+        pipe.zincrby(USES_KEY, 1, filename)
+        pipe.hexists(SIZES_KEY, filename)
+        _, _, indexed = await pipe.execute()
+    if indexed:
+        return
+
+    # Only new images change the total size, and only they need a look at
+    # the backend (a HEAD request with S3)
+    size = await run_in_threadpool(objects.size, relative_path(filename))
+    async with db.pipeline(transaction=False) as pipe:
+        pipe.hsetnx(SIZES_KEY, filename, size)
+        pipe.hlen(SIZES_KEY)
+        new, n_files = await pipe.execute()
+
+    # Another API process may have indexed it meanwhile
+    if new:
+        n_bytes = await db.incrby(BYTES_KEY, size)
+        over_bytes = settings.STORE_MAX_BYTES and n_bytes > settings.STORE_MAX_BYTES
+        over_files = settings.STORE_MAX_FILES and n_files > settings.STORE_MAX_FILES
+        if over_bytes or over_files:
+            await evict(db)
+
+
+async def evict(db):
+    """
+    Delete images until the store is within `settings.STORE_MAX_BYTES` and
+    `settings.STORE_MAX_FILES`, least recently used first, or least used
+    with `settings.STORE_EVICTION` = "lfu". Pinned images and images used
+    in the last `settings.API_TIMEOUT` seconds, which jobs may still need,
+    are kept.
+
+    Parameters
+    ----------
+    db : redis.asyncio.Redis
+        Redis client.
+
+    Returns
+    -------
+    int
+        Number of images deleted.
+    """
+    order_key = USES_KEY if settings.STORE_EVICTION == "lfu" else ATIME_KEY
+    recent = time.time() - settings.API_TIMEOUT
+    evicted = 0
+    start = 0
+
+    while True:
+        async with db.pipeline(transaction=False) as pipe:
+            pipe.get(BYTES_KEY)
+            pipe.hlen(SIZES_KEY)
+            pipe.zrange(order_key, start, start + settings.STORE_EVICT_BATCH - 1)
+            n_bytes, n_files, candidates = await pipe.execute()
+        n_bytes = int(n_bytes or 0)
+        if not candidates:
+            break
+
+        excess_bytes = n_bytes - settings.STORE_MAX_BYTES
+        excess_files = n_files - settings.STORE_MAX_FILES
+        if not (
+            (settings.STORE_MAX_BYTES and excess_bytes > 0)
+            or (settings.STORE_MAX_FILES and excess_files > 0)
+        ):
+            break
+
+        candidates = [name.decode("utf-8") for name in candidates]
+        async with db.pipeline(transaction=False) as pipe:
+            for name in candidates:
+                pipe.sismember(PINNED_KEY, name)
+                pipe.zscore(ATIME_KEY, name)
+                pipe.hget(SIZES_KEY, name)
+            replies = await pipe.execute()
+
+        # Pick just enough victims among this batch
+        victims = []
+        for i, name in enumerate(candidates):
+            pinned, atime, size = replies[3 * i : 3 * i + 3]
+            if pinned or (atime or 0) > recent:
+                continue
+            victims.append((name, int(size or 0)))
+            excess_bytes -= int(size or 0)
+            excess_files -= 1
+            if not (
+                (settings.STORE_MAX_BYTES and excess_bytes > 0)
+                or (settings.STORE_MAX_FILES and excess_files > 0)
+            ):
+                break
+        # Kept images stay in the index, look further next time
+        start += len(candidates) - len(victims)
+
+        if victims:
+            evicted += await delete(db, victims)
+        elif len(candidates) < settings.STORE_EVICT_BATCH:
+            break
+
+    return evicted
+
+
+async def delete(db, victims):
+    """
+    Remove images from the index and the disk. Images another API process
+    removed concurrently are only counted once.
+
+    Parameters
+    ----------
+    db : redis.asyncio.Redis
+        Redis client.
+    victims : list(tuple(str, int))
+        Name and size of the images.
+
+    Returns
+    -------
+    int
+        Number of images this call removed.
+    """
+    async with db.pipeline(transaction=False) as pipe:
+        for name, _ in victims:
+            pipe.hdel(SIZES_KEY, name)
+            pipe.zrem(ATIME_KEY, name)
+            pipe.zrem(USES_KEY, name)
+        removed = (await pipe.execute())[::3]
+
+    victims = [victim for victim, was_indexed in zip(victims, removed) if was_indexed]
+    n_bytes = sum(size for _, size in victims)
+    async with db.pipeline(transaction=False) as pipe:
+        pipe.decrby(BYTES_KEY, n_bytes)
+        pipe.incrby(EVICTED_KEY, len(victims))
+        pipe.incrby(EVICTED_BYTES_KEY, n_bytes)
+        await pipe.execute()
+
+    for name, _ in victims:
+        await run_in_threadpool(remove, name)
+
+    return len(victims)
+
+
+async def pin(db, filename):
+    """
+    Keep an image forever, e.g. once a user gave feedback on it.
+    """
+    await db.sadd(PINNED_KEY, filename)
+
+
+async def stats(db):
+    """
+    Returns the upload store usage.
+
+    Parameters
+    ----------
+    db : redis.asyncio.Redis
+        Redis client.
+
+    Returns
+    -------
+    dict
+        Number of images and bytes stored, pinned images, budget (0 for no
+        limit) and images and bytes evicted so far.
+    """
+    async with db.pipeline(transaction=False) as pipe:
+        pipe.hlen(SIZES_KEY)
+        pipe.get(BYTES_KEY)
+        pipe.scard(PINNED_KEY)
+        pipe.get(EVICTED_KEY)
+        pipe.get(EVICTED_BYTES_KEY)
+        files, n_bytes, pinned, evicted, evicted_bytes = await pipe.execute()
+
+    return {
+        "files": files,
+        "bytes": int(n_bytes or 0),
+        "pinned": pinned,
+        "max_files": settings.STORE_MAX_FILES,
+        "max_bytes": settings.STORE_MAX_BYTES,
+        "eviction": settings.STORE_EVICTION,
+        "evicted": int(evicted or 0),
+        "evicted_bytes": int(evicted_bytes or 0),
+    }
+
+
+async def reindex(db, pinned):
+    """
+    Move images stored in the upload folder into the store, i.e. into their
+    subfolders for images stored before sharding, or into the bucket with
+    the "s3" backend, and index every stored image.
+
+    Parameters
+    ----------
+    db : redis.asyncio.Redis
+        Redis client.
+    pinned : iterable(str)
+        Names of the images to pin.
+
+    Returns
+    -------
+    int
+        Number of images indexed.
+    """
+    # List everything first, moved images would be walked again
+    stored = [
+        (folder, filename)
+        for folder, _, filenames in os.walk(settings.UPLOAD_FOLDER)
+        for filename in filenames
+    ]
+
+    for folder, filename in stored:
+        current = os.path.join(folder, filename)
+        # Leftovers of uploads interrupted midway
+        if filename.endswith(".part"):
+            os.remove(current)
+            continue
+
+        key = relative_path(filename)
+        in_place = isinstance(objects, object_store.LocalObjectStore) and (
+            os.path.normpath(current) == os.path.normpath(objects.path(key))
+        )
+        if not in_place:
+            await run_in_threadpool(put, current, filename)
+
+    indexed = 0
+    for key in await run_in_threadpool(list, objects.keys()):
+        await record(db, os.path.basename(key))
+        indexed += 1
+
+    for filename in pinned:
+        await pin(db, filename)
+
+    return indexed
+
+
+def main():
+    import asyncio
+
+    import redis.asyncio as redis
+    from app.db import SessionLocal
+    from app.feedback.models import Feedback
+
+    database = SessionLocal()
+    try:
+        pinned = [name for (name,) in database.query(Feedback.image_file_name)]
+    finally:
+        database.close()
+
+    async def run():
+        db = redis.Redis(
+            host=settings.REDIS_IP, port=settings.REDIS_PORT, db=settings.REDIS_DB_ID
+        )
+        try:
+            indexed = await reindex(db, pinned)
+            print(f"Indexed {indexed} images, pinned {len(pinned)}")
+            print(await stats(db))
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 import hashlib
 import os
+import tempfile
+
+from app import settings, storage
+from fastapi.concurrency import run_in_threadpool
 
 
 def allowed_file(filename):
@@ -26,34 +30,77 @@ def allowed_file(filename):
     )  # Alternatively use Path.suffix
 
 
-async def get_file_hash(file):
+async def spool_upload(file):
     """
-    Returns a new filename based on the file content using MD5 hashing.
-    It uses hashlib.md5() function from Python standard library to get
-    the hash.
+    Receives an uploaded file into a temporary file in the upload folder,
+    in a single pass: chunks are hashed and written as they are read, so
+    its name is known once it's complete. Hashing and writing run in the
+    threadpool, not on the event loop.
 
     Parameters
     ----------
-    file : werkzeug.datastructures.FileStorage
+    file : fastapi.UploadFile
         File sent by user.
 
     Returns
     -------
-    str
-        New filename based in md5 file hash.
+    tmp_path : str
+        The temporary file, to be moved into the upload store.
+    new_filename : str
+        New filename based in the file hash, computed with the
+        `settings.UPLOAD_HASH` algorithm (MD5 by default).
     """
-    # Read file content (byte string)
-    content = await file.read()
+    file_hash = hashlib.new(settings.UPLOAD_HASH)
+    out_file = await run_in_threadpool(
+        tempfile.NamedTemporaryFile,
+        dir=settings.UPLOAD_FOLDER,
+        suffix=".part",
+        delete=False,
+    )
 
-    # Generate MD5 hash from content
-    file_hash = hashlib.md5(  # Apply MD5 hash
-        content
-    ).hexdigest()  # hexdigest converts the result into a readable hex string
+    def write(chunk):
+        # hashlib releases the GIL on large chunks, other requests keep going
+        file_hash.update(chunk)
+        out_file.write(chunk)
 
-    # Get the file extension
-    _, ext = os.path.splitext(file.filename)
+    try:
+        with out_file:
+            while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+                await run_in_threadpool(write, chunk)
+    except BaseException:
+        os.remove(out_file.name)
+        raise
 
     # Reset file pointer to the beginning
     await file.seek(0)
 
-    return f"{file_hash}{ext}"
+    _, ext = os.path.splitext(file.filename)
+    return out_file.name, f"{file_hash.hexdigest()}{ext}"
+
+
+async def save_upload(file):
+    """
+    Stores an uploaded file in the upload store (see storage.py), named
+    after its content hash. The file is received once, see spool_upload(),
+    then moved into the store. If an image with the same content is already
+    stored, the new copy is discarded.
+
+    Parameters
+    ----------
+    file : fastapi.UploadFile
+        File sent by user.
+
+    Returns
+    -------
+    str
+        New filename based in the file hash, same as spool_upload().
+    """
+    tmp_path, new_filename = await spool_upload(file)
+    try:
+        await run_in_threadpool(storage.put, tmp_path, new_filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return new_filename
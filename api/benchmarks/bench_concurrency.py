@@ -0,0 +1,146 @@
+"""
+Concurrency benchmark for `app.model.services.model_predict`.
+
+Fires N concurrent predictions from a single event loop against a real
+Redis server while a stand-in worker thread answers every job after a fixed
+latency. It runs the same load twice: once with the asyncio client used by
+the API and once with the old synchronous client, which blocks the event
+loop on every call.
+
+Every request sends a different image, so each one is a real job in both
+modes: the prediction cache and the coalescing of requests for the same
+image don't get to answer any of them. A third run ("shared") sends the same
+new image with every request and reports how many of them the cache and the
+coalescing answered, apart from the cold path numbers.
+
+💡 NOTE Run with (Redis must be reachable at REDIS_IP):
+    python -m benchmarks.bench_concurrency --requests 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from uuid import uuid4
+
+import redis
+from app import settings
+from app.model import services
+
+
+def fake_worker(stop, latency, answered):
+    """
+    Answers every job in the queue after `latency` seconds, standing in
+    for the ML service, and appends their IDs to `answered`.
+    """
+    db = redis.Redis(
+        host=settings.REDIS_IP, port=settings.REDIS_PORT, db=settings.REDIS_DB_ID
+    )
+    while not stop.is_set():
+        job = db.brpop(settings.REDIS_QUEUE, timeout=1)
+        if job is None:
+            continue
+        job = json.loads(job[1].decode("utf-8"))
+        time.sleep(latency)
+        answered.append(job["id"])
+        db.lpush(job["id"], json.dumps({"prediction": "dog", "score": 1.0}))
+        db.expire(job["id"], 60)
+
+
+async def blocking_model_predict(db, image_name):
+    """
+    Previous `model_predict` behaviour: synchronous Redis calls made
+    straight from the coroutine.
+    """
+    job_id = str(uuid4())
+    db.lpush(settings.REDIS_QUEUE, json.dumps({"id": job_id, "image_name": image_name}))
+    output = json.loads(db.brpop(job_id, timeout=settings.API_TIMEOUT)[1])
+    return output["prediction"], output["score"]
+
+
+async def timed(predict, start):
+    # Latency is measured from the moment all requests were sent, like
+    # clients hitting the API at once would see it
+    await predict
+    return time.perf_counter() - start
+
+
+async def run(mode, n_requests, answered):
+    if mode == "blocking":
+        db = redis.Redis(
+            host=settings.REDIS_IP, port=settings.REDIS_PORT, db=settings.REDIS_DB_ID
+        )
+
+        def predict(image_name):
+            return blocking_model_predict(db, image_name)
+
+    else:
+        services.connect()
+        predict = services.model_predict
+        cache_before = await services.cache_stats()
+
+    # Images are cached and coalesced by their content hash, unique names
+    # make every request a real job
+    if mode == "shared":
+        image_names = [f"{uuid4().hex}.jpeg"] * n_requests
+    else:
+        image_names = [f"{uuid4().hex}.jpeg" for _ in range(n_requests)]
+    jobs_before = len(answered)
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(
+        *[timed(predict(image_name), start) for image_name in image_names]
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latencies)
+    result = {
+        "mode": mode,
+        "requests": n_requests,
+        "jobs": len(answered) - jobs_before,
+        "seconds": round(elapsed, 3),
+        "req/s": round(n_requests / elapsed, 1),
+        "p50 ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99 ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+    }
+
+    if mode != "blocking":
+        # Requests neither running a job nor answered by the cache waited
+        # for another request's job
+        cache_after = await services.cache_stats()
+        hits = cache_after["hits"] - cache_before["hits"]
+        result["cache hits"] = hits
+        result["hit rate"] = round(hits / n_requests, 4)
+        result["coalesced"] = n_requests - result["jobs"] - hits
+        await services.disconnect()
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    answered = []
+    workers = [
+        threading.Thread(
+            target=fake_worker, args=(stop, args.latency, answered), daemon=True
+        )
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        for mode in ("blocking", "async", "shared"):
+            print(asyncio.run(run(mode, args.requests, answered)))
+    finally:
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from app.auth import router as auth_router
 from app.feedback import router as feedback_router
 from app.model import router as model_router
+from app.model import services as model_services
 from app.user import router as user_router
 from fastapi import FastAPI
 
@@ -10,3 +11,13 @@ app.include_router(auth_router.router)
 app.include_router(model_router.router)
 app.include_router(user_router.router)
 app.include_router(feedback_router.router)
+
+
+@app.on_event("startup")
+async def startup():
+    model_services.connect()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await model_services.disconnect()
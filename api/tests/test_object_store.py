@@ -0,0 +1,191 @@
+import ast
+import importlib.util
+import os
+from unittest.mock import patch
+
+import pytest
+from app import object_store, settings
+
+# 💡 NOTE Run tests with: pytest tests/test_object_store.py -v
+
+STANDIN_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "stress_test",
+    "s3_standin.py",
+)
+MODEL_OBJECT_STORE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "model",
+    "object_store.py",
+)
+
+
+@pytest.fixture(scope="module")
+def s3_server():
+    # The S3 stand-in lives next to the Redis one, outside the API image
+    if not os.path.exists(STANDIN_PATH):
+        pytest.skip("S3 stand-in not available")
+    spec = importlib.util.spec_from_file_location("s3_standin", STANDIN_PATH)
+    s3_standin = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(s3_standin)
+
+    server = s3_standin.start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def folder(tmp_path):
+    with patch.object(settings, "UPLOAD_FOLDER", str(tmp_path)):
+        yield tmp_path
+
+
+@pytest.fixture
+def s3(s3_server, folder, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    objects = object_store.S3ObjectStore("uploads", s3_server.endpoint_url)
+    objects.client.create_bucket(Bucket="uploads")
+    s3_server.store.reset_stats()
+    yield objects
+    s3_server.store.buckets.clear()
+
+
+def class_definition(path, name):
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    node = next(
+        node
+        for node in tree.body
+        if isinstance(node, ast.ClassDef) and node.name == name
+    )
+    return ast.dump(node)
+
+
+def upload(folder, content):
+    path = folder / "upload.part"
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_local_put(folder):
+    objects = object_store.LocalObjectStore()
+    tmp = upload(folder, b"fake-image-data")
+
+    assert objects.put(tmp, "fa/ke/fakehash123.png")
+    assert not objects.put(upload(folder, b"fake-image-data"), "fa/ke/fakehash123.png")
+
+    assert not os.path.exists(tmp)
+    assert objects.size("fa/ke/fakehash123.png") == 15
+    with objects.open("fa/ke/fakehash123.png") as f:
+        assert f.read() == b"fake-image-data"
+    # Uploads being received aren't stored images
+    upload(folder, b"partial")
+    assert list(objects.keys()) == ["fa/ke/fakehash123.png"]
+
+
+def test_s3_put(s3, s3_server, folder):
+    tmp = upload(folder, b"fake-image-data")
+
+    assert s3.put(tmp, "fa/ke/fakehash123.png")
+
+    assert not os.path.exists(tmp)
+    assert s3.exists("fa/ke/fakehash123.png")
+    assert s3.size("fa/ke/fakehash123.png") == 15
+    with s3.open("fa/ke/fakehash123.png") as f:
+        assert f.read() == b"fake-image-data"
+    assert list(s3.keys()) == ["fa/ke/fakehash123.png"]
+    assert s3_server.store.calls["put_object"] == 1
+
+
+def test_s3_put_existing(s3, s3_server, folder):
+    s3.put(upload(folder, b"fake-image-data"), "fa/ke/fakehash123.png")
+    tmp = upload(folder, b"fake-image-data")
+
+    assert not s3.put(tmp, "fa/ke/fakehash123.png")
+
+    # Not uploaded again
+    assert not os.path.exists(tmp)
+    assert s3_server.store.calls["put_object"] == 1
+
+
+def test_s3_put_multipart(s3, s3_server, folder):
+    content = os.urandom(2500)
+
+    with patch.object(settings, "S3_PART_SIZE", 1000):
+        s3.put(upload(folder, content), "fa/ke/fakehash123.png")
+
+    assert s3_server.store.calls["upload_part"] == 3
+    assert s3_server.store.calls["put_object"] == 0
+    with s3.open("fa/ke/fakehash123.png") as f:
+        assert f.read() == content
+
+
+def test_s3_put_multipart_aborted(s3, s3_server, folder):
+    with patch.object(settings, "S3_PART_SIZE", 1000), patch.object(
+        s3.client, "complete_multipart_upload", side_effect=ConnectionError
+    ):
+        with pytest.raises(ConnectionError):
+            s3.put(upload(folder, os.urandom(2500)), "fa/ke/fakehash123.png")
+
+    assert s3_server.store.uploads == {}
+    assert not s3.exists("fa/ke/fakehash123.png")
+
+
+def test_s3_ranged_reads(s3, s3_server, folder):
+    content = os.urandom(5000)
+    s3.put(upload(folder, content), "fa/ke/fakehash123.png")
+    s3_server.store.reset_stats()
+
+    with patch.object(settings, "S3_READ_SIZE", 1024):
+        with s3.open("fa/ke/fakehash123.png") as f:
+            # Small reads share one request of S3_READ_SIZE bytes
+            assert f.read(10) == content[:10]
+            assert f.read(10) == content[10:20]
+            assert s3_server.store.calls["get_object"] == 1
+            assert s3_server.store.net_output == 1024
+
+            f.seek(4000)
+            assert f.read(100) == content[4000:4100]
+            assert f.seek(0, os.SEEK_END) == 5000
+            assert f.read() == b""
+
+
+def test_s3_missing(s3):
+    assert not s3.exists("fa/ke/fakehash123.png")
+    with pytest.raises(FileNotFoundError):
+        s3.size("fa/ke/fakehash123.png")
+    with pytest.raises(FileNotFoundError):
+        with s3.open("fa/ke/fakehash123.png") as f:
+            f.read()
+
+
+def test_s3_remove(s3, folder):
+    s3.put(upload(folder, b"fake-image-data"), "fa/ke/fakehash123.png")
+
+    s3.remove("fa/ke/fakehash123.png")
+    s3.remove("fa/ke/fakehash123.png")
+
+    assert list(s3.keys()) == []
+
+
+def test_s3_reader_matches_model_service():
+    # The ML service reads with its own copy of S3Reader, fixes go to both
+    if not os.path.exists(MODEL_OBJECT_STORE_PATH):
+        pytest.skip("ML service sources not available")
+
+    assert class_definition(object_store.__file__, "S3Reader") == class_definition(
+        MODEL_OBJECT_STORE_PATH, "S3Reader"
+    )
+
+
+def test_load_object_store():
+    assert isinstance(
+        object_store.load_object_store("local"), object_store.LocalObjectStore
+    )
+    with pytest.raises(ValueError):
+        object_store.load_object_store("ftp")
@@ -0,0 +1,106 @@
+import os
+import shutil
+from unittest.mock import patch
+
+import pytest
+from app import settings, storage
+from app.model import preprocess
+from PIL import Image
+
+# 💡 NOTE Run tests with: pytest tests/test_preprocess_model.py -v
+
+
+@pytest.fixture
+def store(tmp_path):
+    with patch.object(settings, "UPLOAD_FOLDER", str(tmp_path)):
+        yield tmp_path
+
+
+def stored_files(store):
+    return [path for path in store.rglob("*") if path.is_file()]
+
+
+@pytest.fixture
+def photo(store):
+    # Gradient so resampling differences would show, as received by
+    # utils.spool_upload()
+    img = Image.new("RGB", (1200, 900))
+    img.putdata(
+        [(x % 256, y % 256, (x + y) % 256) for y in range(900) for x in range(1200)]
+    )
+    img.save(store / "tmpupload.part", format="JPEG", quality=95)
+    return str(store / "tmpupload.part")
+
+
+def test_canonicalize(store, photo):
+    shutil.copy(photo, store / "original.jpg")
+
+    new_filename, stats = preprocess.canonicalize(photo, "fakehash123.jpg")
+
+    assert new_filename == "fakehash123.png"
+    stored = store / storage.relative_path(new_filename)
+    assert sorted(stored_files(store)) == sorted([store / "original.jpg", stored])
+    with Image.open(stored) as img:
+        assert img.format == "PNG"
+        assert img.size == (224, 224)
+        # The ML service gets the pixels it would get from the original
+        expected = preprocess.load_model_input(str(store / "original.jpg"))
+        assert img.convert("RGB").tobytes() == expected.tobytes()
+
+    assert stats["images"] == 1
+    assert stats["bytes_in"] == os.path.getsize(store / "original.jpg")
+    assert stats["bytes_out"] == os.path.getsize(stored)
+    assert stats["seconds"] > 0
+
+
+def test_canonicalize_already_converted(store, photo):
+    shutil.copy(photo, store / "again.part")
+    preprocess.canonicalize(photo, "fakehash123.jpg")
+    stored = store / storage.relative_path("fakehash123.png")
+    content = stored.read_bytes()
+
+    new_filename, stats = preprocess.canonicalize(
+        str(store / "again.part"), "fakehash123.jpg"
+    )
+
+    assert new_filename == "fakehash123.png"
+    assert stats is None
+    assert stored_files(store) == [stored]
+    assert stored.read_bytes() == content
+
+
+def test_canonicalize_canonical_upload(store):
+    Image.new("RGB", (224, 224)).save(store / "tmpupload.part", format="PNG")
+
+    new_filename, stats = preprocess.canonicalize(
+        str(store / "tmpupload.part"), "fakehash123.png"
+    )
+
+    # Stored as is
+    assert new_filename == "fakehash123.png"
+    assert stats is None
+    assert stored_files(store) == [store / storage.relative_path(new_filename)]
+
+
+def test_canonicalize_not_an_image(store):
+    (store / "tmpupload.part").write_bytes(b"%PDF-1.4 fake-image-data")
+
+    with pytest.raises(ValueError):
+        preprocess.canonicalize(str(store / "tmpupload.part"), "fakehash123.png")
+
+    assert stored_files(store) == []
+
+
+def test_canonicalize_unsupported_format(store):
+    Image.new("RGB", (300, 300)).save(store / "tmpupload.part", format="BMP")
+
+    with pytest.raises(ValueError, match="BMP images aren't supported"):
+        preprocess.canonicalize(str(store / "tmpupload.part"), "fakehash123.jpg")
+
+
+def test_canonicalize_too_many_pixels(store, photo):
+    with patch.object(preprocess.settings, "MAX_IMAGE_PIXELS", 1000):
+        with pytest.raises(ValueError, match="pixels allowed"):
+            preprocess.canonicalize(photo, "fakehash123.jpg")
+
+    assert stored_files(store) == []
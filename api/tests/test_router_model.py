@@ -1,6 +1,7 @@
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from app import settings as config
 from app.auth.jwt import get_current_user
 from fastapi import UploadFile
 from httpx import AsyncClient
@@ -23,12 +24,17 @@ async def test_predict():
 
     app.dependency_overrides[get_current_user] = lambda: mock_current_user
 
-    with patch("app.model.router.utils.get_file_hash", return_value="fakehash123"):
+    with patch("app.model.router.utils.save_upload", return_value="fakehash123"):
         with patch(
             "app.model.router.model_predict", new_callable=AsyncMock
         ) as mock_model_predict:
-            with patch("app.model.router.os.path.exists", return_value=False):
-                mock_model_predict.return_value = ("cat", 0.95)
+            with patch("app.model.router.record_upload", new_callable=AsyncMock):
+                mock_model_predict.return_value = {
+                    "prediction": "cat",
+                    "score": 0.95,
+                    "top": [("cat", 0.95)],
+                    "stage": "mobilenet_v2",
+                }
                 with patch("builtins.open", new_callable=MagicMock):
                     async with AsyncClient(app=app, base_url="http://test") as ac:
                         response = await ac.post(
@@ -50,6 +56,7 @@ async def test_predict():
                         assert response_data["prediction"] == "cat"
                         assert response_data["score"] == 0.95
                         assert response_data["image_file_name"] == "fakehash123"
+                        assert response_data["stage"] == "mobilenet_v2"
 
 
 @pytest.mark.asyncio
@@ -66,12 +73,17 @@ async def test_predict_fails_bad_extension():
 
     app.dependency_overrides[get_current_user] = lambda: mock_current_user
 
-    with patch("app.model.router.utils.get_file_hash", return_value="fakehash123"):
+    with patch("app.model.router.utils.save_upload", return_value="fakehash123"):
         with patch(
             "app.model.router.model_predict", new_callable=AsyncMock
         ) as mock_model_predict:
-            with patch("app.model.router.os.path.exists", return_value=False):
-                mock_model_predict.return_value = ("cat", 0.95)
+            with patch("app.model.router.record_upload", new_callable=AsyncMock):
+                mock_model_predict.return_value = {
+                    "prediction": "cat",
+                    "score": 0.95,
+                    "top": [("cat", 0.95)],
+                    "stage": "mobilenet_v2",
+                }
                 with patch("builtins.open", new_callable=MagicMock):
                     async with AsyncClient(app=app, base_url="http://test") as ac:
                         response = await ac.post(
@@ -90,3 +102,188 @@ async def test_predict_fails_bad_extension():
                         assert response.json() == {
                             "detail": "File type is not supported."
                         }
+
+
+@pytest.mark.asyncio
+async def test_predict_fails_model_timeout():
+    mock_current_user = MagicMock()
+    mock_current_user.return_value = "testtoken"
+
+    app.dependency_overrides[get_current_user] = lambda: mock_current_user
+
+    with patch("app.model.router.utils.save_upload", return_value="fakehash123"):
+        with patch(
+            "app.model.router.model_predict", new_callable=AsyncMock
+        ) as mock_model_predict:
+            with patch("app.model.router.record_upload", new_callable=AsyncMock):
+                mock_model_predict.side_effect = TimeoutError
+                async with AsyncClient(app=app, base_url="http://test") as ac:
+                    response = await ac.post(
+                        "/model/predict",
+                        files={"file": ("test_image.png", b"fake-image-data")},
+                        headers={"Authorization": "Bearer testtoken"},
+                    )
+
+                    assert response.status_code == 504
+                    assert response.json() == {
+                        "detail": "Model service did not answer in time."
+                    }
+
+
+@pytest.mark.asyncio
+async def test_predict_top_k():
+    app.dependency_overrides[get_current_user] = lambda: MagicMock()
+    top = [("cat", 0.6), ("lynx", 0.3)]
+
+    with patch("app.model.router.utils.save_upload", return_value="fakehash123"):
+        with patch(
+            "app.model.router.model_predict", new_callable=AsyncMock
+        ) as mock_model_predict:
+            with patch("app.model.router.record_upload", new_callable=AsyncMock):
+                mock_model_predict.return_value = {
+                    "prediction": "cat",
+                    "score": 0.6,
+                    "top": top,
+                    "stage": "resnet50",
+                }
+                async with AsyncClient(app=app, base_url="http://test") as ac:
+                    response = await ac.post(
+                        "/model/predict?top_k=2",
+                        files={"file": ("test_image.png", b"fake-image-data")},
+                        headers={"Authorization": "Bearer testtoken"},
+                    )
+
+                    assert response.status_code == 200
+                    assert response.json()["top_k"] == [
+                        {"prediction": "cat", "score": 0.6},
+                        {"prediction": "lynx", "score": 0.3},
+                    ]
+                    mock_model_predict.assert_called_once_with("fa/ke/fakehash123", 2)
+
+
+@pytest.mark.asyncio
+async def test_predict_top_k_over_limit():
+    app.dependency_overrides[get_current_user] = lambda: MagicMock()
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post(
+            f"/model/predict?top_k={config.TOP_K + 1}",
+            files={"file": ("test_image.png", b"fake-image-data")},
+            headers={"Authorization": "Bearer testtoken"},
+        )
+
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_get_cache_stats():
+    app.dependency_overrides[get_current_user] = lambda: MagicMock()
+    stats = {"hits": 3, "misses": 1, "size": 1, "max_size": 10, "hit_rate": 0.75}
+
+    with patch("app.model.router.cache_stats", new_callable=AsyncMock) as mock_stats:
+        mock_stats.return_value = stats
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get(
+                "/model/cache/stats", headers={"Authorization": "Bearer testtoken"}
+            )
+
+            assert response.status_code == 200
+            assert response.json() == stats
+
+
+@pytest.mark.asyncio
+async def test_get_cascade_stats():
+    app.dependency_overrides[get_current_user] = lambda: MagicMock()
+    stats = {
+        "first_stage": 6,
+        "escalated": 2,
+        "escalation_rate": 0.25,
+        "first_stage_seconds": 0.3,
+        "second_stage_seconds": 0.4,
+        "latency_saved_seconds": 0.9,
+    }
+
+    with patch("app.model.router.cascade_stats", new_callable=AsyncMock) as mock_stats:
+        mock_stats.return_value = stats
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get(
+                "/model/cascade/stats", headers={"Authorization": "Bearer testtoken"}
+            )
+
+            assert response.status_code == 200
+            assert response.json() == stats
+
+
+@pytest.mark.asyncio
+async def test_predict_edge_rejects_non_image(tmp_path):
+    app.dependency_overrides[get_current_user] = lambda: MagicMock()
+
+    with patch.object(config, "EDGE_PREPROCESS", True), patch.object(
+        config, "UPLOAD_FOLDER", str(tmp_path)
+    ), patch(
+        "app.model.router.record_edge", new_callable=AsyncMock
+    ) as mock_record, patch(
+        "app.model.router.model_predict", new_callable=AsyncMock
+    ) as mock_model_predict:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post(
+                "/model/predict",
+                files={"file": ("test_image.png", b"%PDF-1.4 fake-image-data")},
+                headers={"Authorization": "Bearer testtoken"},
+            )
+
+            assert response.status_code == 400
+            assert response.json() == {"detail": "Image could not be processed."}
+            # Rejected before being queued, nothing is kept
+            mock_model_predict.assert_not_called()
+            mock_record.assert_called_once_with({"rejected": 1})
+            assert [path for path in tmp_path.rglob("*") if path.is_file()] == []
+
+
+@pytest.mark.asyncio
+async def test_get_edge_stats():
+    app.dependency_overrides[get_current_user] = lambda: MagicMock()
+    stats = {
+        "images": 4,
+        "rejected": 1,
+        "bytes_in": 4_000_000,
+        "bytes_out": 400_000,
+        "bytes_saved_per_image": 900_000,
+        "seconds_per_image": 0.02,
+        "decode_seconds_saved_per_image": 0.015,
+    }
+
+    with patch("app.model.router.edge_stats", new_callable=AsyncMock) as mock_stats:
+        mock_stats.return_value = stats
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get(
+                "/model/edge/stats", headers={"Authorization": "Bearer testtoken"}
+            )
+
+            assert response.status_code == 200
+            assert response.json() == stats
+
+
+@pytest.mark.asyncio
+async def test_get_storage_stats():
+    app.dependency_overrides[get_current_user] = lambda: MagicMock()
+    stats = {
+        "files": 120,
+        "bytes": 9_000_000,
+        "pinned": 3,
+        "max_files": 0,
+        "max_bytes": 10_000_000,
+        "eviction": "lru",
+        "evicted": 40,
+        "evicted_bytes": 3_000_000,
+    }
+
+    with patch("app.model.router.storage_stats", new_callable=AsyncMock) as mock_stats:
+        mock_stats.return_value = stats
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get(
+                "/model/storage/stats", headers={"Authorization": "Bearer testtoken"}
+            )
+
+            assert response.status_code == 200
+            assert response.json() == stats
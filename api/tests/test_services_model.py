@@ -0,0 +1,270 @@
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.model import services
+
+# 💡 NOTE Run tests with: pytest tests/test_services_model.py -v
+
+
+@pytest.fixture
+def mock_db():
+    db = AsyncMock()
+    pipe = MagicMock()
+    pipe.__aenter__.return_value = pipe
+    # Nobody waits on the job, see hand_off()
+    pipe.execute = AsyncMock(return_value=[1, None, None])
+    db.pipeline = MagicMock(return_value=pipe)
+
+    with patch.object(services, "db", db):
+        yield db
+
+
+@pytest.fixture
+def empty_cache():
+    with patch.object(
+        services.cache, "lookup", AsyncMock(return_value=None)
+    ), patch.object(services.cache, "store", AsyncMock()) as mock_store:
+        yield mock_store
+
+
+@pytest.mark.asyncio
+async def test_model_predict(mock_db, empty_cache):
+    output = json.dumps({"prediction": "cat", "score": 0.95}).encode("utf-8")
+    mock_db.set.return_value = True
+    mock_db.brpop.return_value = (b"job-id", output)
+
+    output = await services.model_predict("fakehash123.png")
+
+    assert output["prediction"] == "cat"
+    assert output["score"] == 0.95
+    assert output["top"] == [("cat", 0.95)]
+    assert output["stage"] is None
+
+    pipe = mock_db.pipeline.return_value
+    queue, job = pipe.lpush.call_args.args
+    job = json.loads(job)
+    assert queue == services.settings.REDIS_QUEUE
+    assert job["image_name"] == "fakehash123.png"
+    mock_db.brpop.assert_called_once_with(
+        job["id"], timeout=services.settings.API_TIMEOUT
+    )
+    pipe.delete.assert_any_call("inflight:fakehash123")
+    # Counted once, and not pushed again as nobody waits
+    pipe.incr.assert_called_once_with(services.cache.MISSES_KEY)
+    pipe.lpush.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_model_predict_timeout(mock_db, empty_cache):
+    mock_db.brpop.return_value = None
+
+    with pytest.raises(TimeoutError):
+        await services.model_predict("fakehash123.png")
+
+
+@pytest.mark.asyncio
+async def test_connect_shares_one_pool():
+    services.connect()
+    try:
+        assert services.db is not None
+        pool = services.db.connection_pool
+        assert pool.max_connections == services.settings.REDIS_MAX_CONNECTIONS
+    finally:
+        await services.disconnect()
+
+    assert services.db is None
+
+
+@pytest.mark.asyncio
+async def test_model_predict_cache_hit(mock_db):
+    cached = {"prediction": "cat", "score": 0.95, "top": [["cat", 0.95]]}
+    with patch.object(
+        services.cache, "lookup", AsyncMock(return_value=cached)
+    ) as mock_lookup:
+        output = await services.model_predict("uploads/fakehash123.png")
+
+        assert (output["prediction"], output["score"]) == ("cat", 0.95)
+        mock_lookup.assert_called_once_with(mock_db, "fakehash123")
+        mock_db.lpush.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_model_predict_cache_miss_stores_prediction(mock_db, empty_cache):
+    output = {"prediction": "cat", "score": 0.95, "stage": "mobilenet_v2"}
+    mock_db.set.return_value = True
+    mock_db.brpop.return_value = (b"job-id", json.dumps(output).encode("utf-8"))
+
+    await services.model_predict("uploads/fakehash123.png")
+
+    mock_db.pipeline.return_value.lpush.assert_called_once()
+    empty_cache.assert_called_once_with(mock_db, "fakehash123", output)
+
+
+@pytest.mark.asyncio
+async def test_model_predict_waits_on_inflight_job(mock_db, empty_cache):
+    output = json.dumps({"prediction": "cat", "score": 0.95}).encode("utf-8")
+    mock_db.set.return_value = None
+    mock_db.get.return_value = b"other-job-id"
+    mock_db.brpop.return_value = (b"other-job-id:handoff", output)
+    pipe = mock_db.pipeline.return_value
+    pipe.execute.return_value = [1, True, b"other-job-id", 1]
+
+    result = await services.model_predict("uploads/fakehash123.png")
+
+    assert (result["prediction"], result["score"]) == ("cat", 0.95)
+    # Counted as waiting, the job owner pushes it its own copy
+    pipe.incr.assert_any_call("other-job-id:waiters")
+    pipe.incr.assert_any_call(services.cache.MISSES_KEY)
+    mock_db.brpop.assert_called_once_with(
+        "other-job-id:handoff", timeout=services.settings.API_TIMEOUT
+    )
+    pipe.lpush.assert_not_called()
+    empty_cache.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_model_predict_inflight_job_done(mock_db):
+    cached = {"prediction": "cat", "score": 0.95}
+    mock_db.set.return_value = None
+    mock_db.get.return_value = b"other-job-id"
+    pipe = mock_db.pipeline.return_value
+    # The job was handed off before this request joined it
+    pipe.execute.return_value = [1, True, None, 1]
+
+    with patch.object(services.cache, "lookup", AsyncMock(side_effect=[None, cached])):
+        result = await services.model_predict("uploads/fakehash123.png")
+
+    assert result["prediction"] == "cat"
+    mock_db.brpop.assert_not_called()
+    pipe.incr.assert_any_call(services.cache.MISSES_KEY)
+
+
+@pytest.mark.asyncio
+async def test_model_predict_hands_off_to_waiters(mock_db, empty_cache):
+    output = json.dumps({"prediction": "cat", "score": 0.95}).encode("utf-8")
+    mock_db.set.return_value = True
+    mock_db.brpop.return_value = (b"job-id", output)
+    pipe = mock_db.pipeline.return_value
+    # Queued, then 3 requests joined the job
+    pipe.execute.side_effect = [[1, 1], [1, b"3", 1], [3, True]]
+
+    await services.model_predict("uploads/fakehash123.png")
+
+    job_id = mock_db.brpop.call_args.args[0]
+    pipe.lpush.assert_called_with(f"{job_id}:handoff", output, output, output)
+    pipe.delete.assert_any_call(f"{job_id}:waiters")
+
+
+@pytest.mark.asyncio
+async def test_model_predict_top_k(mock_db, empty_cache):
+    top = [["cat", 0.6], ["lynx", 0.3], ["dog", 0.1]]
+    output = {"prediction": "cat", "score": 0.6, "top": top, "stage": "resnet50"}
+    mock_db.set.return_value = True
+    mock_db.brpop.return_value = (b"job-id", json.dumps(output).encode("utf-8"))
+
+    result = await services.model_predict("uploads/fakehash123.png", top_k=2)
+
+    assert result["top"] == [("cat", 0.6), ("lynx", 0.3)]
+    assert result["stage"] == "resnet50"
+    # Every class sent by the ML service is cached for later requests
+    empty_cache.assert_called_once_with(mock_db, "fakehash123", output)
+
+
+@pytest.mark.asyncio
+async def test_model_predict_image_error(mock_db, empty_cache):
+    output = json.dumps({"error": "cannot identify image file"}).encode("utf-8")
+    mock_db.set.return_value = True
+    mock_db.brpop.return_value = (b"job-id", output)
+
+    with pytest.raises(ValueError):
+        await services.model_predict("uploads/fakehash123.png")
+
+    empty_cache.assert_not_called()
+    mock_db.pipeline.return_value.delete.assert_any_call("inflight:fakehash123")
+
+
+@pytest.mark.asyncio
+async def test_cascade_stats(mock_db):
+    mock_db.hgetall.return_value = {
+        b"answered:mobilenet_v2": b"6",
+        b"answered:resnet50": b"2",
+        b"seconds:mobilenet_v2": b"0.3",
+        b"seconds:resnet50": b"0.4",
+    }
+
+    stats = await services.cascade_stats()
+
+    mock_db.hgetall.assert_called_once_with(services.settings.CASCADE_METRICS)
+    assert stats["first_stage"] == 6
+    assert stats["escalated"] == 2
+    assert stats["escalation_rate"] == 0.25
+    # 6 images at 0.2 s each on ResNet50, minus the cheap model time
+    assert stats["latency_saved_seconds"] == 0.9
+
+
+@pytest.mark.asyncio
+async def test_cascade_stats_without_jobs(mock_db):
+    mock_db.hgetall.return_value = {}
+
+    stats = await services.cascade_stats()
+
+    assert stats["escalation_rate"] == 0.0
+    assert stats["latency_saved_seconds"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_record_edge(mock_db):
+    await services.record_edge({"images": 1, "bytes_in": 1000})
+
+    pipe = mock_db.pipeline.return_value
+    pipe.hincrbyfloat.assert_any_call(services.settings.EDGE_METRICS, "images", 1)
+    pipe.hincrbyfloat.assert_any_call(services.settings.EDGE_METRICS, "bytes_in", 1000)
+    pipe.execute.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_edge_stats(mock_db):
+    mock_db.hgetall.return_value = {
+        b"images": b"4",
+        b"rejected": b"1",
+        b"bytes_in": b"4000000",
+        b"bytes_out": b"400000",
+        b"seconds": b"0.08",
+        b"decode_seconds_saved": b"0.06",
+    }
+
+    stats = await services.edge_stats()
+
+    mock_db.hgetall.assert_called_once_with(services.settings.EDGE_METRICS)
+    assert stats["images"] == 4
+    assert stats["rejected"] == 1
+    assert stats["bytes_saved_per_image"] == 900_000
+    assert stats["seconds_per_image"] == 0.02
+    assert stats["decode_seconds_saved_per_image"] == 0.015
+
+
+@pytest.mark.asyncio
+async def test_edge_stats_without_images(mock_db):
+    mock_db.hgetall.return_value = {}
+
+    stats = await services.edge_stats()
+
+    assert stats["images"] == 0
+    assert stats["bytes_saved_per_image"] == 0
+
+
+@pytest.mark.asyncio
+async def test_model_predict_inband(mock_db, empty_cache, tmp_path):
+    image = tmp_path / "fakehash123.png"
+    image.write_bytes(b"fake-image-data")
+    output = json.dumps({"prediction": "cat", "score": 0.95}).encode("utf-8")
+    mock_db.set.return_value = True
+    mock_db.brpop.return_value = (b"job-id", output)
+
+    with patch.object(services.settings, "JOB_TRANSPORT", "inband"):
+        await services.model_predict(str(image))
+
+    job = json.loads(mock_db.pipeline.return_value.lpush.call_args.args[1])
+    assert job["image_name"] == str(image)
+    assert job["image"] == "ZmFrZS1pbWFnZS1kYXRh"
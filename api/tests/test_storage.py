@@ -0,0 +1,231 @@
+import importlib.util
+import os
+import time
+from io import BytesIO
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+import redis.asyncio as redis
+from app import settings, storage, utils
+from fastapi import UploadFile
+
+# 💡 NOTE Run tests with: pytest tests/test_storage.py -v
+
+STANDIN_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "stress_test",
+    "redis_standin.py",
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    with patch.object(settings, "UPLOAD_FOLDER", str(tmp_path)):
+        yield tmp_path
+
+
+@pytest.fixture(scope="module")
+def redis_standin():
+    # The Redis stand-in of the benchmarks lives outside the API image
+    if not os.path.exists(STANDIN_PATH):
+        pytest.skip("Redis stand-in not available")
+    spec = importlib.util.spec_from_file_location("redis_standin", STANDIN_PATH)
+    redis_standin = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(redis_standin)
+    return redis_standin
+
+
+@pytest.fixture
+def mock_db():
+    db = AsyncMock()
+    pipe = MagicMock()
+    pipe.__aenter__.return_value = pipe
+    pipe.execute = AsyncMock()
+    db.pipeline = MagicMock(return_value=pipe)
+    return db
+
+
+def test_relative_path():
+    with patch.object(settings, "STORE_SHARD_LEVELS", 2):
+        assert storage.relative_path("fakehash123.png") == "fa/ke/fakehash123.png"
+    with patch.object(settings, "STORE_SHARD_LEVELS", 0):
+        assert storage.relative_path("fakehash123.png") == "fakehash123.png"
+
+
+def test_put(store):
+    tmp = store / "upload.part"
+    tmp.write_bytes(b"fake-image-data")
+
+    assert storage.put(str(tmp), "fakehash123.png")
+
+    assert not tmp.exists()
+    assert (store / "fa/ke/fakehash123.png").read_bytes() == b"fake-image-data"
+
+
+def test_put_already_stored(store):
+    stored = store / "fa/ke/fakehash123.png"
+    stored.parent.mkdir(parents=True)
+    stored.write_bytes(b"stored")
+    tmp = store / "upload.part"
+    tmp.write_bytes(b"fake-image-data")
+
+    assert not storage.put(str(tmp), "fakehash123.png")
+
+    assert not tmp.exists()
+    assert stored.read_bytes() == b"stored"
+
+
+@pytest.mark.asyncio
+async def test_record_new_image(store, mock_db):
+    (store / "fa/ke").mkdir(parents=True)
+    (store / "fa/ke/fakehash123.png").write_bytes(b"fake-image-data")
+    mock_db.pipeline.return_value.execute.side_effect = [
+        # Not indexed yet, then indexed by this call
+        [0, 1.0, False],
+        [1, 1],
+    ] * 2
+
+    with patch.object(settings, "STORE_MAX_BYTES", 100), patch.object(
+        storage, "evict", AsyncMock()
+    ) as mock_evict:
+        mock_db.incrby.return_value = 15
+        await storage.record(mock_db, "fakehash123.png")
+        mock_evict.assert_not_called()
+
+        # Over budget once the image is added
+        mock_db.incrby.return_value = 115
+        await storage.record(mock_db, "fakehash123.png")
+        mock_evict.assert_called_once_with(mock_db)
+
+    pipe = mock_db.pipeline.return_value
+    pipe.hsetnx.assert_called_with(storage.SIZES_KEY, "fakehash123.png", 15)
+    mock_db.incrby.assert_called_with(storage.BYTES_KEY, 15)
+
+
+@pytest.mark.asyncio
+async def test_record_known_image(store, mock_db):
+    mock_db.pipeline.return_value.execute.return_value = [0, 2.0, True]
+
+    # Indexed already, the backend isn't asked for the size
+    with patch.object(storage.objects, "size") as mock_size:
+        await storage.record(mock_db, "fakehash123.png")
+
+    mock_size.assert_not_called()
+    pipe = mock_db.pipeline.return_value
+    pipe.zincrby.assert_called_once_with(storage.USES_KEY, 1, "fakehash123.png")
+    pipe.hsetnx.assert_not_called()
+    mock_db.incrby.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_evict(store, mock_db):
+    for name in ("aaaa.png", "bbbb.png", "cccc.png"):
+        path = store / storage.relative_path(name)
+        path.parent.mkdir(parents=True)
+        path.write_bytes(b"x" * 10)
+    old = time.time() - settings.API_TIMEOUT - 60
+    mock_db.pipeline.return_value.execute.side_effect = [
+        # Store at 30 bytes, 15 allowed
+        [b"30", 3, [b"aaaa.png", b"bbbb.png", b"cccc.png"]],
+        # aaaa.png is pinned, bbbb.png and cccc.png can go
+        [1, old, b"10", 0, old, b"10", 0, old, b"10"],
+        # Index updates, then counters
+        [1, 1, 1, 1, 1, 1],
+        [10, 2, 20],
+        # Within budget
+        [b"10", 1, [b"aaaa.png"]],
+    ]
+
+    with patch.object(settings, "STORE_MAX_BYTES", 15), patch.object(
+        settings, "STORE_MAX_FILES", 0
+    ):
+        evicted = await storage.evict(mock_db)
+
+    assert evicted == 2
+    assert (store / storage.relative_path("aaaa.png")).exists()
+    assert not (store / storage.relative_path("bbbb.png")).exists()
+    assert not (store / storage.relative_path("cccc.png")).exists()
+    pipe = mock_db.pipeline.return_value
+    pipe.decrby.assert_called_once_with(storage.BYTES_KEY, 20)
+    pipe.incrby.assert_any_call(storage.EVICTED_KEY, 2)
+
+
+@pytest.mark.asyncio
+async def test_evict_keeps_recent_images(store, mock_db):
+    mock_db.pipeline.return_value.execute.side_effect = [
+        [b"30", 1, [b"aaaa.png"]],
+        # Used just now, a job may still need it
+        [0, time.time(), b"30"],
+    ]
+
+    with patch.object(settings, "STORE_MAX_BYTES", 15):
+        evicted = await storage.evict(mock_db)
+
+    assert evicted == 0
+    mock_db.pipeline.return_value.hdel.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_stats(mock_db):
+    mock_db.pipeline.return_value.execute.return_value = [3, b"300", 1, b"2", b"200"]
+
+    with patch.object(settings, "STORE_MAX_BYTES", 1000):
+        stats = await storage.stats(mock_db)
+
+    assert stats == {
+        "files": 3,
+        "bytes": 300,
+        "pinned": 1,
+        "max_files": settings.STORE_MAX_FILES,
+        "max_bytes": 1000,
+        "eviction": settings.STORE_EVICTION,
+        "evicted": 2,
+        "evicted_bytes": 200,
+    }
+
+
+@pytest.mark.asyncio
+async def test_reindex(store, mock_db):
+    (store / "fakehash123.png").write_bytes(b"fake-image-data")
+    (store / "tmpabc.part").write_bytes(b"fake")
+
+    with patch.object(storage, "record", AsyncMock()) as mock_record:
+        indexed = await storage.reindex(mock_db, ["fakehash123.png"])
+
+    assert indexed == 1
+    assert [path for path in store.rglob("*") if path.is_file()] == [
+        store / "fa/ke/fakehash123.png"
+    ]
+    mock_record.assert_called_once_with(mock_db, "fakehash123.png")
+    mock_db.sadd.assert_called_once_with(storage.PINNED_KEY, "fakehash123.png")
+
+
+@pytest.mark.asyncio
+async def test_upload_path_on_standin(store, redis_standin):
+    # Every command the upload path sends must be known to the stand-in the
+    # pipeline benchmark runs the API against
+    server, _ = await redis_standin.start()
+    db = redis.Redis(host="127.0.0.1", port=server.sockets[0].getsockname()[1])
+
+    try:
+        # Every image counts as old enough to be evicted
+        with patch.object(settings, "STORE_MAX_FILES", 1), patch.object(
+            settings, "API_TIMEOUT", -60
+        ):
+            for content in (b"first-image", b"second-image", b"second-image"):
+                file = UploadFile(file=BytesIO(content), filename="dog.jpeg")
+                await storage.record(db, await utils.save_upload(file))
+            stats = await storage.stats(db)
+    finally:
+        await db.close()
+        server.close()
+        await server.wait_closed()
+
+    assert stats["files"] == 1
+    assert stats["bytes"] == len(b"second-image")
+    assert stats["evicted"] == 1
+    assert [path.read_bytes() for path in store.rglob("*") if path.is_file()] == [
+        b"second-image"
+    ]
@@ -0,0 +1,62 @@
+import base64
+from multiprocessing import shared_memory
+from unittest.mock import patch
+
+import pytest
+from app.model import transport
+
+# 💡 NOTE Run tests with: pytest tests/test_transport_model.py -v
+
+
+@pytest.fixture
+def image(tmp_path):
+    # Key of an image in the local upload store
+    (tmp_path / "fakehash123.png").write_bytes(b"fake-image-data")
+    with patch.object(transport.settings, "UPLOAD_FOLDER", str(tmp_path)):
+        yield "fakehash123.png"
+
+
+@pytest.mark.asyncio
+async def test_attach_shared_fs(image):
+    job_data = {"id": "job-id", "image_name": image}
+
+    with patch.object(transport.settings, "JOB_TRANSPORT", "shared_fs"):
+        async with transport.attach(job_data, image):
+            assert job_data == {"id": "job-id", "image_name": image}
+
+
+@pytest.mark.asyncio
+async def test_attach_inband(image):
+    job_data = {"id": "job-id", "image_name": image}
+
+    with patch.object(transport.settings, "JOB_TRANSPORT", "inband"):
+        async with transport.attach(job_data, image):
+            assert base64.b64decode(job_data["image"]) == b"fake-image-data"
+
+
+@pytest.mark.asyncio
+async def test_attach_inband_too_large(image):
+    job_data = {"id": "job-id", "image_name": image}
+
+    with patch.multiple(
+        transport.settings, JOB_TRANSPORT="inband", JOB_INBAND_MAX_BYTES=10
+    ):
+        async with transport.attach(job_data, image):
+            # Falls back to the shared folder
+            assert "image" not in job_data
+
+
+@pytest.mark.asyncio
+async def test_attach_shm(image):
+    job_data = {"id": "job-id", "image_name": image}
+
+    with patch.object(transport.settings, "JOB_TRANSPORT", "shm"):
+        async with transport.attach(job_data, image):
+            assert job_data["shm"]["size"] == len(b"fake-image-data")
+            block = shared_memory.SharedMemory(job_data["shm"]["name"])
+            assert bytes(block.buf[: job_data["shm"]["size"]]) == b"fake-image-data"
+            block.close()
+
+    # Freed once the results arrived
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(job_data["shm"]["name"])
@@ -1,6 +1,10 @@
+import hashlib
+import os
 from io import BytesIO
+from unittest.mock import patch
 
 import app.utils as utils
+from app import storage
 import pytest
 from fastapi import UploadFile
 from werkzeug.datastructures import FileStorage
@@ -24,14 +28,73 @@ def test_allowed_file():
 
 
 @pytest.mark.asyncio
-async def test_get_file_hash():
-    # 💡 NOTE Run test with: pytest ./tests/test_utils.py::test_get_file_hash -v
+async def test_spool_upload(tmp_path):
+    # 💡 NOTE Run test with: pytest ./tests/test_utils.py::test_spool_upload -v
     filename = "tests/dog.jpeg"
     md5_filename = "0a7c757a80f2c5b13fa7a2a47a683593.jpeg"
     with open(filename, "rb") as fp:
         file = FileStorage(fp)
-        file = UploadFile(file=BytesIO(file.read()), filename="dog.jpeg")
+        content = file.read()
+        file = UploadFile(file=BytesIO(content), filename="dog.jpeg")
 
-    new_filename = await utils.get_file_hash(file)
+    with patch.object(utils.settings, "UPLOAD_FOLDER", str(tmp_path)):
+        tmp_filename, new_filename = await utils.spool_upload(file)
 
     assert md5_filename == new_filename
+    # Received into the upload folder, not yet moved into the store
+    with open(tmp_filename, "rb") as fp:
+        assert fp.read() == content
+    assert os.path.dirname(tmp_filename) == str(tmp_path)
+    assert await file.read() == content
+
+
+@pytest.mark.asyncio
+async def test_save_upload(tmp_path):
+    # 💡 NOTE Run test with: pytest ./tests/test_utils.py::test_save_upload -v
+    content = b"fake-image-data" * 1000
+    file = UploadFile(file=BytesIO(content), filename="dog.jpeg")
+
+    with patch.object(utils.settings, "UPLOAD_FOLDER", str(tmp_path)), patch.object(
+        utils.settings, "UPLOAD_CHUNK_SIZE", 1024
+    ):
+        new_filename = await utils.save_upload(file)
+
+    assert new_filename == hashlib.md5(content).hexdigest() + ".jpeg"
+    stored = tmp_path / storage.relative_path(new_filename)
+    assert stored.read_bytes() == content
+    assert [path for path in tmp_path.rglob("*") if path.is_file()] == [stored]
+    assert await file.read() == content
+
+
+@pytest.mark.asyncio
+async def test_save_upload_already_stored(tmp_path):
+    # 💡 NOTE Run test with:
+    # pytest ./tests/test_utils.py::test_save_upload_already_stored -v
+    content = b"fake-image-data"
+    filename = hashlib.md5(content).hexdigest() + ".png"
+    stored = tmp_path / storage.relative_path(filename)
+    stored.parent.mkdir(parents=True)
+    stored.write_bytes(b"stored")
+    file = UploadFile(file=BytesIO(content), filename="cat.png")
+
+    with patch.object(utils.settings, "UPLOAD_FOLDER", str(tmp_path)):
+        new_filename = await utils.save_upload(file)
+
+    # The stored image is kept and the temporary file discarded
+    assert new_filename == filename
+    assert stored.read_bytes() == b"stored"
+    assert [path for path in tmp_path.rglob("*") if path.is_file()] == [stored]
+
+
+@pytest.mark.asyncio
+async def test_save_upload_hash(tmp_path):
+    # 💡 NOTE Run test with: pytest ./tests/test_utils.py::test_save_upload_hash -v
+    content = b"fake-image-data"
+    file = UploadFile(file=BytesIO(content), filename="cat.png")
+
+    with patch.object(utils.settings, "UPLOAD_FOLDER", str(tmp_path)), patch.object(
+        utils.settings, "UPLOAD_HASH", "sha256"
+    ):
+        new_filename = await utils.save_upload(file)
+
+    assert new_filename == hashlib.sha256(content).hexdigest() + ".png"
@@ -0,0 +1,168 @@
+"""
+Build the model artifacts the workers load at startup.
+
+Downloads the pre-trained weights and the class names once, when the image
+is built, into the paths in settings and writes a checksum next to each
+file, so workers start without network access and refuse corrupted or
+partial files.
+
+💡 NOTE Run with:
+    python3 artifact.py
+"""
+import hashlib
+import os
+
+import h5py
+import numpy as np
+import settings
+import tensorflow as tf
+
+# Pre-trained ResNet50 weights, same file Keras downloads for weights="imagenet"
+WEIGHTS_URL = (
+    "https://storage.googleapis.com/tensorflow/keras-applications/resnet/"
+    "resnet50_weights_tf_dim_ordering_tf_kernels.h5"
+)
+WEIGHTS_HASH = "2cb95161c43110f7111970584f804107"
+# Pre-trained MobileNetV2 weights, first stage of the cascade
+CASCADE_WEIGHTS_URL = (
+    "https://storage.googleapis.com/tensorflow/keras-applications/mobilenet_v2/"
+    "mobilenet_v2_weights_tf_dim_ordering_tf_kernels_1.0_224.h5"
+)
+# ImageNet class index, same file Keras downloads for decode_predictions()
+CLASS_INDEX_URL = (
+    "https://storage.googleapis.com/download.tensorflow.org/data/"
+    "imagenet_class_index.json"
+)
+CLASS_INDEX_HASH = "c2c37ea517e94d9795004a39431a14cb"
+
+
+def checksum(path):
+    """
+    SHA-256 of a file, or of every file in a directory (e.g. a SavedModel)
+    with their relative paths, in a stable order.
+    """
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.relpath(os.path.join(root, name), path)
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    else:
+        files = [""]
+
+    for name in files:
+        digest.update(name.encode("utf-8"))
+        with open(os.path.join(path, name) if name else path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def checksum_path(path):
+    return path.rstrip("/") + ".sha256"
+
+
+def write_checksum(path):
+    """
+    Record the checksum of a freshly built artifact next to it.
+    """
+    with open(checksum_path(path), "w") as f:
+        f.write(checksum(path) + "\n")
+
+
+def verify(path):
+    """
+    Check an artifact against the checksum recorded when it was built.
+
+    Parameters
+    ----------
+    path : str
+        Artifact file or directory.
+
+    Returns
+    -------
+    path : str
+        The verified artifact, for chaining.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the artifact or its checksum is missing.
+    ValueError
+        If the artifact doesn't match its checksum.
+    """
+    if not os.path.exists(path) or not os.path.exists(checksum_path(path)):
+        raise FileNotFoundError(
+            f"Model artifact {path} not found, build it with `python3 artifact.py`"
+            " (or export.py for exported models)"
+        )
+
+    with open(checksum_path(path)) as f:
+        expected = f.read().strip()
+    if checksum(path) != expected:
+        raise ValueError(f"Model artifact {path} doesn't match its checksum")
+
+    return path
+
+
+def fetch(url, path, file_hash=None):
+    """
+    Download a file into `path` unless it's already there, then record its
+    checksum.
+    """
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    path = tf.keras.utils.get_file(path, url, file_hash=file_hash)
+    write_checksum(path)
+    return path
+
+
+def load_weights(path=settings.MODEL_WEIGHTS_PATH):
+    """
+    Read the pre-trained ResNet50 weights into memory without starting the
+    TensorFlow runtime.
+
+    Returns
+    -------
+    weights : list(list(np.ndarray))
+        Weight arrays of every layer having weights, in model order.
+    """
+    verify(path)
+
+    weights = []
+    with h5py.File(path, "r") as f:
+        # Keras HDF5 layout: one group per layer listing its weight names.
+        # Layer names in the file predate the current ResNet50 ones, Keras
+        # matches them by order as well.
+        for layer_name in f.attrs["layer_names"]:
+            group = f[decode_name(layer_name)]
+            layer_weights = [
+                np.asarray(group[decode_name(weight_name)])
+                for weight_name in group.attrs["weight_names"]
+            ]
+            if layer_weights:
+                weights.append(layer_weights)
+
+    return weights
+
+
+def decode_name(name):
+    """
+    HDF5 attributes store names as bytes or str depending on the h5py version.
+    """
+    return name.decode("utf8") if isinstance(name, bytes) else name
+
+
+def main():
+    for url, path, file_hash in [
+        (WEIGHTS_URL, settings.MODEL_WEIGHTS_PATH, WEIGHTS_HASH),
+        (CASCADE_WEIGHTS_URL, settings.CASCADE_WEIGHTS_PATH, None),
+        (CLASS_INDEX_URL, settings.CLASS_INDEX_PATH, CLASS_INDEX_HASH),
+    ]:
+        print(f"Saved {fetch(url, path, file_hash)}")
+
+
+if __name__ == "__main__":
+    main()
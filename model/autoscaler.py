@@ -0,0 +1,144 @@
+import json
+import math
+import time
+
+import settings
+
+
+def get_queue_metrics(db, now=None):
+    """
+    Look at the Redis queue to decide whether the workers keep up with it.
+
+    Parameters
+    ----------
+    db : redis.Redis
+        Redis client.
+    now : float
+        Current time, defaults to time.time().
+
+    Returns
+    -------
+    depth, age, processed : tuple(int, float, int)
+        Number of waiting jobs, seconds since the oldest one was queued and
+        total number of jobs processed by the workers so far.
+    """
+    now = time.time() if now is None else now
+
+    pipe = db.pipeline()
+    pipe.llen(settings.REDIS_QUEUE)
+    # Jobs are pushed on the left and taken from the right
+    pipe.lindex(settings.REDIS_QUEUE, -1)
+    pipe.get(settings.PROCESSED_COUNTER)
+    depth, oldest, processed = pipe.execute()
+
+    age = 0.0
+    if oldest is not None:
+        queued_at = json.loads(oldest.decode("utf-8")).get("time")
+        if queued_at is not None:
+            age = max(0.0, now - queued_at)
+
+    return depth, age, int(processed or 0)
+
+
+class Autoscaler:
+    """
+    Decides how many workers should be running from the queue depth, the
+    age of the oldest waiting job and the recent throughput of the workers.
+
+    Scaling up is quick: one worker is added whenever the queue backs up.
+    Scaling down is slow: the queue must stay empty for
+    `settings.SCALE_DOWN_DELAY` seconds and the remaining workers must be
+    able to handle the current load. Both wait `settings.SCALE_COOLDOWN`
+    seconds after the previous change so the pool doesn't flap.
+    """
+
+    def __init__(
+        self, min_workers=settings.MIN_WORKERS, max_workers=settings.MAX_WORKERS
+    ):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.last_scaled_at = -math.inf
+        self.idle_since = None
+        self.last_processed = None
+        self.last_checked_at = None
+        # Highest jobs/s a single worker reached while the queue was backed up
+        self.worker_capacity = 0.0
+
+    def throughput(self, processed, now):
+        """
+        Jobs per second processed since the previous check.
+        """
+        throughput = 0.0
+        if self.last_processed is not None and now > self.last_checked_at:
+            throughput = (processed - self.last_processed) / (
+                now - self.last_checked_at
+            )
+        self.last_processed = processed
+        self.last_checked_at = now
+        return max(0.0, throughput)
+
+    def decide(self, n_workers, depth, age, processed, now=None):
+        """
+        Parameters
+        ----------
+        n_workers : int
+            Number of running workers.
+        depth, age, processed : int, float, int
+            Queue metrics as returned by get_queue_metrics().
+        now : float
+            Current time, defaults to time.monotonic().
+
+        Returns
+        -------
+        n_workers, reason : tuple(int, str)
+            Number of workers that should be running and the metrics that
+            triggered the change (None if nothing changes).
+        """
+        now = time.monotonic() if now is None else now
+        throughput = self.throughput(processed, now)
+        metrics = (
+            f"queue depth {depth}, oldest job {age:.1f}s, "
+            f"throughput {throughput:.1f} jobs/s"
+        )
+
+        backed_up = (
+            depth > settings.SCALE_UP_QUEUE_DEPTH * n_workers
+            or age > settings.SCALE_UP_QUEUE_AGE
+        )
+        if backed_up and n_workers:
+            # Workers are saturated, what they process is what they can do
+            self.worker_capacity = max(self.worker_capacity, throughput / n_workers)
+
+        # Track how long the queue has been empty
+        if depth:
+            self.idle_since = None
+        elif self.idle_since is None:
+            self.idle_since = now
+
+        if n_workers < self.min_workers:
+            return self.min_workers, metrics
+        if n_workers > self.max_workers:
+            return self.max_workers, metrics
+
+        if now - self.last_scaled_at < settings.SCALE_COOLDOWN:
+            return n_workers, None
+
+        if backed_up and n_workers < self.max_workers:
+            self.last_scaled_at = now
+            return n_workers + 1, metrics
+
+        idle = (
+            self.idle_since is not None
+            and now - self.idle_since >= settings.SCALE_DOWN_DELAY
+        )
+        # Capacity is unknown until the workers were saturated once, an
+        # empty queue is then the only hint that there are too many of them
+        fits = (
+            throughput
+            <= self.worker_capacity * (n_workers - 1) * settings.SCALE_DOWN_UTILIZATION
+        )
+        if idle and n_workers > self.min_workers and (fits or not self.worker_capacity):
+            self.last_scaled_at = now
+            return n_workers - 1, metrics
+
+        return n_workers, None
@@ -0,0 +1,254 @@
+"""
+Tune the worker batching and thread settings for this host.
+
+Times the model on synthetic batches for every TensorFlow thread setting,
+in a fresh process each since thread pools can only be sized once. Then
+replays requests arriving at random against those timings for every
+maximum batch size and batching wait, at `--load` times the throughput the
+setting sustains, to get its p99 latency. The setting with the highest
+throughput is written to `settings.TUNED_SETTINGS_PATH`, which workers read
+at startup (environment variables still win). With --slo-ms, only settings
+keeping p99 under it are considered.
+
+💡 NOTE Run with:
+    python3 autotune.py
+    python3 autotune.py --slo-ms 300 --workers 2
+"""
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import placement
+import settings
+from engine import InferenceEngine, bucket_sizes
+
+
+def measure_batch_times(intra_op_threads, inter_op_threads, sizes, repeat):
+    """
+    Time the model on synthetic batches, run in a fresh process.
+
+    Parameters
+    ----------
+    intra_op_threads, inter_op_threads : int
+        TensorFlow thread pool sizes.
+    sizes : list(int)
+        Batch sizes to time, ascending.
+    repeat : int
+        Timed runs per batch size, after one warm-up run.
+
+    Returns
+    -------
+    batch_times : dict
+        Seconds taken by each run, by batch size.
+    """
+    import backends
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    # Random weights take as long as the real ones
+    backend = backends.load_backend(settings.MODEL_BACKEND, None, intra_op_threads)
+    if isinstance(backend, backends.KerasBackend):
+        # One bucket per batch size, so none is padded or split
+        backend.engine = InferenceEngine(backend.model, sizes[-1], sizes)
+
+    rng = np.random.default_rng(0)
+    batch_times = {}
+    for size in sizes:
+        x_batch = rng.random((size, 224, 224, 3), dtype=np.float32)
+        backend.infer(x_batch)
+
+        batch_times[size] = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            backend.infer(x_batch)
+            batch_times[size].append(time.perf_counter() - start)
+
+    return batch_times
+
+
+def simulate(batch_times, max_size, wait, rate, n_requests=2000, seed=0):
+    """
+    Replay requests arriving at random through the worker batching loop
+    (see ml_service.get_jobs()), using measured batch times.
+
+    Parameters
+    ----------
+    batch_times : dict
+        Seconds taken by the model per run, by batch size. Every bucket
+        size up to `max_size` must be there.
+    max_size : int
+        Maximum batch size.
+    wait : float
+        Time (in seconds) waiting for more jobs once the first one arrived.
+    rate : float
+        Average requests per second, arriving as a Poisson process.
+    n_requests : int
+        Requests to replay.
+    seed : int
+        Seed for the arrivals and the batch times drawn.
+
+    Returns
+    -------
+    latencies : np.ndarray
+        Time (in seconds) between each request arrival and its result.
+    """
+    rng = np.random.default_rng(seed)
+    arrivals = np.cumsum(rng.exponential(1 / rate, n_requests))
+    buckets = bucket_sizes(max_size, settings.ENGINE_BUCKETS)
+
+    latencies = np.empty(n_requests)
+    free_at = 0.0
+    i = 0
+    while i < n_requests:
+        # The worker takes the oldest job once it's done with the last batch,
+        # then every job arriving before the deadline, up to a full batch
+        start = max(free_at, arrivals[i])
+        deadline = start + wait
+        end = min(np.searchsorted(arrivals, deadline, "right"), i + max_size)
+        if end - i == max_size:
+            dispatch = max(start, arrivals[end - 1])
+        else:
+            dispatch = deadline
+
+        bucket = next(b for b in buckets if b >= end - i)
+        done = dispatch + rng.choice(batch_times[bucket])
+        latencies[i:end] = done - arrivals[i:end]
+        free_at = done
+        i = end
+
+    return latencies
+
+
+def evaluate(batch_times, batch_sizes, waits, load):
+    """
+    Throughput and p99 latency of every batching setting for one thread
+    setting.
+
+    Returns
+    -------
+    results : list(dict)
+        One dict per setting with "batch_size", "wait", "throughput"
+        (images per second with full batches) and "p99" (seconds).
+    """
+    results = []
+    for batch_size in batch_sizes:
+        throughput = batch_size / np.median(batch_times[batch_size])
+        for wait in waits:
+            latencies = simulate(batch_times, batch_size, wait, load * throughput)
+            results.append(
+                {
+                    "batch_size": batch_size,
+                    "wait": wait,
+                    "throughput": throughput,
+                    "p99": np.percentile(latencies, 99),
+                }
+            )
+    return results
+
+
+def choose(results, slo=None):
+    """
+    Setting with the highest throughput, the lowest p99 among equals.
+
+    Parameters
+    ----------
+    results : list(dict)
+        Settings measured by evaluate().
+    slo : float
+        Maximum p99 latency in seconds, None for no limit.
+
+    Returns
+    -------
+    result : dict or None
+        Chosen setting, None if none meets the SLO.
+    """
+    candidates = [r for r in results if slo is None or r["p99"] <= slo]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda r: (r["throughput"], -r["p99"]))
+
+
+def default_thread_counts(n_workers):
+    """
+    Powers of two up to the cores available to each worker, and that count.
+    """
+    cores = max(1, len(placement.available_cpus()) // n_workers)
+    counts = {cores}
+    count = 1
+    while count < cores:
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=settings.WORKERS)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--waits-ms", type=float, nargs="+", default=[0, 2, 5, 10, 20])
+    parser.add_argument("--intra-op-threads", type=int, nargs="+")
+    parser.add_argument("--inter-op-threads", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--load", type=float, default=0.7, help="share of the throughput offered"
+    )
+    parser.add_argument("--slo-ms", type=float, help="maximum p99 latency")
+    parser.add_argument("--output", default=settings.TUNED_SETTINGS_PATH)
+    args = parser.parse_args()
+
+    intra_op_threads = args.intra_op_threads or default_thread_counts(args.workers)
+    waits = [wait / 1000 for wait in args.waits_ms]
+    sizes = sorted(
+        {
+            b
+            for size in args.batch_sizes
+            for b in bucket_sizes(size, settings.ENGINE_BUCKETS)
+        }
+    )
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for intra in intra_op_threads:
+        for inter in args.inter_op_threads:
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                batch_times = pool.submit(
+                    measure_batch_times, intra, inter, sizes, args.repeat
+                ).result()
+
+            for result in evaluate(batch_times, args.batch_sizes, waits, args.load):
+                result.update(intra_op_threads=intra, inter_op_threads=inter)
+                results.append(result)
+                print(
+                    f"threads {intra}/{inter}, batch {result['batch_size']}, "
+                    f"wait {result['wait'] * 1000:g} ms: "
+                    f"{result['throughput']:.1f} images/s, "
+                    f"p99 {result['p99'] * 1000:.0f} ms"
+                )
+
+    slo = args.slo_ms / 1000 if args.slo_ms else None
+    best = choose(results, slo)
+    if best is None:
+        raise SystemExit(f"No setting keeps p99 under {args.slo_ms:g} ms")
+
+    tuned = {
+        "WORKERS": args.workers,
+        "WORKER_INTRA_OP_THREADS": best["intra_op_threads"],
+        "WORKER_INTER_OP_THREADS": best["inter_op_threads"],
+        "BATCH_MAX_SIZE": best["batch_size"],
+        "BATCH_MAX_WAIT": best["wait"],
+        # Measured on this host for a single worker, for reference
+        "throughput": round(best["throughput"], 1),
+        "p99_ms": round(best["p99"] * 1000, 1),
+    }
+    with open(args.output, "w") as f:
+        json.dump(tuned, f, indent=2)
+    print(f"Saved {args.output}: {tuned}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import numpy as np
+import settings
+import tensorflow as tf
+from engine import InferenceEngine
+from tensorflow.keras.applications import MobileNetV2, ResNet50
+
+# ImageNet channel means in BGR order, subtracted by resnet50.preprocess_input
+IMAGENET_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+
+class Backend:
+    """
+    Runs the classifier on batches of preprocessed images. Every backend
+    takes the same input, float32 images with shape (batch, 224, 224, 3)
+    preprocessed like resnet50.preprocess_input, and returns the class
+    probabilities with shape (batch, 1000).
+    """
+
+    def infer(self, x_batch, n=None):
+        """
+        Parameters
+        ----------
+        x_batch : np.ndarray
+            Model input. Only the first `n` rows hold images, backends
+            padding batches may use the rows after them.
+        n : int
+            Number of images in the batch, defaults to all its rows.
+
+        Returns
+        -------
+        probs : np.ndarray
+            Class probabilities for the `n` images.
+        """
+        raise NotImplementedError
+
+    def warm_up(self, batch_sizes):
+        """
+        Run the model once at every batch size it will be given, so tracing,
+        compiling and buffer allocations happen before the first request.
+        """
+        for size in batch_sizes:
+            self.infer(np.zeros((size, 224, 224, 3), dtype=np.float32))
+
+
+class KerasBackend(Backend):
+    """
+    ResNet50 built by Keras, run through the compiled InferenceEngine.
+
+    Parameters
+    ----------
+    weights : str or list
+        "imagenet" to load the pre-trained weights from Keras, or the weight
+        arrays of every layer having weights, in model order (e.g. read by
+        artifact.load_weights()).
+    """
+
+    def __init__(self, weights="imagenet"):
+        if isinstance(weights, list):
+            self.model = ResNet50(include_top=True, weights=None)
+            layers = [layer for layer in self.model.layers if layer.weights]
+            for layer, layer_weights in zip(layers, weights):
+                layer.set_weights(layer_weights)
+        else:
+            self.model = ResNet50(include_top=True, weights=weights)
+
+        self.engine = InferenceEngine(self.model)
+
+    def infer(self, x_batch, n=None):
+        return self.engine.predict(x_batch, n)
+
+
+class MobileNetV2Backend(Backend):
+    """
+    MobileNetV2 built by Keras, 4 to 5 times cheaper than ResNet50 on CPU. It
+    takes the same ResNet50 preprocessed input, converted back to the
+    [-1, 1] RGB range MobileNetV2 expects inside the compiled graph, so
+    the batch buffer isn't copied.
+    """
+
+    def __init__(self, weights="imagenet"):
+        mobilenet = MobileNetV2(include_top=True, weights=weights)
+        inputs = tf.keras.Input((224, 224, 3))
+        # BGR minus mean -> RGB in [0, 255] -> [-1, 1]
+        rgb = tf.keras.layers.Lambda(lambda x: x[..., ::-1] + IMAGENET_MEAN_BGR[::-1])(
+            inputs
+        )
+        scaled = tf.keras.layers.Rescaling(1 / 127.5, offset=-1)(rgb)
+        self.model = tf.keras.Model(inputs, mobilenet(scaled))
+        self.engine = InferenceEngine(self.model)
+
+    def infer(self, x_batch, n=None):
+        return self.engine.predict(x_batch, n)
+
+
+class SavedModelBackend(Backend):
+    """
+    Model exported as a TensorFlow SavedModel by export.py, run through its
+    serving signature. The model doesn't have to be ResNet50 built by Keras.
+    """
+
+    def __init__(self, path=settings.SAVED_MODEL_PATH):
+        self.model = tf.saved_model.load(path)
+        self.forward = self.model.signatures["serving_default"]
+
+    def infer(self, x_batch, n=None):
+        n = len(x_batch) if n is None else n
+        return self.forward(tf.constant(x_batch[:n]))["predictions"].numpy()
+
+
+class OnnxBackend(Backend):
+    """
+    Model exported to ONNX by export.py, run by ONNX Runtime on the CPU.
+
+    Parameters
+    ----------
+    path : str
+        ONNX model file.
+    intra_op_threads : int
+        Threads used by each operator, 0 lets ONNX Runtime use every core.
+    """
+
+    def __init__(self, path=settings.ONNX_MODEL_PATH, intra_op_threads=0):
+        # Only needed by this backend
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def infer(self, x_batch, n=None):
+        n = len(x_batch) if n is None else n
+        x_batch = np.ascontiguousarray(x_batch[:n])
+        return self.session.run(None, {self.input_name: x_batch})[0]
+
+
+def load_backend(name=settings.MODEL_BACKEND, weights="imagenet", intra_op_threads=0):
+    """
+    Build the inference backend called `name`.
+
+    Parameters
+    ----------
+    name : str
+        "keras", "savedmodel" or "onnx".
+    weights : str or list
+        Weights of the Keras backend, see KerasBackend.
+    intra_op_threads : int
+        Threads used by each operator of the ONNX backend, TensorFlow ones
+        are sized with tf.config.threading before the runtime starts.
+
+    Returns
+    -------
+    backend : Backend
+    """
+    if name == "keras":
+        return KerasBackend(weights)
+    if name == "savedmodel":
+        return SavedModelBackend()
+    if name == "onnx":
+        return OnnxBackend(intra_op_threads=intra_op_threads)
+    raise ValueError(f"Unknown model backend {name!r}")
@@ -0,0 +1,63 @@
+"""
+Backend benchmark: throughput of the Keras, SavedModel and ONNX Runtime
+backends on CPU.
+
+Exports the Keras model to a temporary folder, then runs each backend on
+batches of 1 to BATCH_MAX_SIZE images and reports images per second.
+
+💡 NOTE Run with:
+    python3 -m benchmarks.bench_backends
+    python3 -m benchmarks.bench_backends --batch-sizes 1 16 --repeat 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import backends
+import export
+import numpy as np
+
+
+def throughput(backend, x_batch, repeat):
+    """
+    Returns the number of images per second, after a warm-up call.
+    """
+    backend.infer(x_batch)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        backend.infer(x_batch)
+
+    return repeat * len(x_batch) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 16])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    keras = backends.KerasBackend()
+    with tempfile.TemporaryDirectory() as folder:
+        saved_model_path = os.path.join(folder, "savedmodel")
+        onnx_path = os.path.join(folder, "resnet50.onnx")
+        export.export_saved_model(keras.model, saved_model_path)
+        export.export_onnx(keras.model, onnx_path)
+
+        runs = {
+            "keras": keras,
+            "savedmodel": backends.SavedModelBackend(saved_model_path),
+            "onnx": backends.OnnxBackend(onnx_path),
+        }
+
+        rng = np.random.default_rng(0)
+        for batch_size in args.batch_sizes:
+            x_batch = rng.random((batch_size, 224, 224, 3), dtype=np.float32)
+            for name, backend in runs.items():
+                images_per_second = throughput(backend, x_batch, args.repeat)
+                print(f"batch {batch_size} {name}: {images_per_second:.1f} images/s")
+
+
+if __name__ == "__main__":
+    main()
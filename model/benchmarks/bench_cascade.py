@@ -0,0 +1,95 @@
+"""
+Cascade benchmark: ResNet50 alone vs MobileNetV2 first, escalating unsure
+images to ResNet50.
+
+Times each model on batches of 1 to BATCH_MAX_SIZE images and prints the
+escalation rate below which the cascade is faster. With --images, also runs
+the cascade on real images at a few thresholds and reports the escalation
+rate, how often it agrees with ResNet50 alone and the time it saves.
+
+💡 NOTE Run with:
+    python3 -m benchmarks.bench_cascade
+    python3 -m benchmarks.bench_cascade --images /path/to/photos
+"""
+import argparse
+import os
+import time
+
+import backends
+import cascade
+import ml_service
+import numpy as np
+
+
+def median_ms(backend, x_batch, repeat):
+    backend.infer(x_batch)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        backend.infer(x_batch)
+        times.append(time.perf_counter() - start)
+
+    return np.median(times) * 1000
+
+
+def run_images(folder, first_stage, second_stage, thresholds):
+    ml_service.settings.UPLOAD_FOLDER = folder
+    image_names = sorted(os.listdir(folder))
+    x_batch = ml_service.new_batch_buffer(len(image_names))
+    for i, image_name in enumerate(image_names):
+        ml_service.prepare_image(image_name, x_batch[i])
+
+    # One image at a time, like requests arriving on an idle service
+    start = time.perf_counter()
+    expected = [second_stage.infer(x[np.newaxis]).argmax() for x in x_batch]
+    second_stage_seconds = time.perf_counter() - start
+
+    for threshold in thresholds:
+        model_cascade = cascade.Cascade(first_stage, second_stage, threshold)
+        top1, escalated, seconds = [], 0, 0.0
+        for x in x_batch:
+            start = time.perf_counter()
+            probs, stages, _ = model_cascade.infer(x[np.newaxis])
+            seconds += time.perf_counter() - start
+            top1.append(probs[0].argmax())
+            escalated += stages[0] == cascade.SECOND_STAGE
+
+        agreement = np.mean(np.equal(top1, expected))
+        print(
+            f"threshold {threshold}: escalated {escalated / len(x_batch):.1%}, "
+            f"top-1 agreement {agreement:.1%}, "
+            f"time saved {1 - seconds / second_stage_seconds:.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 16])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--images", help="folder with images to classify")
+    parser.add_argument(
+        "--thresholds", type=float, nargs="+", default=[0.3, 0.5, 0.7, 0.9]
+    )
+    args = parser.parse_args()
+
+    first_stage = backends.MobileNetV2Backend()
+    second_stage = backends.KerasBackend()
+
+    rng = np.random.default_rng(0)
+    for batch_size in args.batch_sizes:
+        x_batch = rng.random((batch_size, 224, 224, 3), dtype=np.float32)
+        first_ms = median_ms(first_stage, x_batch, args.repeat)
+        second_ms = median_ms(second_stage, x_batch, args.repeat)
+        print(
+            f"batch {batch_size}: {cascade.FIRST_STAGE} {first_ms:.1f} ms, "
+            f"{cascade.SECOND_STAGE} {second_ms:.1f} ms, cascade faster below "
+            f"{1 - first_ms / second_ms:.0%} escalated"
+        )
+
+    if args.images:
+        run_images(args.images, first_stage, second_stage, args.thresholds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Decode benchmark: keras load_img() vs ml_service.load_image().
+
+Times both decode paths over a folder of large images (by default the test
+dog upscaled to phone photo sizes) and, with --check, runs the model on
+both outputs to count how many top-1 predictions differ.
+
+💡 NOTE Run with:
+    python3 -m benchmarks.bench_decode
+    python3 -m benchmarks.bench_decode --images /path/to/photos --check
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import ml_service
+import numpy as np
+from PIL import Image
+from tensorflow.keras.preprocessing import image
+
+# Common phone camera resolutions (12, 48 and 50 MP)
+SIZES = [(4032, 3024), (8000, 6000), (8160, 6120)]
+
+
+def make_images(folder, source="tests/dog.jpeg"):
+    """
+    Writes the source image upscaled to each of SIZES as JPEG files.
+    """
+    with Image.open(source) as img:
+        img = img.convert("RGB")
+        for width, height in SIZES:
+            img.resize((width, height)).save(
+                os.path.join(folder, f"{width}x{height}.jpeg"), quality=90
+            )
+
+
+def load_img(image_name):
+    img = image.load_img(
+        os.path.join(ml_service.settings.UPLOAD_FOLDER, image_name),
+        target_size=(224, 224),
+    )
+    return image.img_to_array(img)
+
+
+def time_decode(decode, image_names, repeat):
+    """
+    Returns the median time in ms to decode each image and the decoded
+    images.
+    """
+    timings = []
+    for image_name in image_names:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            decoded = decode(image_name)
+            times.append(time.perf_counter() - start)
+        timings.append(np.median(times) * 1000)
+
+    return timings, [decode(image_name) for image_name in image_names]
+
+
+def predict(images):
+    x_batch = ml_service.new_batch_buffer(len(images))
+    for x, out in zip(images, x_batch):
+        ml_service.preprocess_into(x, out)
+    return [top[0] for top in ml_service.predict_images(x_batch)]
+
+
+def run(folder, repeat, check):
+    ml_service.settings.UPLOAD_FOLDER = folder
+    image_names = sorted(os.listdir(folder))
+
+    keras_times, keras_images = time_decode(load_img, image_names, repeat)
+    fast_times, fast_images = time_decode(ml_service.load_image, image_names, repeat)
+
+    for image_name, keras_ms, fast_ms in zip(image_names, keras_times, fast_times):
+        print(
+            f"{image_name}: load_img {keras_ms:.1f} ms, load_image {fast_ms:.1f} ms "
+            f"({keras_ms / fast_ms:.1f}x)"
+        )
+    print(
+        f"total: load_img {sum(keras_times):.1f} ms, "
+        f"load_image {sum(fast_times):.1f} ms"
+    )
+
+    if check:
+        keras_preds = predict(keras_images)
+        fast_preds = predict(fast_images)
+        changed = [
+            (image_name, keras_pred[0], fast_pred[0])
+            for image_name, keras_pred, fast_pred in zip(
+                image_names, keras_preds, fast_preds
+            )
+            if keras_pred[0] != fast_pred[0]
+        ]
+        print(f"top-1 changed on {len(changed)}/{len(image_names)} images {changed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", help="folder with images to decode")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="compare top-1")
+    args = parser.parse_args()
+
+    if args.images:
+        run(args.images, args.repeat, args.check)
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            make_images(folder)
+            run(folder, args.repeat, args.check)
+
+
+if __name__ == "__main__":
+    main()
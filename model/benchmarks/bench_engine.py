@@ -0,0 +1,58 @@
+"""
+Inference benchmark: keras model.predict() vs the compiled InferenceEngine,
+with and without XLA.
+
+Runs ResNet50 on batches of 1 to BATCH_MAX_SIZE images and reports p50 and
+p99 latency of each. Batch sizes between buckets (3, 5, ...) show the cost
+of padding.
+
+💡 NOTE Run with:
+    python3 -m benchmarks.bench_engine
+    python3 -m benchmarks.bench_engine --batch-sizes 1 3 16 --repeat 100
+"""
+import argparse
+import time
+
+import numpy as np
+from backends import KerasBackend
+from engine import InferenceEngine
+
+
+def percentiles(predict, x_batch, repeat):
+    """
+    Returns p50 and p99 latency in ms, after a warm-up call.
+    """
+    predict(x_batch)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict(x_batch)
+        times.append(time.perf_counter() - start)
+
+    return np.percentile(times, 50) * 1000, np.percentile(times, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 3, 8, 16])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    model = KerasBackend().model
+    engines = {
+        "model.predict": lambda x: model.predict(x, verbose=0),
+        "engine": InferenceEngine(model).predict,
+        "engine xla": InferenceEngine(model, jit_compile=True).predict,
+    }
+
+    rng = np.random.default_rng(0)
+    for batch_size in args.batch_sizes:
+        x_batch = rng.random((batch_size, 224, 224, 3), dtype=np.float32)
+        for name, predict in engines.items():
+            p50, p99 = percentiles(predict, x_batch, args.repeat)
+            print(f"batch {batch_size} {name}: p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Memory report for the prefork supervisor.
+
+Starts N workers the way `supervisor.py` does (forked once TensorFlow is
+imported) and N independent processes the way one container per worker does
+(each importing TensorFlow on its own). Only the imported modules are shared
+copy-on-write: in both modes every worker reads the weights itself, from the
+page cache after the first one, into its own TensorFlow variables. Once every
+worker has run a prediction, their memory is read from
+/proc/<pid>/smaps_rollup:
+
+- RSS: resident memory, shared pages counted in full by every process.
+- PSS: shared pages split between the processes sharing them, adding it up
+  gives the real memory used.
+- USS: memory private to the process, what is freed if it exits.
+
+💡 NOTE Run with: python3 -m benchmarks.bench_memory --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+
+def memory_usage(pid):
+    """
+    Returns RSS, PSS and USS in MB for a process.
+    """
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                usage[parts[0].rstrip(":")] = int(parts[1]) / 1024
+
+    return {
+        "rss": usage["Rss"],
+        "pss": usage["Pss"],
+        "uss": usage["Private_Clean"] + usage["Private_Dirty"],
+    }
+
+
+def worker(intra_op_threads, inter_op_threads, ready):
+    """
+    Loads the model like a real worker and runs one prediction so the
+    TensorFlow runtime is fully initialized, then idles until terminated.
+    """
+    import ml_service
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    ml_service.load_model()
+    ml_service.backend.infer(np.zeros((1, 224, 224, 3), "float32"))
+
+    ready.put(os.getpid())
+    while True:
+        time.sleep(1)
+
+
+def measure(mode, n_workers):
+    import artifact
+    import supervisor
+
+    intra_op_threads, inter_op_threads = supervisor.get_thread_counts(n_workers)
+
+    if mode == "prefork":
+        context = multiprocessing.get_context("fork")
+        artifact.verify(artifact.settings.MODEL_WEIGHTS_PATH)
+    else:
+        # A fresh interpreter per worker, like one container per worker
+        context = multiprocessing.get_context("spawn")
+
+    ready = context.Queue()
+    workers = [
+        context.Process(
+            target=worker,
+            args=(intra_op_threads, inter_op_threads, ready),
+            daemon=True,
+        )
+        for _ in range(n_workers)
+    ]
+    for process in workers:
+        process.start()
+    for _ in workers:
+        ready.get()
+
+    usages = [memory_usage(process.pid) for process in workers]
+    # The supervisor shares its modules with the workers, count it in the
+    # total
+    parent_pss = memory_usage(os.getpid())["pss"] if mode == "prefork" else 0.0
+    total_pss = sum(usage["pss"] for usage in usages) + parent_pss
+
+    for process in workers:
+        process.terminate()
+        process.join()
+
+    return {
+        "mode": mode,
+        "workers": n_workers,
+        "rss/worker MB": round(float(np.mean([usage["rss"] for usage in usages])), 1),
+        "pss/worker MB": round(float(np.mean([usage["pss"] for usage in usages])), 1),
+        "uss/worker MB": round(float(np.mean([usage["uss"] for usage in usages])), 1),
+        "supervisor pss MB": round(parent_pss, 1),
+        "total pss MB": round(total_pss, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    # Standalone first, so the forked workers don't inherit its memory
+    for mode in ("standalone", "prefork"):
+        print(measure(mode, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Pinning benchmark: aggregate throughput of N workers running at the same
+time, each pinned to its own set of cores with matching thread pools,
+against unpinned workers with TensorFlow's default thread pools (one
+thread per core each) and unpinned workers with pools split evenly.
+
+💡 NOTE Run with:
+    python3 -m benchmarks.bench_pinning --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import placement
+
+
+def worker(cpus, intra_op_threads, batch_size, seconds, start, results):
+    """
+    Runs batches of random images through ResNet50 for `seconds` once every
+    worker is ready, and reports how many images it classified.
+    """
+    if cpus:
+        placement.pin(cpus)
+
+    import backends
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1 if intra_op_threads else 0)
+
+    backend = backends.KerasBackend(weights=None)
+    x_batch = np.random.default_rng(0).random((batch_size, 224, 224, 3), "float32")
+    backend.infer(x_batch)
+
+    start.wait()
+    images = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        backend.infer(x_batch)
+        images += batch_size
+    results.put(images)
+
+
+def run(mode, n_workers, batch_size, seconds):
+    """
+    Aggregate images per second of `n_workers` workers run in `mode`:
+    "pinned", "split" or "default".
+    """
+    cpus = placement.available_cpus()
+    cpu_sets = placement.split_cpus(cpus, n_workers)
+
+    context = multiprocessing.get_context("spawn")
+    start = context.Barrier(n_workers)
+    results = context.Queue()
+    workers = []
+    for cpu_set in cpu_sets:
+        if mode == "pinned":
+            args = (cpu_set, len(cpu_set))
+        elif mode == "split":
+            args = (None, max(1, len(cpus) // n_workers))
+        else:
+            args = (None, 0)
+        workers.append(
+            context.Process(
+                target=worker, args=args + (batch_size, seconds, start, results)
+            )
+        )
+
+    for process in workers:
+        process.start()
+    images = sum(results.get() for _ in workers)
+    for process in workers:
+        process.join()
+
+    return images / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=20)
+    args = parser.parse_args()
+
+    print(f"{len(placement.available_cpus())} CPUs available to pid {os.getpid()}")
+    for n_workers in args.workers:
+        for mode in ["default", "split", "pinned"]:
+            images_per_second = run(mode, n_workers, args.batch_size, args.seconds)
+            print(f"{n_workers} workers, {mode}: {images_per_second:.1f} images/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Preprocessing benchmark: keras img_to_array() + preprocess_input() vs
+ml_service.preprocess_into() a preallocated batch buffer.
+
+Builds a batch from already decoded images both ways and reports the time
+per image and the peak of temporary memory allocated while doing so,
+counted in image sized float32 arrays (224x224x3x4 bytes).
+
+💡 NOTE Run with:
+    python3 -m benchmarks.bench_preprocess
+    python3 -m benchmarks.bench_preprocess --batch-size 32 --repeat 50
+"""
+import argparse
+import time
+import tracemalloc
+
+import ml_service
+import numpy as np
+from PIL import Image
+from tensorflow.keras.applications.resnet50 import preprocess_input
+from tensorflow.keras.preprocessing import image
+
+IMAGE_BYTES = 224 * 224 * 3 * 4
+
+
+def keras_batch(images):
+    # Previous hot path: float32 copy per image, stacked into a new batch,
+    # then converted to BGR and centered by preprocess_input
+    x_batch = np.stack([image.img_to_array(img) for img in images])
+    return preprocess_input(x_batch)
+
+
+def make_buffer_batch(x_batch):
+    def buffer_batch(images):
+        for img, out in zip(images, x_batch):
+            ml_service.preprocess_into(np.asarray(img), out)
+        return x_batch[: len(images)]
+
+    return buffer_batch
+
+
+def measure(preprocess, images, repeat):
+    """
+    Returns the median time in ms per image and the peak of memory
+    allocated by one call, in image sized float32 arrays.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        preprocess(images)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    preprocess(images)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return np.median(times) * 1000 / len(images), peak / IMAGE_BYTES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = [
+        Image.fromarray(rng.integers(0, 256, (224, 224, 3), dtype=np.uint8))
+        for _ in range(args.batch_size)
+    ]
+    x_batch = ml_service.new_batch_buffer(args.batch_size)
+
+    np.testing.assert_allclose(
+        keras_batch(images), make_buffer_batch(x_batch)(images), rtol=0, atol=1e-4
+    )
+
+    for name, preprocess in [
+        ("img_to_array + preprocess_input", keras_batch),
+        ("preprocess_into buffer", make_buffer_batch(x_batch)),
+    ]:
+        ms, buffers = measure(preprocess, images, args.repeat)
+        print(f"{name}: {ms:.3f} ms/image, peak {buffers:.1f} image buffers allocated")
+
+
+if __name__ == "__main__":
+    main()
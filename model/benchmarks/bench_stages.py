@@ -0,0 +1,281 @@
+"""
+Stage benchmark: latency of each step a prediction goes through, timed on
+its own.
+
+Upload hashing, file write, queue round trip, file read, decode, resize,
+preprocessing, forward pass at several batch sizes and decoding of the
+predictions. The model has random weights and the class names are
+synthetic, so nothing is downloaded. The queue round trip runs against the
+Redis on --redis-port, or the stand-in from stress_test/ when nothing
+listens there.
+
+--save writes the results to a JSON baseline, --compare checks them
+against one and exits with status 1 when a stage got slower than the
+baseline by more than --threshold. Slowdowns under --min-delta-ms are
+ignored: sub-millisecond stages vary by more than 10% from run to run.
+
+💡 NOTE Run with:
+    python3 -m benchmarks.bench_stages --save baseline.json
+    python3 -m benchmarks.bench_stages --compare baseline.json --threshold 0.1
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import backends
+import decoder
+import ml_service
+import numpy as np
+import placement
+import redis
+from PIL import Image
+
+STANDIN_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "stress_test",
+    "redis_standin.py",
+)
+
+
+def measure(run, repeat):
+    """
+    Median and 90th percentile time of `repeat` calls to `run`, in ms,
+    after a warm-up call.
+    """
+    run()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    return {
+        "median_ms": float(np.median(times) * 1000),
+        "p90_ms": float(np.percentile(times, 90) * 1000),
+    }
+
+
+def start_redis(port):
+    """
+    Connect to the Redis listening on `port`, starting the stand-in there
+    when there is none.
+
+    Returns
+    -------
+    db : redis.Redis
+        Client connected to the server.
+    process : subprocess.Popen
+        The stand-in process, None when a server was already running.
+    """
+    process = None
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=1).close()
+    except OSError:
+        process = subprocess.Popen(
+            [sys.executable, STANDIN_PATH, "--port", str(port)],
+            stdout=subprocess.DEVNULL,
+        )
+
+    db = redis.Redis(host="127.0.0.1", port=port)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            db.ping()
+            return db, process
+        except redis.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def queue_round_trip(db, queue_name):
+    """
+    Returns a function sending a job the way the API does and waiting for
+    its result, answered by a thread standing in for the worker.
+    """
+
+    def worker():
+        while True:
+            _, job = db.brpop(queue_name)
+            job = json.loads(job)
+            if job["id"] is None:
+                break
+            with db.pipeline() as pipe:
+                pipe.lpush(job["id"], json.dumps({"prediction": "dog", "score": 1}))
+                pipe.expire(job["id"], 60)
+                pipe.execute()
+
+    def run():
+        job_id = str(uuid.uuid4())
+        job = {"id": job_id, "image_name": "image.jpeg", "time": time.time()}
+        db.lpush(queue_name, json.dumps(job))
+        db.brpop(job_id, timeout=10)
+
+    def stop():
+        db.lpush(queue_name, json.dumps({"id": None}))
+        thread.join()
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    return run, stop
+
+
+def run_stages(image_path, folder, batch_sizes, repeat, db):
+    """
+    Time every stage.
+
+    Returns
+    -------
+    results : dict
+        Median and 90th percentile time in ms of each stage, by name.
+    """
+    results = {}
+
+    with open(image_path, "rb") as f:
+        content = f.read()
+    path = os.path.join(folder, "image" + os.path.splitext(image_path)[1])
+
+    def write():
+        with open(path, "wb") as out_file:
+            out_file.write(content)
+
+    def read():
+        with open(path, "rb") as f:
+            f.read()
+
+    # Same steps as ml_service.load_image(), timed one by one
+    def decode():
+        with Image.open(path) as img:
+            img.draft("RGB", (224, 224))
+            return img.convert("RGB")
+
+    write()
+    img = decode()
+    x = np.asarray(img.resize((224, 224), Image.NEAREST))
+    out = ml_service.new_batch_buffer(1)[0]
+
+    results["upload_hash"] = measure(lambda: hashlib.md5(content).hexdigest(), repeat)
+    results["file_write"] = measure(write, repeat)
+    if db is not None:
+        run, stop = queue_round_trip(db, f"bench_stages:{uuid.uuid4()}")
+        results["queue_round_trip"] = measure(run, repeat)
+        stop()
+    results["file_read"] = measure(read, repeat)
+    results["decode"] = measure(decode, repeat)
+    results["resize"] = measure(lambda: img.resize((224, 224), Image.NEAREST), repeat)
+    results["preprocess"] = measure(lambda: ml_service.preprocess_into(x, out), repeat)
+
+    backend = backends.KerasBackend(weights=None)
+    rng = np.random.default_rng(0)
+    for batch_size in batch_sizes:
+        x_batch = rng.random((batch_size, 224, 224, 3), dtype=np.float32)
+        results[f"forward_batch_{batch_size}"] = measure(
+            lambda: backend.infer(x_batch), repeat
+        )
+
+    probs = rng.dirichlet(np.ones(1000), max(batch_sizes)).astype(np.float32)
+    results["decode_predictions"] = measure(lambda: decoder.decode(probs, 5), repeat)
+
+    return results
+
+
+def compare(results, baseline, threshold, min_delta_ms=0.1):
+    """
+    Print each stage's change against the baseline.
+
+    Returns
+    -------
+    regressions : list(str)
+        Stages whose median time grew by more than `threshold` (e.g. 0.1
+        for 10%) and by more than `min_delta_ms` ms.
+    """
+    regressions = []
+    for stage, timing in results.items():
+        if stage not in baseline:
+            print(f"{stage}: {timing['median_ms']:.3f} ms (not in baseline)")
+            continue
+        before = baseline[stage]["median_ms"]
+        change = timing["median_ms"] / before - 1
+        regressed = change > threshold and timing["median_ms"] - before > min_delta_ms
+        if regressed:
+            regressions.append(stage)
+        print(
+            f"{stage}: {before:.3f} -> {timing['median_ms']:.3f} ms "
+            f"({change:+.1%}){' REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--image", default="tests/dog.jpeg")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 16])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--redis-port", type=int, default=6390)
+    parser.add_argument(
+        "--no-queue", action="store_true", help="skip the queue round trip"
+    )
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON baseline written by --save")
+    parser.add_argument(
+        "--threshold", type=float, default=0.1, help="slowdown flagged, 0.1 is 10%%"
+    )
+    parser.add_argument(
+        "--min-delta-ms", type=float, default=0.1, help="smaller slowdowns ignored"
+    )
+    args = parser.parse_args()
+
+    # Synthetic class names, decoding costs the same as with the real ones
+    decoder.labels = np.array([f"class_{i}" for i in range(1000)])
+
+    db, process = None, None
+    if not args.no_queue:
+        db, process = start_redis(args.redis_port)
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            results = run_stages(args.image, folder, args.batch_sizes, args.repeat, db)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    host = {"cpus": len(placement.available_cpus()), "machine": platform.machine()}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["host"] != host:
+            print(f"Baseline ran on {baseline['host']}, this host is {host}")
+        regressions = compare(
+            results, baseline["stages"], args.threshold, args.min_delta_ms
+        )
+    else:
+        regressions = []
+        for stage, timing in results.items():
+            print(
+                f"{stage}: median {timing['median_ms']:.3f} ms, "
+                f"p90 {timing['p90_ms']:.3f} ms"
+            )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"host": host, "stages": results}, f, indent=2)
+
+    if regressions:
+        print(f"{len(regressions)} stages slower than the baseline: {regressions}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Top-k decoding benchmark: keras decode_predictions() vs decoder.decode().
+
+Decodes random model outputs at batch sizes 1 to 64 and reports the median
+time per batch of both decoders, for top-1 and top-5.
+
+💡 NOTE Run with:
+    python3 -m benchmarks.bench_topk
+    python3 -m benchmarks.bench_topk --repeat 200
+"""
+import argparse
+import time
+
+import decoder
+import numpy as np
+from tensorflow.keras.applications.resnet50 import decode_predictions
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+
+
+def keras_decode(predictions, k):
+    return [
+        [(class_name, round(float(score), 4)) for _, class_name, score in top_preds]
+        for top_preds in decode_predictions(predictions, top=k)
+    ]
+
+
+def time_decode(decode, predictions, k, repeat):
+    """
+    Returns the median time in ms to decode the batch.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(predictions, k)
+        times.append(time.perf_counter() - start)
+
+    return np.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    decoder.load_labels()
+
+    for k in [1, 5]:
+        for batch_size in BATCH_SIZES:
+            # Softmax like outputs, rows sum to 1
+            predictions = rng.random((batch_size, 1000), dtype=np.float32)
+            predictions /= predictions.sum(axis=1, keepdims=True)
+            assert keras_decode(predictions, k) == decoder.decode(predictions, k)
+
+            keras_ms = time_decode(keras_decode, predictions, k, args.repeat)
+            fast_ms = time_decode(decoder.decode, predictions, k, args.repeat)
+            print(
+                f"top-{k} batch {batch_size}: decode_predictions {keras_ms:.3f} ms, "
+                f"decoder.decode {fast_ms:.3f} ms ({keras_ms / fast_ms:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
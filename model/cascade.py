@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+
+# Names reported as the stage answering each prediction
+FIRST_STAGE = "mobilenet_v2"
+SECOND_STAGE = "resnet50"
+
+
+class Cascade:
+    """
+    Runs a cheap model on the whole batch first and escalates to the
+    expensive one only the images it isn't sure about, those whose top-1
+    probability is below `threshold`.
+
+    Parameters
+    ----------
+    first_stage, second_stage : backends.Backend
+        Cheap and expensive backends, taking the same input.
+    threshold : float
+        Minimum top-1 probability of the first stage to keep its answer.
+    """
+
+    def __init__(self, first_stage, second_stage, threshold):
+        self.first_stage = first_stage
+        self.second_stage = second_stage
+        self.threshold = threshold
+
+    def infer(self, x_batch, n=None):
+        """
+        Parameters
+        ----------
+        x_batch : np.ndarray
+            Model input. Only the first `n` rows hold images.
+        n : int
+            Number of images in the batch, defaults to all its rows.
+
+        Returns
+        -------
+        probs : np.ndarray
+            Class probabilities for the `n` images.
+        stages : list(str)
+            Stage whose probabilities were kept for each image.
+        seconds : dict
+            Time spent running each stage on this batch.
+        """
+        n = len(x_batch) if n is None else n
+
+        start = time.perf_counter()
+        probs = self.first_stage.infer(x_batch, n)
+        seconds = {FIRST_STAGE: time.perf_counter() - start, SECOND_STAGE: 0.0}
+
+        unsure = np.flatnonzero(probs.max(axis=1) < self.threshold)
+        if len(unsure):
+            # Second batch made only of the escalated images
+            start = time.perf_counter()
+            probs[unsure] = self.second_stage.infer(x_batch[unsure])
+            seconds[SECOND_STAGE] = time.perf_counter() - start
+
+        stages = [FIRST_STAGE] * n
+        for i in unsure:
+            stages[i] = SECOND_STAGE
+
+        return probs, stages, seconds
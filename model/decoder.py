@@ -0,0 +1,98 @@
+import json
+
+import artifact
+import numpy as np
+import settings
+
+# Class names indexed by model output, loaded by load_labels() on first use
+labels = None
+
+
+def load_labels(path=settings.CLASS_INDEX_PATH):
+    """
+    Load the ImageNet class names into an array indexed by model output, so
+    a whole batch of predictions is decoded with a single lookup.
+
+    Parameters
+    ----------
+    path : str
+        Class index built by artifact.py, verified against its checksum.
+
+    Returns
+    -------
+    labels : np.ndarray
+        Class name of each of the 1000 model outputs.
+    """
+    global labels
+
+    with open(artifact.verify(path)) as f:
+        class_index = json.load(f)  # {"0": ["n01440764", "tench"], ...}
+
+    labels = np.array([class_index[str(i)][1] for i in range(len(class_index))])
+    return labels
+
+
+def top_k(predictions, k=1):
+    """
+    Get the k most likely classes of every prediction in a batch at once.
+    np.argpartition selects them in linear time, only those k are sorted.
+
+    Parameters
+    ----------
+    predictions : np.ndarray
+        Model output, shape (batch, classes).
+    k : int
+        Number of classes to return per prediction.
+
+    Returns
+    -------
+    class_names, scores : tuple(np.ndarray, np.ndarray)
+        Class names and confidence scores, shape (batch, k), most likely
+        class first.
+    """
+    if labels is None:
+        load_labels()
+
+    k = min(k, predictions.shape[1])
+    if k == 1:
+        indices = np.argmax(predictions, axis=1)[:, None]
+        return labels[indices], np.take_along_axis(predictions, indices, axis=1)
+    if k < predictions.shape[1]:
+        indices = np.argpartition(predictions, -k, axis=1)[:, -k:]
+    else:
+        indices = np.broadcast_to(np.arange(k), predictions.shape)
+    scores = np.take_along_axis(predictions, indices, axis=1)
+
+    # Sort the k selected classes by descending score
+    order = np.argsort(-scores, axis=1)
+    indices = np.take_along_axis(indices, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+
+    return labels[indices], scores
+
+
+def decode(predictions, k=1):
+    """
+    Decode a batch of predictions into the top-k classes of each image,
+    with scores rounded as returned by the service.
+
+    Parameters
+    ----------
+    predictions : np.ndarray
+        Model output, shape (batch, classes).
+    k : int
+        Number of classes to return per prediction.
+
+    Returns
+    -------
+    results : list(list(tuple(str, float)))
+        Class name and confidence score of the top-k classes of each
+        image, most likely first.
+    """
+    class_names, scores = top_k(predictions, k)
+    scores = np.round(scores.astype(np.float64), 4)
+
+    return [
+        list(zip(names, row_scores))
+        for names, row_scores in zip(class_names.tolist(), scores.tolist())
+    ]
@@ -0,0 +1,89 @@
+import numpy as np
+import settings
+import tensorflow as tf
+
+
+def bucket_sizes(
+    max_batch_size=settings.BATCH_MAX_SIZE, buckets=settings.ENGINE_BUCKETS
+):
+    """
+    Batch sizes the model is run with, the largest bucket always fits a
+    full batch.
+    """
+    sizes = sorted({b for b in buckets if b < max_batch_size})
+    sizes.append(max_batch_size)
+    return sizes
+
+
+class InferenceEngine:
+    """
+    Runs a Keras model through a tf.function compiled for a fixed input
+    signature, instead of model.predict() which builds a data adapter and
+    a progress bar on every call.
+
+    The function is traced once for any batch size. Batches are padded up
+    to the next of a few bucket sizes, so with XLA there is one compiled
+    program per bucket, and none is compiled again once every bucket has
+    been run.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size=settings.BATCH_MAX_SIZE,
+        buckets=settings.ENGINE_BUCKETS,
+        jit_compile=settings.ENGINE_JIT_COMPILE,
+    ):
+        self.buckets = bucket_sizes(max_batch_size, buckets)
+        self.jit_compile = jit_compile
+        self.forward = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[
+                tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)
+            ],
+            jit_compile=jit_compile,
+        )
+
+    def bucket_size(self, n):
+        """
+        Smallest bucket fitting `n` images.
+        """
+        for bucket in self.buckets:
+            if bucket >= n:
+                return bucket
+        return self.buckets[-1]
+
+    def predict(self, x_batch, n=None):
+        """
+        Run the model on a batch of preprocessed images.
+
+        Parameters
+        ----------
+        x_batch : np.ndarray
+            Model input. Only the first `n` rows hold images, the rows
+            after them are used as padding up to the bucket size without
+            copying the batch.
+        n : int
+            Number of images in the batch, defaults to all its rows.
+
+        Returns
+        -------
+        predictions : np.ndarray
+            Model output for the `n` images.
+        """
+        n = len(x_batch) if n is None else n
+        max_size = self.buckets[-1]
+
+        outputs = []
+        for start in range(0, n, max_size):
+            size = min(n - start, max_size)
+            bucket = self.bucket_size(size)
+            chunk = x_batch[start : start + bucket]
+            if len(chunk) < bucket:
+                # Not enough rows to pad in place
+                padded = np.zeros((bucket,) + chunk.shape[1:], dtype=np.float32)
+                padded[: len(chunk)] = chunk
+                chunk = padded
+            outputs.append(self.forward(chunk).numpy()[:size])
+
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
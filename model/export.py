@@ -0,0 +1,72 @@
+"""
+Export the Keras ResNet50 for the "savedmodel" and "onnx" backends.
+
+💡 NOTE Run with:
+    python3 export.py savedmodel
+    python3 export.py onnx --output models/resnet50.onnx
+"""
+import argparse
+
+import artifact
+import settings
+import tensorflow as tf
+from backends import KerasBackend
+
+
+def serving_function(model):
+    """
+    Forward pass with the input signature every backend shares, returning
+    the class probabilities under "predictions".
+    """
+
+    @tf.function(input_signature=[tf.TensorSpec((None, 224, 224, 3), tf.float32)])
+    def serve(x):
+        return {"predictions": model(x, training=False)}
+
+    return serve
+
+
+def export_saved_model(model, path=settings.SAVED_MODEL_PATH):
+    """
+    Save the model as a TensorFlow SavedModel with a serving signature.
+    """
+    tf.saved_model.save(model, path, signatures=serving_function(model))
+
+
+def export_onnx(model, path=settings.ONNX_MODEL_PATH):
+    """
+    Convert the model to ONNX. tf2onnx graph optimizations are skipped:
+    ONNX Runtime applies its own when the session is created, and some of
+    the tf2onnx ones need several GB of memory on ResNet50.
+    """
+    # Only needed to export, not to serve
+    import tf2onnx
+
+    tf2onnx.convert.from_keras(
+        model,
+        input_signature=[tf.TensorSpec((None, 224, 224, 3), tf.float32, name="input")],
+        opset=13,
+        output_path=path,
+        optimizers={},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("backend", choices=["savedmodel", "onnx"])
+    parser.add_argument("--output", help="defaults to the path in settings")
+    args = parser.parse_args()
+
+    model = KerasBackend(artifact.load_weights()).model
+    if args.backend == "savedmodel":
+        path = args.output or settings.SAVED_MODEL_PATH
+        export_saved_model(model, path)
+    else:
+        path = args.output or settings.ONNX_MODEL_PATH
+        export_onnx(model, path)
+    # Checked by the workers before loading it
+    artifact.write_checksum(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,335 @@
+import contextlib
 import json
 import os
+import queue
+import signal
+import socket
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+import artifact
+import backends
+import cascade
+import decoder
+import engine
 import numpy as np
+import object_store
 import redis
 import settings
-from tensorflow.keras.applications import ResNet50
-from tensorflow.keras.applications.resnet50 import decode_predictions, preprocess_input
-from tensorflow.keras.preprocessing import image
+import tensorflow as tf
+import transport
+from PIL import Image
 
 # Connect to Redis and assign to variable db
 db = redis.Redis(
     host=settings.REDIS_IP, port=settings.REDIS_PORT, db=settings.REDIS_DB_ID
 )
 
-# Load ML model
-model = ResNet50(include_top=True, weights="imagenet")
+# Inference backend running the ML model, loaded by load_model() on first use
+# so a supervisor can fork workers before the TensorFlow runtime starts (it
+# isn't fork-safe)
+backend = None
+# Cheap model answering first when `settings.CASCADE_THRESHOLD` is set
+model_cascade = None
+
+# Where the API stores the images, built on first use like the backend
+# (boto3 clients aren't fork-safe either)
+objects = None
+
+# Set on SIGTERM, the worker finishes its current batch and stops
+stop = threading.Event()
+
+
+@contextlib.contextmanager
+def startup_phase(name):
+    """
+    Log how long a worker startup phase took.
+    """
+    start = time.perf_counter()
+    yield
+    print(f"Worker {os.getpid()}: {name} took {time.perf_counter() - start:.2f}s")
+
+
+def load_model(intra_op_threads=0):
+    """
+    Load the ML model with the backend chosen by `settings.MODEL_BACKEND`,
+    from the local artifacts verified against their checksums.
+
+    Parameters
+    ----------
+    intra_op_threads : int
+        ONNX backend only, threads used by each operator (0 for all cores).
+
+    Returns
+    -------
+    backend : backends.Backend
+        The loaded backend, also kept in the module `backend` variable.
+    """
+    global backend, model_cascade
+
+    weights = None
+    if settings.MODEL_BACKEND == "keras":
+        with startup_phase("reading weights"):
+            weights = artifact.load_weights()
+    elif settings.MODEL_BACKEND == "savedmodel":
+        with startup_phase("verifying artifact"):
+            artifact.verify(settings.SAVED_MODEL_PATH)
+    elif settings.MODEL_BACKEND == "onnx":
+        with startup_phase("verifying artifact"):
+            artifact.verify(settings.ONNX_MODEL_PATH)
+
+    # Read before reporting ready, a missing class index must fail the
+    # startup and not the first batch (supervised workers inherit it)
+    if decoder.labels is None:
+        with startup_phase("reading labels"):
+            decoder.load_labels()
+
+    with startup_phase("building model"):
+        backend = backends.load_backend(
+            settings.MODEL_BACKEND, weights, intra_op_threads
+        )
+        if settings.CASCADE_THRESHOLD > 0:
+            first_stage = backends.MobileNetV2Backend(
+                artifact.verify(settings.CASCADE_WEIGHTS_PATH)
+            )
+            model_cascade = cascade.Cascade(
+                first_stage, backend, settings.CASCADE_THRESHOLD
+            )
+    return backend
+
+
+def warm_up():
+    """
+    Run every loaded model once per bucket size, so the first requests
+    don't pay for tracing the model and allocating its buffers.
+    """
+    batch_sizes = engine.bucket_sizes()
+    backend.warm_up(batch_sizes)
+    if model_cascade is not None:
+        model_cascade.first_stage.warm_up(batch_sizes)
+
+
+def ready_key():
+    """
+    Redis key advertising this worker as ready.
+    """
+    return f"{settings.WORKER_READY_PREFIX}:{socket.gethostname()}:{os.getpid()}"
+
+
+def set_ready():
+    """
+    Advertise this worker as ready for `settings.WORKER_READY_TTL` seconds.
+    """
+    db.set(ready_key(), time.time(), ex=settings.WORKER_READY_TTL)
+
+
+def open_stored(image_name):
+    """
+    Open an image the API stored, see object_store.py.
+    """
+    global objects
+    if objects is None:
+        objects = object_store.load_object_store()
+    return objects.open(image_name)
+
+
+def load_image(image_name):
+    """
+    Load image from the upload store based on the image name received and
+    convert it to a numpy array matching the model input size.
+
+    JPEG images are decoded straight to a reduced resolution (the decoder
+    can downscale by 1/2, 1/4 or 1/8 in the DCT domain), so a phone photo
+    isn't fully decoded just to be resized to 224x224 afterwards.
+
+    Parameters
+    ----------
+    image_name : str or file object
+        Image key in the upload store, or a binary file with the image
+        content when the job carried it (see transport.py).
+
+    Returns
+    -------
+    x : np.ndarray
+        Image as a uint8 RGB array with shape (224, 224, 3).
+
+    Raises
+    ------
+    ValueError
+        If the image has more than `settings.MAX_IMAGE_PIXELS` pixels.
+    """
+    # Read from the upload store unless the job carried the image
+    if isinstance(image_name, str):
+        image_file = open_stored(image_name)
+    else:
+        image_file = contextlib.nullcontext(image_name)
+
+    # Opening only reads the header, check the size before decoding anything
+    with image_file as f, Image.open(f) as img:
+        if img.width * img.height > settings.MAX_IMAGE_PIXELS:
+            raise ValueError(
+                f"Image is {img.width}x{img.height}, more than the "
+                f"{settings.MAX_IMAGE_PIXELS} pixels allowed"
+            )
+
+        # Smallest JPEG scale still at least 224x224, no-op for other formats
+        img.draft("RGB", (224, 224))
+
+        # Same conversion and resampling as keras load_img()
+        img = img.convert("RGB").resize((224, 224), Image.NEAREST)
+
+    # Convert Pillow image to np.array, without copying its pixels
+    return np.asarray(img)
+
+
+def new_batch_buffer(size=None):
+    """
+    Allocate a model input for `size` images, defaults to
+    `settings.BATCH_MAX_SIZE`. Buffers are meant to be reused across batches.
+    Zeroed so rows used as padding never hold NaNs.
+    """
+    return np.zeros((size or settings.BATCH_MAX_SIZE, 224, 224, 3), dtype=np.float32)
+
+
+def preprocess_into(img, out):
+    """
+    Apply the ResNet50 preprocessing (same as resnet50.preprocess_input) to
+    an image, writing the result straight into its slot of a batch buffer.
+    The float conversion, RGB to BGR swap and mean subtraction are done in
+    one vectorized pass per channel, with no temporary array.
+
+    Parameters
+    ----------
+    img : np.ndarray
+        uint8 RGB image with shape (224, 224, 3).
+    out : np.ndarray
+        float32 array with shape (224, 224, 3), e.g. `buffer[i]`.
+
+    Returns
+    -------
+    out : np.ndarray
+        The preprocessed image.
+    """
+    # Channel by channel is ~2.5x faster than subtracting the reversed image
+    # at once, numpy falls back to a slow strided loop for the latter
+    for channel, mean in enumerate(backends.IMAGENET_MEAN_BGR):
+        np.subtract(img[..., 2 - channel], mean, out=out[..., channel])
+    return out
+
+
+def prepare_image(image_name, out):
+    """
+    Load an image and apply the ResNet50 preprocessing, everything that can
+    run before the forward pass.
+
+    Parameters
+    ----------
+    image_name : str or file object
+        Image filename or content, see load_image().
+    out : np.ndarray
+        Slot of a batch buffer receiving the image, shape (224, 224, 3).
+    """
+    preprocess_into(load_image(image_name), out)
+
+
+def prepare_job(job, out):
+    """
+    prepare_image() for the image of a job, read from the uploads folder or
+    from the job itself depending on how the API sent it.
+
+    Parameters
+    ----------
+    job : dict
+        Job taken from the Redis queue.
+    out : np.ndarray
+        Slot of a batch buffer receiving the image, shape (224, 224, 3).
+    """
+    with transport.open_image(job) as image:
+        prepare_image(image, out)
+
+
+def infer(x_batch, n=None):
+    """
+    Run our ML model on a batch of preprocessed images, through the cascade
+    when it's enabled.
+
+    Parameters
+    ----------
+    x_batch : np.ndarray
+        Images filled by prepare_image(), shape (batch, 224, 224, 3).
+    n : int
+        Number of images, when only the first rows of `x_batch` hold them.
+        The rows after them are used to pad the batch.
+
+    Returns
+    -------
+    probs : np.ndarray
+        Class probabilities for the `n` images.
+    stages : list(str)
+        Model which answered for each image.
+    seconds : dict
+        Time spent running each model on this batch.
+    """
+    if backend is None:
+        load_model()
+    if model_cascade is not None:
+        return model_cascade.infer(x_batch, n)
+
+    n = len(x_batch) if n is None else n
+    start = time.perf_counter()
+    probs = backend.infer(x_batch, n)
+    seconds = {cascade.SECOND_STAGE: time.perf_counter() - start}
+    return probs, [cascade.SECOND_STAGE] * n, seconds
+
+
+def predict_images(x_batch, k=1, n=None):
+    """
+    Run our ML model on a batch of preprocessed images and decode the
+    predictions.
+
+    Parameters
+    ----------
+    x_batch : np.ndarray
+        Images filled by prepare_image(), shape (batch, 224, 224, 3).
+    k : int
+        Number of most likely classes to return for each image.
+    n : int
+        Number of images, when only the first rows of `x_batch` hold them.
+
+    Returns
+    -------
+    results : list(list(tuple(str, float)))
+        Top-k classes and confidence scores for each image, most likely
+        first, in batch order.
+    """
+    probs, _, _ = infer(x_batch, n)
+
+    # Decode the whole batch at once
+    return decoder.decode(probs, k)
+
+
+def predict_batch(image_names):
+    """
+    Load a group of images and run our ML model on all of them with a
+    single forward pass.
+
+    Parameters
+    ----------
+    image_names : list(str)
+        Image filenames.
+
+    Returns
+    -------
+    results : list(tuple(str, float))
+        Predicted class and confidence score for each image, in the same
+        order as `image_names`.
+    """
+    x_batch = new_batch_buffer(len(image_names))
+    for i, image_name in enumerate(image_names):
+        prepare_image(image_name, x_batch[i])
+
+    return [top[0] for top in predict_images(x_batch)]
 
 
 def predict(image_name):
@@ -34,74 +348,277 @@ def predict(image_name):
         Model predicted class as a string and the corresponding confidence
         score as a number.
     """
-    class_name = None
-    pred_probability = None
+    return predict_batch([image_name])[0]
+
+
+def get_jobs():
+    """
+    Block until a new job arrives on the Redis queue, then keep collecting
+    waiting jobs until `settings.BATCH_MAX_SIZE` is reached or
+    `settings.BATCH_MAX_WAIT` seconds have passed since the first one.
 
-    # Get image path
-    image_path = os.path.join(settings.UPLOAD_FOLDER, image_name)
+    Returns
+    -------
+    jobs : list(dict)
+        Decoded jobs, oldest first. Empty if no job arrived within
+        `settings.WORKER_POLL_TIMEOUT` seconds.
+    """
+    # Take a new job from Redis (blocks until there is one or time is up)
+    job = db.brpop(settings.REDIS_QUEUE, timeout=settings.WORKER_POLL_TIMEOUT)
+    if job is None:
+        return []
+    jobs = [job[1]]
+
+    deadline = time.monotonic() + settings.BATCH_MAX_WAIT
+    while len(jobs) < settings.BATCH_MAX_SIZE:
+        # Drain as many waiting jobs as still fit in the batch
+        waiting = db.rpop(settings.REDIS_QUEUE, settings.BATCH_MAX_SIZE - len(jobs))
+        if waiting:
+            jobs.extend(waiting)
+            continue
+
+        # Queue is empty, wait a little for more jobs unless time is up
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(remaining, 0.001))
 
-    # Load image
-    img = image.load_img(image_path, target_size=(224, 224))
+    # Decode the JSON data for the given jobs
+    return [json.loads(job.decode("utf-8")) for job in jobs]
 
-    # Apply preprocessing (convert to numpy array, match model input dimensions (including batch) and use the resnet50 preprocessing)
-    # Convert Pillow image to np.array
-    x = image.img_to_array(img)
 
-    # Add an extra dimension because the model is expecting as input a batch of images
-    x_batch = np.expand_dims(x, axis=0)
+def fetch_jobs(decode_pool, decoded, buffers):
+    """
+    Pipeline first stage: take batches of jobs from Redis and hand their
+    images to the `decode_pool`, so they are loaded and preprocessed
+    into a batch buffer while the model works on the previous batch.
 
-    # Scaled pixels values
-    x_batch = preprocess_input(x_batch)
+    Parameters
+    ----------
+    decode_pool : concurrent.futures.ThreadPoolExecutor
+        Pool running prepare_job().
+    decoded : queue.Queue
+        Queue receiving (jobs, buffer, futures) tuples, None once stopped,
+        or the exception that stopped this stage.
+    buffers : queue.Queue
+        Free batch buffers, given back once the model is done with them.
+    """
+    try:
+        next_ready_at = 0
+        while not stop.is_set():
+            # Keep the ready key alive while consuming the queue
+            if time.monotonic() >= next_ready_at:
+                set_ready()
+                next_ready_at = time.monotonic() + settings.WORKER_READY_TTL / 3
 
-    # Make predictions
-    predictions = model.predict(x_batch)
+            # Blocks while every buffer is in use, keeping memory flat
+            buffer = buffers.get()
 
-    # Get predictions using model methods and decode predictions using resnet50 decode_predictions
-    top_pred = decode_predictions(predictions, top=1)[0][0]  # imagenet_id, label, score
-    _, class_name, pred_probability = top_pred
+            jobs = get_jobs()
+            if not jobs:
+                buffers.put(buffer)
+                continue
 
-    # Convert probabilities to float and round it
-    pred_probability = round(float(pred_probability), 4)
+            images = [
+                decode_pool.submit(prepare_job, job, buffer[i])
+                for i, job in enumerate(jobs)
+            ]
+            decoded.put((jobs, buffer, images))
 
-    return class_name, pred_probability
+        # Stopped, no longer ready for new jobs
+        db.delete(ready_key())
+    except Exception as e:
+        # The main thread re-raises it, a worker that lost Redis must crash
+        # and be restarted instead of waiting forever for the next batch
+        decoded.put(e)
+        return
+    decoded.put(None)
+
+
+def store_results(results, errors):
+    """
+    Pipeline last stage: push the job results to Redis using the original
+    job ID as the key, the API is blocked on that list waiting for them.
+    Results expire so abandoned ones don't pile up.
+
+    Parameters
+    ----------
+    results : queue.Queue
+        Bounded queue of (jobs, outputs, seconds) tuples, seconds being the
+        time spent running each model, None once stopped.
+    errors : queue.Queue
+        Receives the exception that stopped this stage, if any.
+    """
+    try:
+        while True:
+            batch = results.get()
+            if batch is None:
+                break
+
+            jobs, outputs, seconds = batch
+            pipe = db.pipeline()
+            for job, output in zip(jobs, outputs):
+                pipe.lpush(job["id"], json.dumps(output))
+                pipe.expire(job["id"], settings.RESULT_TTL)
+            # Count processed jobs, used to measure the workers throughput
+            pipe.incrby(settings.PROCESSED_COUNTER, len(jobs))
+            # Images answered by and time spent in each model, used to
+            # measure the cascade escalation rate and the time it saves
+            for output in outputs:
+                if "stage" in output:
+                    pipe.hincrby(
+                        settings.CASCADE_METRICS, f"answered:{output['stage']}"
+                    )
+            for stage, stage_seconds in seconds.items():
+                pipe.hincrbyfloat(
+                    settings.CASCADE_METRICS, f"seconds:{stage}", stage_seconds
+                )
+            pipe.execute()
+    except Exception as e:
+        # Stop the other stages, the main thread re-raises it once they are
+        # done. Batches still coming are dropped so it never blocks on a
+        # full `results` queue.
+        errors.put(e)
+        stop.set()
+        while results.get() is not None:
+            pass
 
 
 def classify_process():
     """
-    Loop indefinitely asking Redis for new jobs.
-    When a new job arrives, takes it from the Redis queue, uses the loaded ML
-    model to get predictions and stores the results back in Redis using
-    the original job ID so other services can see it was processed and access
-    the results.
+    Loop until asked to stop asking Redis for new jobs.
+    When new jobs arrive, takes up to `settings.BATCH_MAX_SIZE` of them from
+    the Redis queue, uses the loaded ML model to get predictions for all of
+    them at once and pushes each result back to Redis using the original
+    job ID so the API waiting on it gets the results right away.
 
-    Load image from the corresponding folder based on the image name
-    received, then, run our ML model to get predictions.
+    The work is split in stages overlapping each other: a thread fetches
+    jobs and a pool of `settings.PIPELINE_DECODE_THREADS` threads loads and
+    preprocesses their images, this thread runs the model, and another one
+    writes the results. At most `settings.PIPELINE_DEPTH` batches wait
+    between two stages.
+
+    Images are written into a small set of preallocated batch buffers that
+    circulate between the stages, so no batch-sized array is allocated per
+    batch.
+
+    An error in any stage (e.g. Redis going away) stops every stage and is
+    raised here, so the worker exits and gets restarted.
     """
-    while True:
-        # Take a new job from Redis
-        q = db.brpop(settings.REDIS_QUEUE)[1]
+    decoded = queue.Queue(maxsize=settings.PIPELINE_DEPTH)
+    results = queue.Queue(maxsize=settings.PIPELINE_DEPTH)
+    errors = queue.Queue()
+
+    # Enough buffers for the batches waiting to be predicted, the one being
+    # filled and the one in the model
+    buffers = queue.Queue()
+    for _ in range(settings.PIPELINE_DEPTH + 2):
+        buffers.put(new_batch_buffer())
+
+    with ThreadPoolExecutor(settings.PIPELINE_DECODE_THREADS) as decode_pool:
+        # Daemon threads, a failing forward pass must still end the process
+        fetcher = threading.Thread(
+            target=fetch_jobs, args=(decode_pool, decoded, buffers), daemon=True
+        )
+        writer = threading.Thread(
+            target=store_results, args=(results, errors), daemon=True
+        )
+        fetcher.start()
+        writer.start()
+
+        try:
+            while True:
+                batch = decoded.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
 
-        # Decode the JSON data for the given job
-        q = json.loads(q.decode("utf-8"))
+                # Images that can't be loaded get an error instead of a
+                # prediction
+                jobs, buffer, images = batch
+                outputs = [None] * len(jobs)
+                loaded = []
+                for i, img in enumerate(images):
+                    try:
+                        img.result()
+                        loaded.append(i)
+                    except (OSError, ValueError, Image.DecompressionBombError) as e:
+                        outputs[i] = {"error": str(e)}
 
-        # Important! Get and keep the original job ID
-        job_id = q["id"]
+                # Run the loaded ml model on the whole batch, failed images
+                # leave holes in the buffer and only then the batch is copied
+                if loaded:
+                    if len(loaded) == len(jobs):
+                        x_batch = buffer
+                    else:
+                        x_batch = buffer[loaded]
+                    probs, stages, seconds = infer(x_batch, len(loaded))
+                    predictions = decoder.decode(probs, settings.TOP_K)
+                    for i, top, stage in zip(loaded, predictions, stages):
+                        prediction, score = top[0]
+                        outputs[i] = {
+                            "prediction": prediction,
+                            "score": score,
+                            "top": top,
+                            "stage": stage,
+                        }
+                else:
+                    seconds = {}
 
-        # Run the loaded ml model (use the predict() function)
-        prediction, score = predict(q["image_name"])  # 👈 Verify image name
+                buffers.put(buffer)
+                results.put((jobs, outputs, seconds))
+        except BaseException:
+            # Let the fetcher end, the writer is dropped with the process
+            stop.set()
+            raise
 
-        # Prepare a new JSON with the results
-        output = {"prediction": prediction, "score": score}
+        # Let the writer store what's left before returning
+        results.put(None)
+        writer.join()
+        if not errors.empty():
+            raise errors.get()
 
-        # Store the job results on Redis using the original
-        # job ID as the key
-        db.set(job_id, json.dumps(output))
 
-        # Sleep for a bit
-        time.sleep(settings.SERVER_SLEEP)
+def serve(intra_op_threads=0):
+    """
+    Worker entry point: load the model, warm it up and only then start
+    consuming the Redis queue, logging how long each startup phase took.
+
+    Parameters
+    ----------
+    intra_op_threads : int
+        Passed on to load_model().
+    """
+    start = time.perf_counter()
+    load_model(intra_op_threads)
+    with startup_phase("warming up"):
+        warm_up()
+    print(f"Worker {os.getpid()}: ready in {time.perf_counter() - start:.2f}s")
+
+    classify_process()
+
+
+def handle_sigterm(signum, frame):
+    """
+    Stop taking new jobs, the batch being processed is finished first so
+    no job is lost on shutdown.
+    """
+    stop.set()
 
 
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
     # Now launch process
+    # Thread pools can only be sized before the runtime starts, 0 keeps the
+    # TensorFlow defaults
+    tf.config.threading.set_intra_op_parallelism_threads(
+        settings.WORKER_INTRA_OP_THREADS
+    )
+    tf.config.threading.set_inter_op_parallelism_threads(
+        settings.WORKER_INTER_OP_THREADS
+    )
+
     print("Launching ML service...")
-    classify_process()
+    serve(intra_op_threads=settings.WORKER_INTRA_OP_THREADS)
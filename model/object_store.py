@@ -0,0 +1,176 @@
+"""
+Backends the API stores the uploaded images in, read here under the key
+sent in each job. Chosen by `settings.STORAGE_BACKEND`, it must match the
+API one:
+
+- "local": files in `settings.UPLOAD_FOLDER`, shared with the API through
+  a volume.
+- "s3": objects in an S3-compatible bucket, read with ranged GETs so only
+  the bytes actually read are transferred.
+"""
+import io
+import os
+
+import boto3
+import settings
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+
+class ObjectStore:
+    """
+    Where the API keeps images.
+    """
+
+    def open(self, key):
+        """
+        Open an object for reading.
+
+        Returns
+        -------
+        file object
+            Seekable binary file.
+
+        Raises
+        ------
+        OSError
+            If the object can't be read, FileNotFoundError if there is no
+            such object, on open or on the first read.
+        """
+        raise NotImplementedError
+
+
+class LocalObjectStore(ObjectStore):
+    """
+    Images stored as files under `settings.UPLOAD_FOLDER`.
+    """
+
+    def open(self, key):
+        return open(os.path.join(settings.UPLOAD_FOLDER, key), "rb")
+
+
+# Same class as in api/app/object_store.py, both services are built from
+# their own folder. Change both, the API tests check they match.
+class S3Reader(io.RawIOBase):
+    """
+    Seekable binary file over an S3 object, every read is a ranged GET of
+    the bytes asked for. Buffered (see S3ObjectStore.open()), the many
+    small reads of e.g. Pillow parsing the header share a single request.
+    Errors are raised as OSError, like reading a local file.
+    """
+
+    def __init__(self, client, bucket, key):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.position = 0
+        # Learnt from the first response
+        self.length = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            if self.length is None:
+                self.length = self.request("head_object")["ContentLength"]
+            offset += self.length
+        self.position = offset
+        return offset
+
+    def request(self, operation, **kwargs):
+        try:
+            return getattr(self.client, operation)(
+                Bucket=self.bucket, Key=self.key, **kwargs
+            )
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(f"No object {self.key}") from e
+            # The range starts past the end
+            if code == "InvalidRange":
+                return None
+            raise OSError(f"Could not read {self.key}: {e}") from e
+        except BotoCoreError as e:
+            raise OSError(f"Could not read {self.key}: {e}") from e
+
+    def read_range(self, last=""):
+        """
+        GET the bytes from the current position to `last` included, to the
+        end by default.
+        """
+        if self.length is not None and self.position >= self.length:
+            return b""
+        response = self.request("get_object", Range=f"bytes={self.position}-{last}")
+        if response is None:
+            return b""
+
+        self.length = int(response["ContentRange"].rsplit("/", 1)[1])
+        data = response["Body"].read()
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        if not len(buffer):
+            return 0
+        data = self.read_range(self.position + len(buffer) - 1)
+        buffer[: len(data)] = data
+        return len(data)
+
+    def readall(self):
+        # A single request, not one per buffer
+        return self.read_range()
+
+
+class S3ObjectStore(ObjectStore):
+    """
+    Images stored in an S3-compatible bucket.
+
+    Parameters
+    ----------
+    bucket : str
+        Bucket name.
+    endpoint_url : str
+        URL of the S3-compatible service, None for AWS.
+    """
+
+    def __init__(
+        self, bucket=settings.S3_BUCKET, endpoint_url=settings.S3_ENDPOINT_URL
+    ):
+        self.bucket = bucket
+        # Credentials are read the usual boto3 way, e.g. AWS_ACCESS_KEY_ID
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=settings.S3_REGION,
+            config=Config(s3={"addressing_style": settings.S3_ADDRESSING_STYLE}),
+        )
+
+    def open(self, key):
+        return io.BufferedReader(
+            S3Reader(self.client, self.bucket, key),
+            buffer_size=settings.S3_READ_SIZE,
+        )
+
+
+def load_object_store(name=settings.STORAGE_BACKEND):
+    """
+    Build the object store called `name`, "local" or "s3".
+
+    Returns
+    -------
+    store : ObjectStore
+    """
+    if name == "local":
+        return LocalObjectStore()
+    if name == "s3":
+        return S3ObjectStore()
+    raise ValueError(f"Unknown storage backend {name!r}")
@@ -0,0 +1,88 @@
+import os
+
+# Linux CPU topology, one folder per logical CPU
+SYSFS_CPU = "/sys/devices/system/cpu"
+
+
+def available_cpus():
+    """
+    Logical CPUs this process may run on. The affinity mask follows
+    container cpusets and taskset, unlike os.cpu_count().
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_topology(cpu):
+    """
+    Socket and physical core of a logical CPU, (0, cpu) when the OS doesn't
+    tell.
+    """
+    path = os.path.join(SYSFS_CPU, f"cpu{cpu}", "topology")
+    try:
+        with open(os.path.join(path, "physical_package_id")) as f:
+            package = int(f.read())
+        with open(os.path.join(path, "core_id")) as f:
+            core = int(f.read())
+    except (OSError, ValueError):
+        return 0, cpu
+    return package, core
+
+
+def split_cpus(cpus, n_sets, topology=cpu_topology):
+    """
+    Split CPUs into disjoint sets of (almost) the same size, one per worker.
+    CPUs are taken socket after socket and core after core, so a set spans
+    as few sockets as possible and hyperthreads of a core stay together.
+
+    Parameters
+    ----------
+    cpus : list(int)
+        Logical CPUs to split.
+    n_sets : int
+        Number of sets.
+    topology : function
+        Returns the (socket, core) of a logical CPU.
+
+    Returns
+    -------
+    cpu_sets : list(list(int))
+        CPUs of each set. With more sets than CPUs, sets get one CPU each
+        and CPUs are shared.
+    """
+    ordered = sorted(cpus, key=lambda cpu: (topology(cpu), cpu))
+    if n_sets > len(ordered):
+        return [[ordered[i % len(ordered)]] for i in range(n_sets)]
+
+    size, extra = divmod(len(ordered), n_sets)
+    cpu_sets = []
+    start = 0
+    for i in range(n_sets):
+        end = start + size + (i < extra)
+        cpu_sets.append(ordered[start:end])
+        start = end
+    return cpu_sets
+
+
+def pin(cpus):
+    """
+    Restrict the current process to `cpus`, and size OpenMP thread pools
+    (used by some oneDNN builds) to match. Must run before any runtime
+    creates its threads.
+    """
+    os.sched_setaffinity(0, cpus)
+    os.environ["OMP_NUM_THREADS"] = str(len(cpus))
+
+
+def format_cpus(cpus):
+    """
+    Compact CPU list, e.g. "0-3,8-11".
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
@@ -1,18 +1,137 @@
+import json
 import os
 
+# Settings tuned for this host by autotune.py, used when they aren't set in
+# the environment
+TUNED_SETTINGS_PATH = os.getenv("TUNED_SETTINGS_PATH", "tuned_settings.json")
+TUNED = {}
+if os.path.exists(TUNED_SETTINGS_PATH):
+    with open(TUNED_SETTINGS_PATH) as f:
+        TUNED = json.load(f)
+
 # We will store images uploaded by the user on this folder
 UPLOAD_FOLDER = "uploads/"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Where the API stores the images (see object_store.py): "local" in
+# UPLOAD_FOLDER, shared through a volume, or "s3" in an S3-compatible bucket
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+S3_BUCKET = os.getenv("S3_BUCKET", "uploads")
+# None for AWS, else the URL of the S3-compatible service
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ADDRESSING_STYLE = os.getenv("S3_ADDRESSING_STYLE", "path")
+# Bytes fetched by each ranged GET, whole canonical images fit in one
+S3_READ_SIZE = int(os.getenv("S3_READ_SIZE", 1024 * 1024))
+
+# Images with more pixels are rejected before being decoded (decompression bombs)
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 100_000_000))
 
 # REDIS
 
 # Queue name
 REDIS_QUEUE = "service_queue"
 # Port
-REDIS_PORT = 6379
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 # DB Id
 REDIS_DB_ID = 0
 # Host IP
 REDIS_IP = os.getenv("REDIS_IP", "redis")
-# Sleep parameters which manages the interval between requests to our redis queue
-SERVER_SLEEP = 0.05
+# Time (in seconds) a result is kept in Redis if nobody picks it up
+RESULT_TTL = int(os.getenv("RESULT_TTL", 60))
+# Counter of jobs processed by all the workers
+PROCESSED_COUNTER = "service_queue:processed"
+
+# Number of most likely classes returned with every prediction
+TOP_K = int(os.getenv("TOP_K", 5))
+
+# BATCHING
+
+# Maximum number of jobs grouped into a single forward pass (1 disables batching)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", TUNED.get("BATCH_MAX_SIZE", 16)))
+# Maximum time (in seconds) to wait for more jobs once the first one arrived
+BATCH_MAX_WAIT = float(os.getenv("BATCH_MAX_WAIT", TUNED.get("BATCH_MAX_WAIT", 0.005)))
+
+# INFERENCE
+
+# Runtime running the model: "keras", "savedmodel" or "onnx" (export.py
+# builds the files of the last two)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "keras")
+# Pre-trained weights read from disk by workers, `python3 artifact.py`
+# downloads them when the image is built
+MODEL_WEIGHTS_PATH = os.getenv(
+    "MODEL_WEIGHTS_PATH", "models/resnet50_weights_tf_dim_ordering_tf_kernels.h5"
+)
+SAVED_MODEL_PATH = os.getenv("SAVED_MODEL_PATH", "models/resnet50_savedmodel")
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "models/resnet50.onnx")
+# Run MobileNetV2 first and escalate to the backend model only the images
+# whose top-1 probability is below this threshold (0 disables the cascade).
+# Change MODEL_VERSION in the API too, cached predictions come from one setup.
+CASCADE_THRESHOLD = float(os.getenv("CASCADE_THRESHOLD", 0))
+CASCADE_WEIGHTS_PATH = os.getenv(
+    "CASCADE_WEIGHTS_PATH",
+    "models/mobilenet_v2_weights_tf_dim_ordering_tf_kernels_1.0_224.h5",
+)
+# ImageNet class names of the model outputs, downloaded with the weights
+CLASS_INDEX_PATH = os.getenv("CLASS_INDEX_PATH", "models/imagenet_class_index.json")
+# Images answered by and time spent in each model of the cascade
+CASCADE_METRICS = "service_queue:cascade"
+# Batch sizes the model is compiled for, batches are padded up to the next one
+# (BATCH_MAX_SIZE is always added)
+ENGINE_BUCKETS = [int(b) for b in os.getenv("ENGINE_BUCKETS", "1,2,4,8").split(",")]
+# Compile the model with XLA (oneDNN kernels are used either way on x86 CPUs)
+ENGINE_JIT_COMPILE = os.getenv("ENGINE_JIT_COMPILE", "0") == "1"
+
+# PIPELINE
+
+# Threads loading and preprocessing images while the model runs
+PIPELINE_DECODE_THREADS = int(os.getenv("PIPELINE_DECODE_THREADS", 2))
+# Maximum number of batches waiting between two pipeline stages
+PIPELINE_DEPTH = int(os.getenv("PIPELINE_DEPTH", 2))
+
+# WORKERS
+
+# Number of worker processes forked by supervisor.py
+WORKERS = int(os.getenv("WORKERS", TUNED.get("WORKERS", 1)))
+# TensorFlow intra-op threads per worker (0 splits the host cores evenly)
+WORKER_INTRA_OP_THREADS = int(
+    os.getenv("WORKER_INTRA_OP_THREADS", TUNED.get("WORKER_INTRA_OP_THREADS", 0))
+)
+# Pin every worker to its own set of cores, thread pools sized to match (sets
+# are sized for MAX_WORKERS)
+WORKER_PINNING = os.getenv("WORKER_PINNING", "0") == "1"
+# TensorFlow inter-op threads per worker
+WORKER_INTER_OP_THREADS = int(
+    os.getenv("WORKER_INTER_OP_THREADS", TUNED.get("WORKER_INTER_OP_THREADS", 1))
+)
+# Time (in seconds) a worker blocks on the queue before checking if it must stop
+WORKER_POLL_TIMEOUT = 1
+# Prefix for the keys set by workers once their model is loaded and warmed up,
+# refreshed while they consume the queue and gone this many seconds after they
+# stop doing so
+WORKER_READY_PREFIX = "service_queue:ready"
+WORKER_READY_TTL = 10
+# Time (in seconds) given to workers to finish their current batch on shutdown
+WORKER_DRAIN_TIMEOUT = 30
+# Time (in seconds) before restarting a worker that crashed soon after
+# starting, doubled on every consecutive crash up to the max. Workers that
+# ran longer than the max are restarted right away.
+WORKER_RESTART_BACKOFF = float(os.getenv("WORKER_RESTART_BACKOFF", 1))
+WORKER_RESTART_BACKOFF_MAX = float(os.getenv("WORKER_RESTART_BACKOFF_MAX", 60))
+
+# AUTOSCALING
+
+# Bounds for the number of workers, autoscaling is enabled when they differ
+MIN_WORKERS = int(os.getenv("MIN_WORKERS", WORKERS))
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", WORKERS))
+# Time (in seconds) between two looks at the queue
+AUTOSCALE_INTERVAL = float(os.getenv("AUTOSCALE_INTERVAL", 2))
+# Add a worker when there are more waiting jobs than this per worker...
+SCALE_UP_QUEUE_DEPTH = int(os.getenv("SCALE_UP_QUEUE_DEPTH", 2 * BATCH_MAX_SIZE))
+# ...or when the oldest waiting job was queued this many seconds ago
+SCALE_UP_QUEUE_AGE = float(os.getenv("SCALE_UP_QUEUE_AGE", 1))
+# Remove a worker once the queue was empty for this many seconds and the
+# remaining workers would be at most this busy handling the current load
+SCALE_DOWN_DELAY = float(os.getenv("SCALE_DOWN_DELAY", 30))
+SCALE_DOWN_UTILIZATION = float(os.getenv("SCALE_DOWN_UTILIZATION", 0.5))
+# Time (in seconds) to wait after scaling before scaling again
+SCALE_COOLDOWN = float(os.getenv("SCALE_COOLDOWN", 10))
@@ -0,0 +1,260 @@
+import multiprocessing
+import os
+import signal
+import time
+
+import artifact
+import decoder
+import ml_service
+import placement
+import redis
+import settings
+import tensorflow as tf
+from autoscaler import Autoscaler, get_queue_metrics
+
+
+def get_thread_counts(n_workers):
+    """
+    Split the host cores between the workers unless the number of threads
+    was set explicitly.
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker processes.
+
+    Returns
+    -------
+    intra_op_threads, inter_op_threads : tuple(int, int)
+        TensorFlow thread pool sizes for each worker.
+    """
+    intra_op_threads = settings.WORKER_INTRA_OP_THREADS
+    if not intra_op_threads:
+        intra_op_threads = max(1, len(placement.available_cpus()) // n_workers)
+
+    return intra_op_threads, settings.WORKER_INTER_OP_THREADS
+
+
+def run_worker(intra_op_threads, inter_op_threads, cpus=None):
+    """
+    Entry point of a forked worker: pins it to its CPUs if given, limits its
+    TensorFlow thread pools, builds the model from the verified artifacts,
+    warms it up and consumes the Redis queue until asked to stop.
+    """
+    signal.signal(signal.SIGTERM, ml_service.handle_sigterm)
+    # Ctrl+C reaches the whole process group, let the supervisor handle it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if cpus:
+        placement.pin(cpus)
+        print(f"Worker {os.getpid()} pinned to CPUs {placement.format_cpus(cpus)}")
+
+    # Thread pools can only be sized before the runtime starts
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    ml_service.serve(intra_op_threads=intra_op_threads)
+
+
+class Supervisor:
+    """
+    Checks the model artifacts once and forks `n_workers` processes
+    consuming the Redis queue, restarting any that die (with a growing delay
+    if they keep crashing on startup). With an autoscaler, workers
+    are added or removed as the queue backs up or empties. On SIGTERM (or
+    SIGINT) every worker finishes its current batch before the supervisor
+    exits.
+
+    With `settings.WORKER_PINNING`, the available CPUs are split into one
+    disjoint set per worker slot, and each worker runs on its own set with
+    thread pools sized to it, so workers never compete for cores.
+
+    Workers share the imported TensorFlow and Keras modules copy-on-write.
+    The weights aren't shared: TensorFlow copies them into each worker's
+    variables, so every worker reads them from the artifact (from the page
+    cache after the first one) and the supervisor keeps no copy.
+    """
+
+    def __init__(self, n_workers=settings.WORKERS, autoscaler=None):
+        self.n_workers = n_workers
+        self.autoscaler = autoscaler
+        # Size thread pools for the largest pool so cores are never shared
+        max_workers = autoscaler.max_workers if autoscaler else n_workers
+        self.intra_op_threads, self.inter_op_threads = get_thread_counts(max_workers)
+        self.cpu_sets = None
+        if settings.WORKER_PINNING:
+            self.cpu_sets = placement.split_cpus(
+                placement.available_cpus(), max_workers
+            )
+        self.workers = []
+        # (time, failures) of the workers waiting to be restarted
+        self.restarts = []
+        # (deadline, worker) of the workers stopped and finishing their batch
+        self.draining = []
+        self.stopping = False
+        self.context = multiprocessing.get_context("fork")
+
+    def start_worker(self, failures=0):
+        """
+        Fork a worker, `failures` being the number of consecutive crashes
+        of the workers it replaces.
+        """
+        intra_op_threads, cpus, slot = self.intra_op_threads, None, None
+        if self.cpu_sets:
+            # First CPU set no running worker is pinned to, taking one of a
+            # draining worker only when no other set is free
+            slots = set(range(len(self.cpu_sets)))
+            slots -= {worker.cpu_slot for worker in self.workers}
+            draining = {worker.cpu_slot for _, worker in self.draining}
+            slot = min(slots - draining or slots)
+            cpus = self.cpu_sets[slot]
+            intra_op_threads = settings.WORKER_INTRA_OP_THREADS or len(cpus)
+
+        worker = self.context.Process(
+            target=run_worker,
+            args=(intra_op_threads, self.inter_op_threads, cpus),
+            daemon=True,
+        )
+        worker.cpu_slot = slot
+        worker.failures = failures
+        worker.started_at = time.monotonic()
+        worker.start()
+        self.workers.append(worker)
+        print(f"Started worker {worker.pid}")
+        return worker
+
+    def schedule_restart(self, worker):
+        """
+        Replace a worker that died. It is restarted right away if it ran for
+        more than `settings.WORKER_RESTART_BACKOFF_MAX` seconds, otherwise
+        after `settings.WORKER_RESTART_BACKOFF` seconds doubled for every
+        consecutive crash, up to the max, so a worker failing on startup
+        (e.g. Redis down) doesn't turn into a fork loop.
+
+        Returns
+        -------
+        delay : float
+            Seconds until the replacement starts.
+        """
+        uptime = time.monotonic() - worker.started_at
+        failures = 0
+        delay = 0.0
+        if uptime < settings.WORKER_RESTART_BACKOFF_MAX:
+            failures = worker.failures + 1
+            delay = min(
+                settings.WORKER_RESTART_BACKOFF * 2 ** (failures - 1),
+                settings.WORKER_RESTART_BACKOFF_MAX,
+            )
+
+        print(
+            f"Worker {worker.pid} exited with code {worker.exitcode}, "
+            f"restarting in {delay:.0f}s"
+        )
+        self.workers.remove(worker)
+        self.restarts.append((time.monotonic() + delay, failures))
+        return delay
+
+    def stop_worker(self, worker):
+        """
+        Ask a worker to drain without waiting for it, reap_workers() collects
+        it once it exits or kills it after `settings.WORKER_DRAIN_TIMEOUT`
+        seconds.
+        """
+        worker.terminate()
+        self.workers.remove(worker)
+        self.draining.append((time.monotonic() + settings.WORKER_DRAIN_TIMEOUT, worker))
+        print(f"Stopping worker {worker.pid}")
+
+    def reap_workers(self):
+        """
+        Collect the draining workers that exited, killing those past their
+        deadline.
+        """
+        now = time.monotonic()
+        for deadline, worker in list(self.draining):
+            if worker.is_alive():
+                if deadline > now:
+                    continue
+                worker.kill()
+            worker.join()
+            self.draining.remove((deadline, worker))
+            print(f"Stopped worker {worker.pid}")
+
+    def scale(self):
+        """
+        Start or stop workers following the autoscaler decision, logging
+        the metrics that triggered it.
+        """
+        try:
+            depth, age, processed = get_queue_metrics(ml_service.db)
+        except redis.exceptions.ConnectionError as e:
+            print(f"Skipping autoscaling, Redis is unreachable: {e}")
+            return
+
+        # Workers waiting to be restarted count as running
+        running = len(self.workers) + len(self.restarts)
+        n_workers, reason = self.autoscaler.decide(running, depth, age, processed)
+        if reason is None:
+            return
+
+        print(f"Scaling from {running} to {n_workers} workers: {reason}")
+        self.n_workers = n_workers
+        while len(self.workers) + len(self.restarts) < n_workers:
+            self.start_worker()
+        # Cancel pending restarts before stopping running workers
+        while self.restarts and len(self.workers) + len(self.restarts) > n_workers:
+            self.restarts.pop()
+        while len(self.workers) > n_workers:
+            # Stop the newest workers first
+            self.stop_worker(self.workers[-1])
+
+    def handle_signal(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+
+        print(
+            f"Launching ML service with {self.n_workers} workers "
+            f"({self.intra_op_threads} intra-op threads each)..."
+        )
+        # Fail before forking if the weights are missing or corrupted, the
+        # workers read them again themselves
+        if settings.MODEL_BACKEND == "keras":
+            artifact.verify(settings.MODEL_WEIGHTS_PATH)
+        # Workers inherit the label table instead of each reading it
+        decoder.load_labels()
+        for _ in range(self.n_workers):
+            self.start_worker()
+
+        next_scale_at = time.monotonic()
+        while not self.stopping:
+            # Replace workers that died unexpectedly, once their delay is up
+            for worker in [w for w in self.workers if not w.is_alive()]:
+                self.schedule_restart(worker)
+            self.reap_workers()
+            now = time.monotonic()
+            for restart in [r for r in self.restarts if r[0] <= now]:
+                self.restarts.remove(restart)
+                self.start_worker(failures=restart[1])
+
+            if self.autoscaler and time.monotonic() >= next_scale_at:
+                self.scale()
+                next_scale_at = time.monotonic() + settings.AUTOSCALE_INTERVAL
+
+            time.sleep(min(1, settings.AUTOSCALE_INTERVAL))
+
+        # Signal every worker so they all drain at the same time
+        for worker in list(self.workers):
+            self.stop_worker(worker)
+        while self.draining:
+            self.reap_workers()
+            time.sleep(0.1)
+
+
+if __name__ == "__main__":
+    if settings.MIN_WORKERS != settings.MAX_WORKERS:
+        Supervisor(settings.MIN_WORKERS, Autoscaler()).run()
+    else:
+        Supervisor().run()
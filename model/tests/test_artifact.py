@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+import artifact
+import backends
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_artifact
+class TestArtifact(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "model")
+        os.makedirs(os.path.join(self.path, "variables"))
+        for name in ["saved_model.pb", "variables/variables.index"]:
+            with open(os.path.join(self.path, name), "wb") as f:
+                f.write(name.encode("utf-8"))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_verify(self):
+        artifact.write_checksum(self.path)
+
+        self.assertEqual(artifact.verify(self.path), self.path)
+
+    def test_verify_corrupted(self):
+        artifact.write_checksum(self.path)
+        with open(os.path.join(self.path, "saved_model.pb"), "ab") as f:
+            f.write(b"\0")
+
+        with self.assertRaises(ValueError):
+            artifact.verify(self.path)
+
+    def test_verify_missing(self):
+        # Never built, or copied without its checksum
+        with self.assertRaises(FileNotFoundError):
+            artifact.verify(self.path)
+        with self.assertRaises(FileNotFoundError):
+            artifact.verify(os.path.join(self.folder.name, "missing.h5"))
+
+    def test_checksum_covers_file_names(self):
+        before = artifact.checksum(self.path)
+        os.rename(
+            os.path.join(self.path, "saved_model.pb"),
+            os.path.join(self.path, "saved_model.pbtxt"),
+        )
+
+        self.assertNotEqual(artifact.checksum(self.path), before)
+
+    def test_load_weights(self):
+        weights = artifact.load_weights()
+        model = backends.load_backend("keras", weights).model
+
+        self.assertEqual(weights[0][0].shape, (7, 7, 3, 64))
+        self.assertEqual(weights[-1][0].shape, (2048, 1000))
+        for expected, actual in zip(weights[-1], model.layers[-1].get_weights()):
+            self.assertTrue((expected == actual).all())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
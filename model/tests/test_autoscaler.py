@@ -0,0 +1,71 @@
+import json
+import unittest
+from unittest import mock
+
+import autoscaler
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_autoscaler
+@mock.patch.multiple(
+    autoscaler.settings,
+    SCALE_UP_QUEUE_DEPTH=10,
+    SCALE_UP_QUEUE_AGE=1,
+    SCALE_DOWN_DELAY=30,
+    SCALE_DOWN_UTILIZATION=0.5,
+    SCALE_COOLDOWN=10,
+)
+class TestAutoscaler(unittest.TestCase):
+    def test_scale_up_on_queue_depth(self):
+        scaler = autoscaler.Autoscaler(min_workers=1, max_workers=4)
+        n_workers, reason = scaler.decide(2, depth=25, age=0.1, processed=0, now=0)
+        self.assertEqual(n_workers, 3)
+        self.assertIn("queue depth 25", reason)
+
+    def test_scale_up_on_queue_age(self):
+        scaler = autoscaler.Autoscaler(min_workers=1, max_workers=4)
+        n_workers, _ = scaler.decide(2, depth=1, age=5, processed=0, now=0)
+        self.assertEqual(n_workers, 3)
+
+    def test_never_above_max_workers(self):
+        scaler = autoscaler.Autoscaler(min_workers=1, max_workers=2)
+        self.assertEqual(scaler.decide(2, 100, 5, 0, now=0), (2, None))
+
+    def test_cooldown(self):
+        scaler = autoscaler.Autoscaler(min_workers=1, max_workers=4)
+        self.assertEqual(scaler.decide(1, 100, 5, 0, now=0)[0], 2)
+        self.assertEqual(scaler.decide(2, 100, 5, 10, now=5), (2, None))
+        self.assertEqual(scaler.decide(2, 100, 5, 20, now=11)[0], 3)
+
+    def test_scale_down_after_idle_delay(self):
+        scaler = autoscaler.Autoscaler(min_workers=1, max_workers=4)
+        self.assertEqual(scaler.decide(3, 0, 0, 0, now=0), (3, None))
+        self.assertEqual(scaler.decide(3, 0, 0, 0, now=20), (3, None))
+        self.assertEqual(scaler.decide(3, 0, 0, 0, now=31)[0], 2)
+        # Cooldown, then the idle queue keeps shrinking the pool
+        self.assertEqual(scaler.decide(2, 0, 0, 0, now=35), (2, None))
+        self.assertEqual(scaler.decide(2, 0, 0, 0, now=45)[0], 1)
+        self.assertEqual(scaler.decide(1, 0, 0, 0, now=100), (1, None))
+
+    def test_no_scale_down_while_load_needs_workers(self):
+        scaler = autoscaler.Autoscaler(min_workers=1, max_workers=4)
+        # Saturated: 2 workers process 20 jobs/s, 10 jobs/s each
+        scaler.decide(2, depth=50, age=0, processed=0, now=0)
+        scaler.decide(2, depth=50, age=0, processed=200, now=10)
+        # Queue empty but still 16 jobs/s arriving, 1 worker can't take it
+        for now in range(20, 100, 10):
+            n_workers, _ = scaler.decide(3, 0, 0, 200 + 16 * (now - 10), now=now)
+            self.assertEqual(n_workers, 3)
+
+    def test_get_queue_metrics(self):
+        db = mock.MagicMock()
+        oldest = json.dumps({"id": "1", "image_name": "dog.jpeg", "time": 100})
+        db.pipeline.return_value.execute.return_value = [3, oldest.encode(), b"42"]
+
+        depth, age, processed = autoscaler.get_queue_metrics(db, now=102.5)
+
+        self.assertEqual((depth, age, processed), (3, 2.5, 42))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,51 @@
+import unittest
+from unittest import mock
+
+import autotune
+import numpy as np
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_autotune
+class TestAutotune(unittest.TestCase):
+    def setUp(self):
+        # 10 ms per batch plus 5 ms per image
+        self.batch_times = {size: [0.01 + 0.005 * size] for size in [1, 2, 4, 8]}
+
+    def test_simulate_single_request(self):
+        latencies = autotune.simulate(self.batch_times, 8, 0.002, rate=0.1)
+
+        # A lone request waits for the window then runs alone
+        self.assertAlmostEqual(np.median(latencies), 0.002 + 0.015)
+        self.assertGreaterEqual(latencies.min(), 0.002 + 0.015 - 1e-9)
+
+    def test_simulate_fills_batches_under_load(self):
+        with mock.patch.object(autotune.settings, "ENGINE_BUCKETS", [1, 2, 4]):
+            # Many more requests than one image at a time can handle
+            batched = autotune.simulate(self.batch_times, 8, 0.002, rate=150)
+            unbatched = autotune.simulate(self.batch_times, 1, 0.002, rate=150)
+
+        self.assertLess(np.percentile(batched, 99), 0.5)
+        self.assertGreater(np.percentile(unbatched, 99), 1)
+
+    def test_choose_highest_throughput(self):
+        results = [
+            {"throughput": 100, "p99": 0.2},
+            {"throughput": 300, "p99": 0.5},
+            {"throughput": 300, "p99": 0.4},
+        ]
+
+        self.assertEqual(autotune.choose(results), results[2])
+        self.assertEqual(autotune.choose(results, slo=0.3), results[0])
+        self.assertIsNone(autotune.choose(results, slo=0.1))
+
+    def test_default_thread_counts(self):
+        with mock.patch.object(
+            autotune.placement, "available_cpus", return_value=list(range(12))
+        ):
+            self.assertEqual(autotune.default_thread_counts(1), [1, 2, 4, 8, 12])
+            self.assertEqual(autotune.default_thread_counts(4), [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+import backends
+import export
+import ml_service
+import numpy as np
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_backends
+class TestBackends(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        cls.keras = backends.KerasBackend()
+
+        ml_service.settings.UPLOAD_FOLDER = "tests"
+        cls.x_batch = ml_service.new_batch_buffer(2)
+        ml_service.prepare_image("dog.jpeg", cls.x_batch[0])
+        cls.expected = cls.keras.infer(cls.x_batch, n=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.folder.cleanup()
+
+    def assert_parity(self, backend):
+        probs = backend.infer(self.x_batch, n=1)
+
+        self.assertEqual(probs.shape, (1, 1000))
+        self.assertEqual(probs[0].argmax(), self.expected[0].argmax())
+        np.testing.assert_allclose(probs, self.expected, rtol=0, atol=1e-4)
+
+    def test_saved_model_parity(self):
+        path = os.path.join(self.folder.name, "savedmodel")
+        export.export_saved_model(self.keras.model, path)
+
+        self.assert_parity(backends.SavedModelBackend(path))
+
+    def test_onnx_parity(self):
+        path = os.path.join(self.folder.name, "resnet50.onnx")
+        export.export_onnx(self.keras.model, path)
+
+        self.assert_parity(backends.OnnxBackend(path))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            backends.load_backend("torch")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,61 @@
+import unittest
+
+import cascade
+import numpy as np
+
+
+class FakeBackend:
+    """
+    Returns fixed probabilities for each row, recording the batches it got.
+    """
+
+    def __init__(self, probs):
+        self.probs = probs
+        self.batches = []
+
+    def infer(self, x_batch, n=None):
+        n = len(x_batch) if n is None else n
+        self.batches.append(x_batch[:n].copy())
+        return self.probs[x_batch[:n, 0, 0, 0].astype(int)].copy()
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_cascade
+class TestCascade(unittest.TestCase):
+    def setUp(self):
+        # Image i has every pixel set to i, so backends can tell them apart
+        self.x_batch = np.arange(5, dtype=np.float32)[:, None, None, None]
+        self.x_batch = np.broadcast_to(self.x_batch, (5, 2, 2, 3)).copy()
+
+        first_probs = np.full((5, 4), 0.1, dtype=np.float32)
+        first_probs[[0, 2], 1] = 0.9  # sure about images 0 and 2 only
+        second_probs = np.full((5, 4), 0.2, dtype=np.float32)
+        second_probs[:, 3] = 0.7
+        self.first_stage = FakeBackend(first_probs)
+        self.second_stage = FakeBackend(second_probs)
+        self.cascade = cascade.Cascade(self.first_stage, self.second_stage, 0.8)
+
+    def test_escalates_unsure_images_only(self):
+        probs, stages, seconds = self.cascade.infer(self.x_batch, n=4)
+
+        self.assertEqual(
+            stages, ["mobilenet_v2", "resnet50", "mobilenet_v2", "resnet50"]
+        )
+        self.assertEqual(probs.argmax(axis=1).tolist(), [1, 3, 1, 3])
+        # The second stage only got the unsure images, in a single batch
+        self.assertEqual(len(self.second_stage.batches), 1)
+        self.assertEqual(self.second_stage.batches[0][:, 0, 0, 0].tolist(), [1, 3])
+        self.assertGreater(seconds["resnet50"], 0)
+
+    def test_no_escalation(self):
+        self.cascade.threshold = 0.05
+
+        _, stages, seconds = self.cascade.infer(self.x_batch)
+
+        self.assertEqual(stages, ["mobilenet_v2"] * 5)
+        self.assertEqual(self.second_stage.batches, [])
+        self.assertEqual(seconds["resnet50"], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
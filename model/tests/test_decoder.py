@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import artifact
+import decoder
+import numpy as np
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_decoder
+@mock.patch.object(decoder, "labels", np.array([f"class_{i}" for i in range(1000)]))
+class TestDecoder(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.predictions = rng.random((8, 1000), dtype=np.float32)
+
+    def test_top_k_matches_full_sort(self):
+        class_names, scores = decoder.top_k(self.predictions, k=5)
+
+        expected = np.argsort(-self.predictions, axis=1)[:, :5]
+        self.assertEqual(class_names.shape, (8, 5))
+        np.testing.assert_array_equal(class_names, decoder.labels[expected])
+        np.testing.assert_array_equal(
+            scores, np.take_along_axis(self.predictions, expected, axis=1)
+        )
+
+    def test_top_k_all_classes(self):
+        class_names, scores = decoder.top_k(self.predictions[:2], k=2000)
+
+        self.assertEqual(class_names.shape, (2, 1000))
+        self.assertTrue((np.diff(scores, axis=1) <= 0).all())
+
+    def test_decode(self):
+        predictions = np.zeros((2, 1000), dtype=np.float32)
+        predictions[0, [3, 7]] = [0.6, 0.3]
+        predictions[1, 42] = 0.93456
+
+        results = decoder.decode(predictions, k=2)
+
+        self.assertEqual(results[0], [("class_3", 0.6), ("class_7", 0.3)])
+        self.assertEqual(results[1][0], ("class_42", 0.9346))
+        self.assertIsInstance(results[1][0][1], float)
+
+
+class TestLoadLabels(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "imagenet_class_index.json")
+        with open(self.path, "w") as f:
+            json.dump({"0": ["n01440764", "tench"], "1": ["n01443537", "goldfish"]}, f)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    @mock.patch.object(decoder, "labels", None)
+    def test_load_labels(self):
+        artifact.write_checksum(self.path)
+
+        labels = decoder.load_labels(self.path)
+
+        np.testing.assert_array_equal(labels, ["tench", "goldfish"])
+        self.assertIs(decoder.labels, labels)
+
+    @mock.patch.object(decoder, "labels", None)
+    def test_load_labels_not_built(self):
+        # Read from the artifacts only, never downloaded
+        with self.assertRaises(FileNotFoundError):
+            decoder.load_labels(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
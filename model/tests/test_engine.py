@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+import tensorflow as tf
+from engine import InferenceEngine
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_engine
+class TestInferenceEngine(unittest.TestCase):
+    def setUp(self):
+        # Small model, the engine doesn't depend on the architecture
+        tf.keras.utils.set_random_seed(0)
+        self.model = tf.keras.Sequential(
+            [
+                tf.keras.Input((8, 8, 3)),
+                tf.keras.layers.Conv2D(4, 3),
+                tf.keras.layers.GlobalAveragePooling2D(),
+                tf.keras.layers.Dense(10, activation="softmax"),
+            ]
+        )
+        self.engine = InferenceEngine(self.model, max_batch_size=16, buckets=[1, 4])
+        self.x = np.random.default_rng(0).random((40, 8, 8, 3), dtype=np.float32)
+
+    def test_buckets_end_with_max_batch_size(self):
+        self.assertEqual(self.engine.buckets, [1, 4, 16])
+        self.assertEqual(self.engine.bucket_size(3), 4)
+        self.assertEqual(self.engine.bucket_size(5), 16)
+
+    def test_predict_matches_model(self):
+        expected = self.model.predict(self.x[:3], verbose=0)
+        np.testing.assert_allclose(self.engine.predict(self.x[:3]), expected, atol=1e-6)
+
+    def test_predict_pads_with_next_rows(self):
+        predictions = self.engine.predict(self.x, n=3)
+
+        self.assertEqual(predictions.shape, (3, 10))
+        expected = self.model.predict(self.x[:3], verbose=0)
+        np.testing.assert_allclose(predictions, expected, atol=1e-6)
+
+    def test_predict_splits_batches_over_max_size(self):
+        predictions = self.engine.predict(self.x)
+
+        self.assertEqual(predictions.shape, (40, 10))
+        expected = self.model.predict(self.x, verbose=0)
+        np.testing.assert_allclose(predictions, expected, atol=1e-6)
+
+    def test_no_retracing(self):
+        for n in [1, 2, 3, 4, 5, 16]:
+            self.engine.predict(self.x[:n])
+
+        self.assertEqual(self.engine.forward.experimental_get_tracing_count(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
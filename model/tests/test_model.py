@@ -1,6 +1,14 @@
+import json
+import os
+import tempfile
 import unittest
+from unittest import mock
 
 import ml_service
+import numpy as np
+from PIL import Image
+from tensorflow.keras.applications.resnet50 import preprocess_input
+from tensorflow.keras.preprocessing import image
 
 
 # 💡 NOTE Run test with:
@@ -13,6 +21,248 @@ class TestMLService(unittest.TestCase):
         self.assertEqual(class_name, "Eskimo_dog")
         self.assertAlmostEqual(pred_probability, 0.9346, 5)
 
+    def test_predict_batch(self):
+        ml_service.settings.UPLOAD_FOLDER = "tests"
+        results = ml_service.predict_batch(["dog.jpeg", "dog.jpeg"])
+        self.assertEqual(len(results), 2)
+        for class_name, pred_probability in results:
+            self.assertEqual(class_name, "Eskimo_dog")
+            self.assertAlmostEqual(pred_probability, 0.9346, 4)
+
+    def test_load_image_large_jpeg_same_top1(self):
+        # Phone-sized photo, decoded at a reduced scale by load_image()
+        with tempfile.TemporaryDirectory() as folder:
+            Image.open("tests/dog.jpeg").convert("RGB").resize((4000, 3000)).save(
+                os.path.join(folder, "dog.jpeg")
+            )
+            ml_service.settings.UPLOAD_FOLDER = folder
+            x = ml_service.load_image("dog.jpeg")
+            reference = image.img_to_array(
+                image.load_img(os.path.join(folder, "dog.jpeg"), target_size=(224, 224))
+            )
+
+        self.assertEqual(x.shape, (224, 224, 3))
+        x_batch = ml_service.new_batch_buffer(2)
+        ml_service.preprocess_into(x, x_batch[0])
+        ml_service.preprocess_into(reference, x_batch[1])
+        fast, full = ml_service.predict_images(x_batch)
+        self.assertEqual(fast[0][0], full[0][0])
+
+    def test_preprocess_into_matches_preprocess_input(self):
+        img = np.random.default_rng(0).integers(0, 256, (224, 224, 3), np.uint8)
+        x_batch = ml_service.new_batch_buffer(4)
+
+        out = ml_service.preprocess_into(img, x_batch[2])
+
+        self.assertTrue(np.shares_memory(out, x_batch))
+        expected = preprocess_input(img.astype(np.float32))
+        np.testing.assert_allclose(x_batch[2], expected, rtol=0, atol=1e-4)
+
+    def test_load_image_too_many_pixels(self):
+        ml_service.settings.UPLOAD_FOLDER = "tests"
+        with mock.patch.object(ml_service.settings, "MAX_IMAGE_PIXELS", 100):
+            with self.assertRaises(ValueError):
+                ml_service.load_image("dog.jpeg")
+
+    def test_get_jobs(self):
+        jobs = [json.dumps({"id": str(i), "image_name": "dog.jpeg"}) for i in range(5)]
+        jobs = [job.encode("utf-8") for job in jobs]
+        with mock.patch.object(ml_service, "db") as mock_db, mock.patch.multiple(
+            ml_service.settings, BATCH_MAX_SIZE=4, BATCH_MAX_WAIT=1
+        ):
+            mock_db.brpop.return_value = (b"service_queue", jobs[0])
+            mock_db.rpop.side_effect = [jobs[1:3], None, jobs[3:4]]
+            batch = ml_service.get_jobs()
+
+        self.assertEqual([job["id"] for job in batch], ["0", "1", "2", "3"])
+
+    def test_get_jobs_empty_queue(self):
+        with mock.patch.object(ml_service, "db") as mock_db:
+            mock_db.brpop.return_value = None
+            self.assertEqual(ml_service.get_jobs(), [])
+            mock_db.rpop.assert_not_called()
+
+    def test_classify_process(self):
+        jobs = [{"id": str(i), "image_name": "dog.jpeg"} for i in range(3)]
+
+        def get_jobs():
+            if ml_service.stop.is_set():
+                return []
+            ml_service.stop.set()
+            return jobs
+
+        with mock.patch.object(ml_service, "db") as mock_db, mock.patch.multiple(
+            ml_service,
+            get_jobs=get_jobs,
+            prepare_image=mock.MagicMock(),
+            infer=mock.MagicMock(
+                return_value=(
+                    np.zeros((3, 1000)),
+                    ["mobilenet_v2", "resnet50", "mobilenet_v2"],
+                    {"mobilenet_v2": 0.1, "resnet50": 0.2},
+                )
+            ),
+        ), mock.patch.object(
+            ml_service.decoder,
+            "decode",
+            return_value=[[("Eskimo_dog", 0.9346), ("husky", 0.05)]] * 3,
+        ) as decode:
+            ml_service.classify_process()
+            ml_service.stop.clear()
+
+            x_batch, n = ml_service.infer.call_args.args
+            self.assertEqual(len(x_batch), ml_service.settings.BATCH_MAX_SIZE)
+            self.assertEqual(n, 3)
+            self.assertEqual(decode.call_args.args[1], ml_service.settings.TOP_K)
+            pipe = mock_db.pipeline.return_value
+            self.assertEqual(pipe.lpush.call_count, 3)
+            job_id, output = pipe.lpush.call_args.args
+            self.assertEqual(job_id, "2")
+            output = json.loads(output)
+            self.assertEqual(output["prediction"], "Eskimo_dog")
+            self.assertEqual(output["score"], 0.9346)
+            self.assertEqual(output["top"], [["Eskimo_dog", 0.9346], ["husky", 0.05]])
+            self.assertEqual(output["stage"], "mobilenet_v2")
+            pipe.hincrby.assert_any_call(
+                ml_service.settings.CASCADE_METRICS, "answered:resnet50"
+            )
+            pipe.hincrbyfloat.assert_any_call(
+                ml_service.settings.CASCADE_METRICS, "seconds:mobilenet_v2", 0.1
+            )
+            pipe.execute.assert_called_once()
+            # Advertised as ready while consuming the queue only
+            mock_db.set.assert_called_once_with(
+                ml_service.ready_key(),
+                mock.ANY,
+                ex=ml_service.settings.WORKER_READY_TTL,
+            )
+            mock_db.delete.assert_called_once_with(ml_service.ready_key())
+
+    def test_classify_process_image_error(self):
+        jobs = [{"id": "0", "image_name": "dog.jpeg"}, {"id": "1", "image_name": "x"}]
+
+        def get_jobs():
+            if ml_service.stop.is_set():
+                return []
+            ml_service.stop.set()
+            return jobs
+
+        def prepare_image(image_name, out):
+            if image_name == "x":
+                raise ValueError("Image is too large")
+            out[:] = 1
+
+        with mock.patch.object(ml_service, "db") as mock_db, mock.patch.multiple(
+            ml_service,
+            get_jobs=get_jobs,
+            prepare_image=prepare_image,
+            infer=mock.MagicMock(
+                return_value=(np.zeros((1, 1000)), ["resnet50"], {"resnet50": 0.1})
+            ),
+        ), mock.patch.object(
+            ml_service.decoder, "decode", return_value=[[("Eskimo_dog", 0.9346)]]
+        ):
+            ml_service.classify_process()
+            ml_service.stop.clear()
+
+            x_batch, n = ml_service.infer.call_args.args
+            self.assertEqual(x_batch.shape, (1, 224, 224, 3))
+            self.assertEqual(n, 1)
+            self.assertTrue((x_batch == 1).all())
+            outputs = {
+                call.args[0]: json.loads(call.args[1])
+                for call in mock_db.pipeline.return_value.lpush.call_args_list
+            }
+            self.assertEqual(outputs["0"]["prediction"], "Eskimo_dog")
+            self.assertEqual(outputs["1"], {"error": "Image is too large"})
+
+    def test_classify_process_fetch_error(self):
+        self.addCleanup(ml_service.stop.clear)
+
+        with mock.patch.object(ml_service, "db") as mock_db, mock.patch.object(
+            ml_service, "get_jobs", side_effect=ml_service.redis.ConnectionError
+        ):
+            # Raised instead of waiting forever for a batch
+            with self.assertRaises(ml_service.redis.ConnectionError):
+                ml_service.classify_process()
+
+        self.assertTrue(ml_service.stop.is_set())
+        mock_db.pipeline.assert_not_called()
+
+    def test_classify_process_store_error(self):
+        self.addCleanup(ml_service.stop.clear)
+        jobs = [{"id": str(i), "image_name": "dog.jpeg"} for i in range(2)]
+        batches = [jobs] * 5
+
+        def get_jobs():
+            return batches.pop() if batches else []
+
+        with mock.patch.object(ml_service, "db") as mock_db, mock.patch.multiple(
+            ml_service,
+            get_jobs=get_jobs,
+            prepare_image=mock.MagicMock(),
+            infer=mock.MagicMock(
+                return_value=(np.zeros((2, 1000)), ["resnet50"] * 2, {})
+            ),
+        ), mock.patch.object(
+            ml_service.decoder, "decode", return_value=[[("Eskimo_dog", 0.9)]] * 2
+        ):
+            mock_db.pipeline.return_value.execute.side_effect = (
+                ml_service.redis.ConnectionError
+            )
+
+            # More batches than fit in the pipeline, none of them blocks
+            with self.assertRaises(ml_service.redis.ConnectionError):
+                ml_service.classify_process()
+
+        self.assertTrue(ml_service.stop.is_set())
+        mock_db.pipeline.return_value.execute.assert_called_once()
+
+    def test_serve_warms_up_before_consuming(self):
+        calls = mock.MagicMock()
+        with mock.patch.multiple(
+            ml_service,
+            load_model=calls.load_model,
+            warm_up=calls.warm_up,
+            classify_process=calls.classify_process,
+        ):
+            ml_service.serve(intra_op_threads=2)
+
+        self.assertEqual(
+            calls.mock_calls,
+            [
+                mock.call.load_model(2),
+                mock.call.warm_up(),
+                mock.call.classify_process(),
+            ],
+        )
+
+    def test_load_model_reads_labels(self):
+        with mock.patch.object(ml_service.decoder, "labels", None), mock.patch.object(
+            ml_service.decoder, "load_labels"
+        ) as load_labels, mock.patch.object(
+            ml_service.backends, "load_backend"
+        ), mock.patch.object(
+            ml_service.artifact, "load_weights"
+        ), mock.patch.object(
+            ml_service, "backend"
+        ):
+            ml_service.load_model()
+
+        load_labels.assert_called_once_with()
+
+    def test_warm_up_every_bucket(self):
+        with mock.patch.multiple(
+            ml_service, backend=mock.MagicMock(), model_cascade=mock.MagicMock()
+        ):
+            ml_service.warm_up()
+
+            sizes = ml_service.engine.bucket_sizes()
+            self.assertEqual(sizes[-1], ml_service.settings.BATCH_MAX_SIZE)
+            ml_service.backend.warm_up.assert_called_once_with(sizes)
+            first_stage = ml_service.model_cascade.first_stage
+            first_stage.warm_up.assert_called_once_with(sizes)
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
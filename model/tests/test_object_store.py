@@ -0,0 +1,83 @@
+import importlib.util
+import io
+import os
+import unittest
+from unittest import mock
+
+import ml_service
+import object_store
+from PIL import Image
+
+STANDIN_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "stress_test",
+    "s3_standin.py",
+)
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_object_store
+class TestS3ObjectStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The S3 stand-in lives next to the Redis one, outside the ML image
+        if not os.path.exists(STANDIN_PATH):
+            raise unittest.SkipTest("S3 stand-in not available")
+        spec = importlib.util.spec_from_file_location("s3_standin", STANDIN_PATH)
+        s3_standin = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(s3_standin)
+        cls.server = s3_standin.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        env = {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test"}
+        with mock.patch.dict(os.environ, env):
+            self.objects = object_store.S3ObjectStore(
+                "uploads", self.server.endpoint_url
+            )
+        self.objects.client.create_bucket(Bucket="uploads")
+        self.server.store.reset_stats()
+
+    def tearDown(self):
+        self.server.store.buckets.clear()
+
+    def test_open_ranged_reads(self):
+        content = os.urandom(5000)
+        self.objects.client.put_object(Bucket="uploads", Key="ab/cd/x", Body=content)
+
+        with mock.patch.object(object_store.settings, "S3_READ_SIZE", 1024):
+            with self.objects.open("ab/cd/x") as f:
+                self.assertEqual(f.read(10), content[:10])
+                f.seek(3000)
+                self.assertEqual(f.read(), content[3000:])
+
+        # One buffer, then the rest at once
+        self.assertEqual(self.server.store.calls["get_object"], 2)
+        self.assertEqual(self.server.store.net_output, 1024 + 2000)
+
+    def test_open_missing(self):
+        with self.assertRaises(FileNotFoundError):
+            with self.objects.open("ab/cd/x") as f:
+                f.read()
+
+    def test_load_image(self):
+        jpeg = io.BytesIO()
+        Image.new("RGB", (640, 480), (200, 30, 30)).save(jpeg, format="JPEG")
+        self.objects.client.put_object(
+            Bucket="uploads", Key="ab/cd/abcd.jpg", Body=jpeg.getvalue()
+        )
+
+        with mock.patch.object(ml_service, "objects", self.objects):
+            x = ml_service.load_image("ab/cd/abcd.jpg")
+
+        self.assertEqual(x.shape, (224, 224, 3))
+        self.assertEqual(self.server.store.calls["get_object"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
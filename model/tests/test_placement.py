@@ -0,0 +1,41 @@
+import unittest
+
+import placement
+
+
+def two_sockets(cpu):
+    # 2 sockets x 2 cores x 2 hyperthreads, siblings numbered like Linux does
+    # (cpu and cpu + 4 share a core)
+    return (cpu % 4) // 2, cpu % 2
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_placement
+class TestPlacement(unittest.TestCase):
+    def test_split_keeps_sockets_and_cores_together(self):
+        cpu_sets = placement.split_cpus(range(8), 2, two_sockets)
+
+        self.assertEqual(cpu_sets, [[0, 4, 1, 5], [2, 6, 3, 7]])
+        self.assertEqual({two_sockets(cpu)[0] for cpu in cpu_sets[0]}, {0})
+
+    def test_split_disjoint_and_uneven(self):
+        cpu_sets = placement.split_cpus(range(8), 3, two_sockets)
+
+        self.assertEqual([len(cpus) for cpus in cpu_sets], [3, 3, 2])
+        self.assertEqual(sorted(sum(cpu_sets, [])), list(range(8)))
+
+    def test_split_more_sets_than_cpus(self):
+        self.assertEqual(placement.split_cpus([0, 1], 3), [[0], [1], [0]])
+
+    def test_format_cpus(self):
+        self.assertEqual(placement.format_cpus([8, 0, 1, 2, 3, 9, 5]), "0-3,5,8-9")
+
+    def test_available_cpus(self):
+        cpus = placement.available_cpus()
+
+        self.assertTrue(cpus)
+        self.assertLessEqual(len(cpus), placement.os.cpu_count())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
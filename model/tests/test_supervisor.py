@@ -0,0 +1,122 @@
+import unittest
+from unittest import mock
+
+import supervisor
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_supervisor
+class TestSupervisor(unittest.TestCase):
+    def test_get_thread_counts_splits_cores(self):
+        with mock.patch.object(
+            supervisor.placement, "available_cpus", return_value=list(range(8))
+        ):
+            with mock.patch.object(supervisor.settings, "WORKER_INTRA_OP_THREADS", 0):
+                self.assertEqual(supervisor.get_thread_counts(4)[0], 2)
+                self.assertEqual(supervisor.get_thread_counts(16)[0], 1)
+
+    def test_get_thread_counts_explicit(self):
+        with mock.patch.object(supervisor.settings, "WORKER_INTRA_OP_THREADS", 3):
+            self.assertEqual(supervisor.get_thread_counts(4)[0], 3)
+
+    def test_pinned_workers_get_disjoint_cpus(self):
+        with mock.patch.object(
+            supervisor.settings, "WORKER_PINNING", True
+        ), mock.patch.object(
+            supervisor.settings, "WORKER_INTRA_OP_THREADS", 0
+        ), mock.patch.object(
+            supervisor.placement, "available_cpus", return_value=list(range(4))
+        ), mock.patch.object(
+            supervisor.placement, "cpu_topology", side_effect=lambda cpu: (0, cpu)
+        ):
+            sup = supervisor.Supervisor(n_workers=2)
+        sup.context = mock.MagicMock()
+        sup.context.Process.side_effect = lambda **kwargs: mock.MagicMock(**kwargs)
+
+        first, second = sup.start_worker(), sup.start_worker()
+        self.assertEqual(first.args, (2, sup.inter_op_threads, [0, 1]))
+        self.assertEqual(second.args[2], [2, 3])
+
+        # A replacement takes the CPUs left by the worker it replaces
+        sup.workers.remove(first)
+        self.assertEqual(sup.start_worker().args[2], [0, 1])
+
+    def test_restart_backoff(self):
+        sup = supervisor.Supervisor(n_workers=1)
+
+        def crash(failures, uptime):
+            worker = mock.MagicMock(failures=failures)
+            worker.started_at = supervisor.time.monotonic() - uptime
+            sup.workers.append(worker)
+            return sup.schedule_restart(worker)
+
+        with mock.patch.object(
+            supervisor.settings, "WORKER_RESTART_BACKOFF", 1
+        ), mock.patch.object(supervisor.settings, "WORKER_RESTART_BACKOFF_MAX", 60):
+            # Crashing on startup, the delay doubles up to the max
+            self.assertEqual(crash(0, uptime=0.5), 1)
+            self.assertEqual(crash(1, uptime=0.5), 2)
+            self.assertEqual(crash(3, uptime=0.5), 8)
+            self.assertEqual(crash(10, uptime=0.5), 60)
+            # Ran for a while, replaced right away
+            self.assertEqual(crash(10, uptime=120), 0)
+
+        self.assertEqual(sup.workers, [])
+        self.assertEqual([failures for _, failures in sup.restarts], [1, 2, 4, 11, 0])
+
+    def test_restart_waits_for_backoff(self):
+        sup = supervisor.Supervisor(n_workers=1)
+        sup.context = mock.MagicMock()
+        worker = sup.start_worker(failures=2)
+        worker.is_alive.return_value = False
+
+        def run_once(seconds):
+            sup.stopping = True
+
+        with mock.patch.object(
+            supervisor.time, "sleep", side_effect=run_once
+        ), mock.patch.object(supervisor.artifact, "verify"), mock.patch.object(
+            supervisor.decoder, "load_labels"
+        ), mock.patch.object(
+            supervisor.Supervisor, "start_worker"
+        ) as start_worker, mock.patch.object(
+            supervisor.signal, "signal"
+        ):
+            sup.n_workers = 0
+            sup.run()
+
+        # Dead on startup, not forked again before its delay is up
+        start_worker.assert_not_called()
+        self.assertEqual(len(sup.restarts), 1)
+        self.assertEqual(sup.restarts[0][1], 3)
+
+    def test_stop_worker_does_not_wait(self):
+        sup = supervisor.Supervisor(n_workers=2)
+        sup.context = mock.MagicMock()
+        sup.context.Process.side_effect = lambda **kwargs: mock.MagicMock()
+        first, second = sup.start_worker(), sup.start_worker()
+
+        with mock.patch.object(supervisor.settings, "WORKER_DRAIN_TIMEOUT", 30):
+            sup.stop_worker(second)
+            sup.stop_worker(first)
+        first.terminate.assert_called_once_with()
+        second.join.assert_not_called()
+        self.assertEqual(sup.workers, [])
+
+        # Still draining, left alone until its deadline
+        second.is_alive.return_value = True
+        first.is_alive.return_value = False
+        sup.reap_workers()
+        first.join.assert_called_once_with()
+        self.assertEqual([worker for _, worker in sup.draining], [second])
+
+        with mock.patch.object(
+            supervisor.time, "monotonic", return_value=supervisor.time.monotonic() + 31
+        ):
+            sup.reap_workers()
+        second.kill.assert_called_once_with()
+        self.assertEqual(sup.draining, [])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,50 @@
+import base64
+import unittest
+from multiprocessing import shared_memory
+
+import transport
+
+
+# 💡 NOTE Run test with:
+# - python3 -m unittest -vvv tests.test_transport
+class TestTransport(unittest.TestCase):
+    def test_open_image_shared_fs(self):
+        with transport.open_image({"id": "0", "image_name": "dog.jpeg"}) as image:
+            self.assertEqual(image, "dog.jpeg")
+
+    def test_open_image_inband(self):
+        job = {
+            "id": "0",
+            "image_name": "dog.jpeg",
+            "image": base64.b64encode(b"fake-image-data").decode("ascii"),
+        }
+        with transport.open_image(job) as image:
+            self.assertEqual(image.read(), b"fake-image-data")
+
+    def test_open_image_shm(self):
+        block = shared_memory.SharedMemory(create=True, size=64)
+        block.buf[:15] = b"fake-image-data"
+        job = {
+            "id": "0",
+            "image_name": "dog.jpeg",
+            "shm": {"name": block.name, "size": 15},
+        }
+        try:
+            with transport.open_image(job) as image:
+                self.assertEqual(image.read(), b"fake-image-data")
+
+            # Still there for the API to free
+            block.buf[0] = 0
+        finally:
+            block.close()
+            block.unlink()
+
+    def test_open_image_shm_freed(self):
+        job = {"id": "0", "image_name": "x", "shm": {"name": "psm_gone", "size": 1}}
+        with self.assertRaises(FileNotFoundError):
+            with transport.open_image(job):
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
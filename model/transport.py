@@ -0,0 +1,42 @@
+import base64
+import contextlib
+import io
+from multiprocessing import resource_tracker, shared_memory
+
+
+@contextlib.contextmanager
+def open_image(job):
+    """
+    Get the image of a job, whichever way the API sent it (its
+    JOB_TRANSPORT setting):
+
+    - "shared_fs": only the name of the image in the shared uploads folder.
+    - "inband": the image bytes base64 encoded in the job, under "image".
+    - "shm": the name and size of a POSIX shared memory block holding the
+      image bytes, under "shm". The API frees it once it has the result.
+
+    Parameters
+    ----------
+    job : dict
+        Job taken from the Redis queue.
+
+    Yields
+    ------
+    image : str or io.BytesIO
+        Image name to read from the uploads folder, or a binary file with
+        the image content.
+    """
+    if "image" in job:
+        yield io.BytesIO(base64.b64decode(job["image"]))
+    elif "shm" in job:
+        block = shared_memory.SharedMemory(job["shm"]["name"])
+        # The API owns the block, it must not be unlinked when this process
+        # exits (Python < 3.13 tracks attached blocks too)
+        resource_tracker.unregister(block._name, "shared_memory")
+        try:
+            # Single copy, out of the block straight into the decoder input
+            yield io.BytesIO(block.buf[: job["shm"]["size"]])
+        finally:
+            block.close()
+    else:
+        yield job["image_name"]
@@ -1,13 +1,97 @@
+import json
+import os
+import threading
+import time
+
 import numpy as np
-from tensorflow.keras.applications.resnet50 import (
-    ResNet50,
-    decode_predictions,
-    preprocess_input,
+import tensorflow as tf
+from tensorflow.keras.applications.resnet50 import ResNet50
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# "keras" runs the float ResNet50, "tflite" the int8 model built by quantize.py
+# (smaller and faster to load, run `python src/quantize.py` first)
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "keras")
+TFLITE_MODEL_PATH = os.getenv(
+    "TFLITE_MODEL_PATH", os.path.join(APP_DIR, "models/resnet50_int8.tflite")
 )
-from tensorflow.keras.preprocessing import image
+# Pre-trained ResNet50 weights, same file Keras downloads for weights="imagenet"
+WEIGHTS_URL = (
+    "https://storage.googleapis.com/tensorflow/keras-applications/resnet/"
+    "resnet50_weights_tf_dim_ordering_tf_kernels.h5"
+)
+WEIGHTS_HASH = "2cb95161c43110f7111970584f804107"
+
+
+def get_model_file(fname, origin, file_hash):
+    """
+    Path of a file kept in the app models folder. It's checked against its
+    hash on every start and only downloaded when missing or corrupted, so
+    the app starts offline once the files are there (`python
+    src/predictor.py` fetches them ahead, e.g. when building the image).
+    """
+    return tf.keras.utils.get_file(
+        fname, origin, cache_dir=APP_DIR, cache_subdir="models", file_hash=file_hash
+    )
+
 
 # Load the model outside the function to ensure it's loaded only once
-model = ResNet50(include_top=True, weights="imagenet")
+start = time.perf_counter()
+if MODEL_FORMAT == "tflite":
+    interpreter = tf.lite.Interpreter(model_path=TFLITE_MODEL_PATH)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]["index"]
+    output_index = interpreter.get_output_details()[0]["index"]
+
+    def forward(x):
+        interpreter.set_tensor(input_index, x)
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index)
+
+else:
+    weights_path = get_model_file(
+        os.path.basename(WEIGHTS_URL), WEIGHTS_URL, WEIGHTS_HASH
+    )
+    model = ResNet50(include_top=True, weights=weights_path)
+
+    # Forward pass compiled once for a single image, model.predict() has a lot
+    # of per call overhead (data adapter, callbacks) for one image
+    compiled_forward = tf.function(
+        lambda x: model(x, training=False),
+        input_signature=[tf.TensorSpec((1, 224, 224, 3), tf.float32)],
+    )
+
+    def forward(x):
+        return compiled_forward(x).numpy()
+
+
+print(f"Loaded {MODEL_FORMAT} model in {time.perf_counter() - start:.2f}s")
+
+# ImageNet class names indexed by model output, loaded once as well from the
+# same file decode_predictions() uses
+class_index_path = get_model_file(
+    "imagenet_class_index.json",
+    "https://storage.googleapis.com/download.tensorflow.org/data/"
+    "imagenet_class_index.json",
+    "c2c37ea517e94d9795004a39431a14cb",
+)
+with open(class_index_path) as f:
+    class_index = json.load(f)  # {"0": ["n01440764", "tench"], ...}
+labels = np.array([class_index[str(i)][1] for i in range(len(class_index))])
+
+# Per-channel ImageNet means in BGR order, as used by ResNet50 "caffe" preprocessing
+IMAGENET_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+# Input buffer reused by every prediction, Streamlit runs sessions in threads
+# (the TFLite interpreter can't run two predictions at once either)
+batch_buffer = np.zeros((1, 224, 224, 3), dtype=np.float32)
+batch_lock = threading.Lock()
+
+# Warm up, the first prediction traces the model (or allocates the TFLite
+# buffers) before the first user waits for it
+start = time.perf_counter()
+forward(batch_buffer)
+print(f"Warmed up the model in {time.perf_counter() - start:.2f}s")
 
 
 def predict_image(img):
@@ -26,25 +110,28 @@ def predict_image(img):
         score as a number.
     """
     # Resize the image to match model input dimensions (224, 224)
-    img = img.resize((224, 224))
-
-    # Convert Pillow image to np.array
-    x = image.img_to_array(img)
+    img = img.convert("RGB").resize((224, 224))
 
-    # Add an extra dimension for the batch size
-    x_batch = np.expand_dims(x, axis=0)
+    with batch_lock:
+        # Apply ResNet50-specific preprocessing (RGB -> BGR, mean subtraction)
+        # channel by channel, straight into the model input buffer
+        x = np.asarray(img)
+        for channel, mean in enumerate(IMAGENET_MEAN_BGR):
+            np.subtract(x[..., 2 - channel], mean, out=batch_buffer[0, ..., channel])
 
-    # Apply ResNet50-specific preprocessing
-    x_batch = preprocess_input(x_batch)
+        # Make predictions
+        predictions = forward(batch_buffer)
 
-    # Make predictions
-    predictions = model.predict(x_batch, verbose=0)
-
-    # Get predictions using model methods and decode predictions
-    top_pred = decode_predictions(predictions, top=1)[0][0]  # imagenet_id, label, score
-    _, class_name, pred_probability = top_pred
+    # Look up the most likely class in the label table
+    top_index = np.argmax(predictions[0])
+    class_name = str(labels[top_index])
+    pred_probability = predictions[0, top_index]
 
     # Convert probability to float and round it
     pred_probability = round(float(pred_probability), 4)
 
     return class_name, pred_probability
+
+
+if __name__ == "__main__":
+    print(f"Model files ready in {os.path.join(APP_DIR, 'models')}")
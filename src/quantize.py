@@ -0,0 +1,149 @@
+"""
+Build the int8 TFLite model used by the predictor with MODEL_FORMAT=tflite.
+
+Quantizes ResNet50 weights and activations to int8 after training,
+calibrating activation ranges on a small set of images (the app examples
+by default), then compares the quantized model with the Keras one on them
+or on a separate evaluation set: top-1 agreement, memory and latency per
+image.
+
+💡 NOTE Run with:
+    python src/quantize.py
+    python src/quantize.py --images /path/to/calibration/images
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from tensorflow.keras.applications.resnet50 import ResNet50, preprocess_input
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(APP_DIR, "assets")
+# Example images shown by the app, used for calibration by default
+SAMPLE_IMAGES = ["animal.jpg", "building.jpg", "object.jpg", "vehicle.jpg"]
+TFLITE_MODEL_PATH = os.path.join(APP_DIR, "models", "resnet50_int8.tflite")
+
+
+def load_images(paths):
+    """
+    Load images preprocessed like predict_image() does, one batch of one
+    image each.
+    """
+    images = []
+    for path in paths:
+        with Image.open(path) as img:
+            x = np.asarray(img.convert("RGB").resize((224, 224)), dtype=np.float32)
+        images.append(preprocess_input(x[np.newaxis]))
+    return images
+
+
+def quantize(model, images):
+    """
+    Convert the model to TFLite with int8 weights and activations. Input
+    and output stay float32, so callers preprocess and decode as before.
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        Float model.
+    images : list(np.ndarray)
+        Preprocessed calibration images, shape (1, 224, 224, 3) each.
+
+    Returns
+    -------
+    tflite_model : bytes
+        Serialized TFLite model.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: ([x] for x in images)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def rss_mb():
+    """
+    Resident memory of this process in MB.
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def median_ms(predict, images):
+    predict(images[0])
+    times = []
+    for x in images:
+        start = time.perf_counter()
+        predict(x)
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", help="folder with calibration images")
+    parser.add_argument(
+        "--eval-images", help="folder with evaluation images (default: --images)"
+    )
+    parser.add_argument("--output", default=TFLITE_MODEL_PATH)
+    args = parser.parse_args()
+
+    if args.images:
+        paths = [os.path.join(args.images, name) for name in os.listdir(args.images)]
+    else:
+        paths = [os.path.join(ASSETS_DIR, name) for name in SAMPLE_IMAGES]
+    images = load_images(sorted(paths))
+    if args.eval_images:
+        names = sorted(os.listdir(args.eval_images))
+        eval_images = load_images([os.path.join(args.eval_images, n) for n in names])
+    else:
+        eval_images = images
+
+    rss = rss_mb()
+    model = ResNet50(include_top=True, weights="imagenet")
+    forward = tf.function(
+        lambda x: model(x, training=False),
+        input_signature=[tf.TensorSpec((1, 224, 224, 3), tf.float32)],
+    )
+    keras_mb = rss_mb() - rss
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "wb") as f:
+        f.write(quantize(model, images))
+
+    rss = rss_mb()
+    interpreter = tf.lite.Interpreter(model_path=args.output)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]["index"]
+    output_index = interpreter.get_output_details()[0]["index"]
+    tflite_mb = rss_mb() - rss
+
+    def tflite_forward(x):
+        interpreter.set_tensor(input_index, x)
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index)
+
+    keras_top1 = [forward(x).numpy().argmax() for x in eval_images]
+    tflite_top1 = [tflite_forward(x).argmax() for x in eval_images]
+    agreement = np.mean(np.equal(keras_top1, tflite_top1))
+
+    keras_ms = median_ms(forward, eval_images)
+    tflite_ms = median_ms(tflite_forward, eval_images)
+    params_mb = model.count_params() * 4 / 2**20
+    print(f"Saved {args.output} ({os.path.getsize(args.output) / 2**20:.1f} MB)")
+    print(f"top-1 agreement: {agreement:.1%} on {len(eval_images)} images")
+    print(
+        f"memory: keras {keras_mb:.0f} MB ({params_mb:.0f} MB of float32 weights), "
+        f"tflite {tflite_mb:.0f} MB"
+    )
+    print(f"latency: keras {keras_ms:.1f} ms/image, tflite {tflite_ms:.1f} ms/image")
+
+
+if __name__ == "__main__":
+    main()
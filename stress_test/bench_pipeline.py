@@ -0,0 +1,266 @@
+"""
+End-to-end benchmark of the queueing path without Docker or a real model.
+
+Starts the Redis stand-in and fake model workers (see fake_worker.py) as
+local subprocesses and runs the FastAPI app in this process, then sends
+concurrent prediction requests through it. Reports requests per second,
+end-to-end latency percentiles, the Redis commands and bytes each request
+costs and the file bytes workers read, so changes to model_predict() and
+classify_process() can be measured on their own. --transports compares the
+ways jobs carry their image (the API JOB_TRANSPORT setting). Run it with
+the API dependencies installed; workers need the ML service ones
+(--worker-python to use another interpreter).
+
+💡 NOTE Run with:
+    python3 stress_test/bench_pipeline.py --requests 1000 --concurrency 64
+    python3 stress_test/bench_pipeline.py --transports shared_fs inband shm
+    python3 stress_test/bench_pipeline.py --redis-port 6379 --no-standin
+"""
+import argparse
+import asyncio
+import collections
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import redis
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(HERE, "..", "api")
+IMAGE_PATH = os.path.join(HERE, "dog.jpeg")
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Nothing listening on port {port}")
+
+
+def wait_for_workers(db, n_workers, timeout=120):
+    """
+    Block until every worker set its ready key.
+    """
+    deadline = time.monotonic() + timeout
+    while len(db.keys("service_queue:ready:*")) < n_workers:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Workers didn't start")
+        time.sleep(0.1)
+
+
+def make_images(n_images, path=IMAGE_PATH, tag="bench"):
+    """
+    Distinct JPEG files: the same image with a different trailer after the
+    end of image marker, decoders ignore it but the content hash changes.
+    """
+    with open(path, "rb") as f:
+        image = f.read()
+    return [image + f"{tag}-{i}".encode("utf-8") for i in range(n_images)]
+
+
+async def send_requests(app, images, n_requests, concurrency):
+    """
+    Send `n_requests` predictions, `concurrency` at a time, cycling through
+    `images`.
+
+    Returns
+    -------
+    latencies : list(float)
+        Seconds taken by each request.
+    errors : collections.Counter
+        Responses that weren't successful, by status code and detail.
+    """
+    from httpx import AsyncClient
+
+    latencies, errors = [], collections.Counter()
+    next_request = iter(range(n_requests))
+
+    async def client(ac):
+        for i in next_request:
+            start = time.perf_counter()
+            response = await ac.post(
+                "/model/predict",
+                files={"file": (f"{i}.jpg", images[i % len(images)], "image/jpeg")},
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors[response.status_code, response.text] += 1
+
+    async with AsyncClient(app=app, base_url="http://bench") as ac:
+        await asyncio.gather(*[client(ac) for _ in range(concurrency)])
+
+    return latencies, errors
+
+
+def bytes_read(pids):
+    """
+    Bytes the processes read from files so far, Linux only. Socket
+    receives and shared memory reads aren't counted.
+    """
+    total = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/io") as f:
+            total += int(
+                next(line for line in f if line.startswith("rchar:")).split()[1]
+            )
+    return total
+
+
+def run_benchmark(args, worker_pids):
+    # The API reads its settings when imported
+    sys.path.insert(0, API_DIR)
+    from app import settings
+    from app.auth.jwt import get_current_user
+    from app.model import services
+    from main import app
+
+    app.dependency_overrides[get_current_user] = lambda: None
+    db = redis.Redis(host="127.0.0.1", port=args.redis_port)
+    wait_for_workers(db, args.workers)
+
+    async def run(images, warm_up):
+        services.connect()
+        try:
+            # Warm up the connection pool and the workers
+            await send_requests(app, warm_up, len(warm_up), args.concurrency)
+            db.execute_command("CONFIG", "RESETSTAT")
+            read_before = bytes_read(worker_pids)
+            start = time.perf_counter()
+            result = await send_requests(app, images, args.requests, args.concurrency)
+            seconds = time.perf_counter() - start
+            return result + (seconds, bytes_read(worker_pids) - read_before)
+        finally:
+            await services.disconnect()
+
+    for transport in args.transports:
+        # Read on every job, images are new for each transport so none is
+        # answered from the cache
+        settings.JOB_TRANSPORT = transport
+        images = make_images(args.images or args.requests, args.image, tag=transport)
+        warm_up = make_images(args.concurrency, args.image, tag=f"warm-up-{transport}")
+        latencies, errors, seconds, worker_read = asyncio.run(run(images, warm_up))
+        calls = {
+            name[len("cmdstat_") :]: stats["calls"]
+            for name, stats in db.info("commandstats").items()
+            if name not in ("cmdstat_info", "cmdstat_config")
+        }
+        net = db.info("stats")
+
+        print(
+            f"{transport}: {args.requests} requests, {args.concurrency} concurrent, "
+            f"{args.workers} workers: {args.requests / seconds:.1f} requests/s, "
+            f"{sum(errors.values())} errors"
+        )
+        for (status_code, detail), count in errors.most_common():
+            print(f"  {count} x {status_code}: {detail}")
+        percentiles = statistics.quantiles(latencies, n=100)
+        p50, p90, p99 = [percentiles[p - 1] * 1000 for p in (50, 90, 99)]
+        print(f"latency p50 {p50:.1f} ms, p90 {p90:.1f} ms, p99 {p99:.1f} ms")
+        redis_in, redis_out, files = [
+            n_bytes / args.requests
+            for n_bytes in (
+                net["total_net_input_bytes"],
+                net["total_net_output_bytes"],
+                worker_read,
+            )
+        ]
+        print(
+            f"bytes per request: Redis in {redis_in:.0f}, Redis out {redis_out:.0f}, "
+            f"read from files by workers {files:.0f}"
+        )
+        print(f"Redis commands per request: {sum(calls.values()) / args.requests:.1f}")
+        for name, count in sorted(calls.items(), key=lambda item: -item[1]):
+            print(f"  {name}: {count / args.requests:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument(
+        "--images", type=int, help="distinct images (default: one per request)"
+    )
+    parser.add_argument("--image", default=IMAGE_PATH, help="JPEG image to send")
+    parser.add_argument(
+        "--transports",
+        nargs="+",
+        default=["shared_fs"],
+        choices=["shared_fs", "inband", "shm"],
+        help="ways jobs carry their image to the workers, run one after another",
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-latency-ms", type=float, default=20)
+    parser.add_argument("--image-latency-ms", type=float, default=5)
+    parser.add_argument("--backend", default="fake", help="see fake_worker.py")
+    parser.add_argument("--worker-python", default=sys.executable)
+    parser.add_argument("--redis-port", type=int, default=6390)
+    parser.add_argument(
+        "--no-standin", action="store_true", help="use a Redis already running"
+    )
+    args = parser.parse_args()
+
+    # Uploads, settings and anything the app writes stay in a scratch folder
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    env = dict(os.environ, REDIS_IP="127.0.0.1", REDIS_PORT=str(args.redis_port))
+    os.environ.update(env)
+    os.chdir(workdir)
+
+    processes = []
+    try:
+        if not args.no_standin:
+            processes.append(
+                subprocess.Popen(
+                    [
+                        sys.executable,
+                        os.path.join(HERE, "redis_standin.py"),
+                        "--port",
+                        str(args.redis_port),
+                    ],
+                    stdout=subprocess.DEVNULL,
+                )
+            )
+        wait_for_port(args.redis_port)
+        redis.Redis(host="127.0.0.1", port=args.redis_port).flushall()
+
+        for _ in range(args.workers):
+            processes.append(
+                subprocess.Popen(
+                    [
+                        args.worker_python,
+                        os.path.join(HERE, "fake_worker.py"),
+                        "--backend",
+                        args.backend,
+                        "--batch-latency-ms",
+                        str(args.batch_latency_ms),
+                        "--image-latency-ms",
+                        str(args.image_latency_ms),
+                        # The API sends image paths relative to its upload
+                        # folder, "uploads" in its working directory
+                        "--upload-folder",
+                        os.path.join(workdir, "uploads"),
+                    ],
+                    env=env,
+                    stdout=subprocess.DEVNULL,
+                )
+            )
+
+        worker_pids = [process.pid for process in processes[-args.workers :]]
+        run_benchmark(args, worker_pids)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Upload store benchmark: throughput of the object storage backends.
+
+Stores distinct copies of an image through each backend the way the API
+does, a received upload moved into the store, then reads them back the way
+workers do, whole and header only (what Pillow reads to check the image
+size), --threads at a time. The "s3" backend runs against the S3 stand-in
+(s3_standin.py) started in this process, or the service at --endpoint-url,
+and reports the requests and bytes each image costs. Run it with the API
+dependencies installed, workers read with the same code (model/
+object_store.py).
+
+💡 NOTE Run with:
+    python3 stress_test/bench_storage.py --backends local s3
+    python3 stress_test/bench_storage.py --pad-to 20000000 --images 20
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import s3_standin
+from bench_pipeline import API_DIR, IMAGE_PATH, make_images
+from PIL import Image
+
+
+def run_phase(pool, function, n_images):
+    """
+    Call `function` on every image index through `pool`.
+
+    Returns
+    -------
+    float
+        Seconds taken by all the calls.
+    """
+    start = time.perf_counter()
+    list(pool.map(function, range(n_images)))
+    return time.perf_counter() - start
+
+
+def run_backend(objects, images, threads, server=None):
+    """
+    Time storing, reading and deleting `images` with an object store.
+
+    Returns
+    -------
+    results : dict
+        Seconds taken by each phase, by name, and when `server` (the S3
+        stand-in) is given, its request and byte counts per phase.
+    """
+    from app import settings
+
+    keys = [f"{i:02x}/{i:04x}.jpg" for i in range(len(images))]
+
+    def spool(images):
+        # What utils.spool_upload() leaves, not timed
+        paths = []
+        for content in images:
+            with tempfile.NamedTemporaryFile(
+                dir=settings.UPLOAD_FOLDER, suffix=".part", delete=False
+            ) as f:
+                f.write(content)
+            paths.append(f.name)
+        return paths
+
+    def put(i):
+        objects.put(paths[i], keys[i])
+
+    def read(i):
+        with objects.open(keys[i]) as f:
+            f.read()
+
+    def read_header(i):
+        with objects.open(keys[i]) as f, Image.open(f) as img:
+            return img.size
+
+    phases = {
+        "put": put,
+        # Same images again, only checked for
+        "put_existing": put,
+        "read": read,
+        "read_header": read_header,
+        "remove": lambda i: objects.remove(keys[i]),
+    }
+
+    results = {}
+    with ThreadPoolExecutor(threads) as pool:
+        for phase, function in phases.items():
+            if phase.startswith("put"):
+                paths = spool(images)
+            if server is not None:
+                server.store.reset_stats()
+            results[phase] = {"seconds": run_phase(pool, function, len(keys))}
+            if server is not None:
+                results[phase].update(
+                    requests=sum(server.store.calls.values()),
+                    bytes_in=server.store.net_input,
+                    bytes_out=server.store.net_output,
+                )
+    return results
+
+
+def report(backend, results, images):
+    n_images = len(images)
+    n_bytes = sum(len(content) for content in images)
+    print(f"{backend}: {n_images} images of {n_bytes / n_images / 1e6:.2f} MB")
+    for phase, result in results.items():
+        seconds = result["seconds"]
+        line = f"  {phase}: {n_images / seconds:.0f} images/s"
+        if phase in ("put", "read"):
+            line += f", {n_bytes / seconds / 1e6:.1f} MB/s"
+        if "requests" in result:
+            line += (
+                f", per image {result['requests'] / n_images:.1f} requests, "
+                f"{(result['bytes_in'] + result['bytes_out']) / n_images:.0f} bytes"
+            )
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["local", "s3"])
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--image", default=IMAGE_PATH)
+    parser.add_argument(
+        "--pad-to", type=int, default=0, help="grow images to this many bytes"
+    )
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--endpoint-url", help="S3 service, the stand-in if unset")
+    parser.add_argument("--bucket", default="bench-storage")
+    args = parser.parse_args()
+
+    # Decoders ignore what follows the image, padding keeps it valid
+    images = [
+        content + b"\0" * (args.pad_to - len(content))
+        for content in make_images(args.images, args.image, "bench_storage")
+    ]
+
+    # The API reads its settings when imported, uploads stay in a scratch
+    # folder
+    workdir = tempfile.mkdtemp(prefix="bench_storage_")
+    os.chdir(workdir)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    sys.path.insert(0, API_DIR)
+    from app import object_store, settings
+
+    settings.S3_MAX_CONNECTIONS = max(settings.S3_MAX_CONNECTIONS, args.threads)
+
+    server = None
+    try:
+        for backend in args.backends:
+            if backend == "local":
+                objects = object_store.LocalObjectStore()
+            else:
+                if args.endpoint_url is None:
+                    server = s3_standin.start()
+                objects = object_store.S3ObjectStore(
+                    args.bucket, args.endpoint_url or server.endpoint_url
+                )
+                objects.client.create_bucket(Bucket=args.bucket)
+
+            results = run_backend(objects, images, args.threads, server)
+            report(backend, results, images)
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+ML service worker with a fake model, for benchmarks of the queueing path.
+
+Runs the real worker pipeline (taking jobs from Redis, decoding images,
+batching, storing results) with a stand-in model that sleeps for a fixed
+time per batch plus per image and returns random probabilities, so no
+model is downloaded and the overhead around the model can be measured.
+Any other backend can be plugged in with --backend module:Class.
+
+💡 NOTE Run with:
+    python3 stress_test/fake_worker.py --batch-latency-ms 20 --image-latency-ms 5
+"""
+import argparse
+import importlib
+import os
+import signal
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "model")
+)
+
+import backends  # noqa: E402
+import decoder  # noqa: E402
+import ml_service  # noqa: E402
+import numpy as np  # noqa: E402
+
+
+class FakeBackend(backends.Backend):
+    """
+    Model taking `batch_latency + n * image_latency` seconds per batch of
+    `n` images.
+    """
+
+    def __init__(self, batch_latency=0.02, image_latency=0.005, classes=1000):
+        self.batch_latency = batch_latency
+        self.image_latency = image_latency
+        self.probs = np.random.default_rng(0).dirichlet(np.ones(classes), 64)
+
+    def infer(self, x_batch, n=None):
+        n = len(x_batch) if n is None else n
+        time.sleep(self.batch_latency + n * self.image_latency)
+        return self.probs[np.arange(n) % len(self.probs)].astype(np.float32)
+
+
+def load_backend(spec, batch_latency, image_latency):
+    """
+    FakeBackend for "fake", otherwise the backend class named "module:Class".
+    """
+    if spec == "fake":
+        return FakeBackend(batch_latency, image_latency)
+    module, name = spec.split(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", default="fake")
+    parser.add_argument("--batch-latency-ms", type=float, default=20)
+    parser.add_argument("--image-latency-ms", type=float, default=5)
+    parser.add_argument(
+        "--upload-folder", help="folder the API image names are relative to"
+    )
+    args = parser.parse_args()
+
+    if args.upload_folder:
+        ml_service.settings.UPLOAD_FOLDER = args.upload_folder
+    # Synthetic class names, the real ones are a model artifact
+    decoder.labels = np.array([f"class_{i}" for i in range(1000)])
+    ml_service.backend = load_backend(
+        args.backend, args.batch_latency_ms / 1000, args.image_latency_ms / 1000
+    )
+
+    signal.signal(signal.SIGTERM, ml_service.handle_sigterm)
+    ml_service.classify_process()
+
+
+if __name__ == "__main__":
+    main()
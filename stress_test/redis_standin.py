@@ -0,0 +1,495 @@
+"""
+Redis stand-in for local benchmarks of the queueing path.
+
+A single-process server speaking the Redis protocol, implementing the
+commands the API and the ML service use, so both run their real clients
+against it without Docker. Data lives in memory, expired keys are dropped
+when read.
+
+Like Redis, it counts the calls to every command and the bytes exchanged:
+`CONFIG RESETSTAT` clears the counts, `INFO commandstats` and `INFO stats`
+report them, so benchmarks read them the same way from a real server.
+
+💡 NOTE Run with: python3 stress_test/redis_standin.py --port 6390
+"""
+import argparse
+import asyncio
+import collections
+import contextvars
+import fnmatch
+import time
+
+# Reader of the connection the running command came from
+client = contextvars.ContextVar("client")
+
+
+class Store:
+    """
+    Keys and their values: bytes, deque (lists, head on the left), dict
+    (hashes), set (sets) or dict of member to score (sorted sets).
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        # Clients blocked on BRPOP, woken up by LPUSH on their keys
+        self.waiters = collections.defaultdict(set)
+        self.calls = collections.Counter()
+        # Bytes received and sent, INFO stats total_net_*_bytes
+        self.net_input = 0
+        self.net_output = 0
+
+    def get(self, key, default=None):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.delete(key)
+        return self.data.get(key, default)
+
+    def delete(self, key):
+        self.expires.pop(key, None)
+        return self.data.pop(key, None) is not None
+
+    def setdefault(self, key, value):
+        current = self.get(key)
+        if current is None:
+            self.data[key] = current = value
+        return current
+
+    def notify(self, key):
+        for waiter in self.waiters.pop(key, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def command(*names):
+    """
+    Register a handler for Redis commands.
+    """
+
+    def register(handler):
+        for name in names:
+            COMMANDS[name] = handler
+        return handler
+
+    return register
+
+
+COMMANDS = {}
+
+
+def number(value):
+    # Scores and counters come back the way Redis formats them
+    return int(value) if value == int(value) else value
+
+
+@command(b"PING")
+async def ping(store, args):
+    return Simple(b"PONG")
+
+
+@command(b"GET")
+async def get(store, args):
+    return store.get(args[0])
+
+
+@command(b"SET")
+async def set_(store, args):
+    key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+    if b"NX" in options and store.get(key) is not None:
+        return None
+    store.delete(key)
+    store.data[key] = value
+    for option, unit in [(b"EX", 1), (b"PX", 0.001)]:
+        if option in options:
+            seconds = int(args[2 + options.index(option) + 1]) * unit
+            store.expires[key] = time.monotonic() + seconds
+    return Simple(b"OK")
+
+
+@command(b"DEL")
+async def delete(store, args):
+    return sum(store.delete(key) for key in args if store.get(key) is not None)
+
+
+@command(b"EXPIRE")
+async def expire(store, args):
+    if store.get(args[0]) is None:
+        return 0
+    store.expires[args[0]] = time.monotonic() + int(args[1])
+    return 1
+
+
+@command(b"KEYS")
+async def keys(store, args):
+    pattern = args[0].decode("utf-8")
+    return [
+        key
+        for key in list(store.data)
+        if store.get(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern)
+    ]
+
+
+@command(b"INCR", b"INCRBY")
+async def incrby(store, args):
+    value = int(store.get(args[0], b"0")) + (int(args[1]) if len(args) > 1 else 1)
+    store.data[args[0]] = str(value).encode("utf-8")
+    return value
+
+
+@command(b"DECRBY")
+async def decrby(store, args):
+    return await incrby(store, [args[0], b"%d" % -int(args[1])])
+
+
+@command(b"LPUSH")
+async def lpush(store, args):
+    values = store.setdefault(args[0], collections.deque())
+    values.extendleft(args[1:])
+    store.notify(args[0])
+    return len(values)
+
+
+@command(b"RPOP")
+async def rpop(store, args):
+    values = store.get(args[0])
+    if len(args) == 1:
+        return values.pop() if values else None
+    if not values:
+        return NullArray()
+    popped = [values.pop() for _ in range(min(int(args[1]), len(values)))]
+    if not values:
+        store.delete(args[0])
+    return popped
+
+
+@command(b"BRPOP")
+async def brpop(store, args):
+    keys, timeout = args[:-1], float(args[-1])
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        # A client gone while blocked mustn't take the value: Redis drops
+        # its BRPOP when the connection closes
+        if client.get().at_eof():
+            return NullArray()
+        for key in keys:
+            values = store.get(key)
+            if values:
+                value = values.pop()
+                if not values:
+                    store.delete(key)
+                return [key, value]
+
+        waiter = asyncio.get_running_loop().create_future()
+        for key in keys:
+            store.waiters[key].add(waiter)
+        try:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return NullArray()
+            await asyncio.wait_for(waiter, remaining)
+        except asyncio.TimeoutError:
+            return NullArray()
+        finally:
+            for key in keys:
+                store.waiters[key].discard(waiter)
+
+
+@command(b"LLEN")
+async def llen(store, args):
+    return len(store.get(args[0], ()))
+
+
+@command(b"LINDEX")
+async def lindex(store, args):
+    values = store.get(args[0], ())
+    index = int(args[1])
+    return values[index] if -len(values) <= index < len(values) else None
+
+
+@command(b"HINCRBY", b"HINCRBYFLOAT")
+async def hincrby(store, args):
+    fields = store.setdefault(args[0], {})
+    value = number(float(fields.get(args[1], b"0")) + float(args[2]))
+    fields[args[1]] = str(value).encode("utf-8")
+    return value if isinstance(value, int) else fields[args[1]]
+
+
+@command(b"HGETALL")
+async def hgetall(store, args):
+    return [item for pair in store.get(args[0], {}).items() for item in pair]
+
+
+@command(b"HGET")
+async def hget(store, args):
+    return store.get(args[0], {}).get(args[1])
+
+
+@command(b"HSETNX")
+async def hsetnx(store, args):
+    fields = store.setdefault(args[0], {})
+    if args[1] in fields:
+        return 0
+    fields[args[1]] = args[2]
+    return 1
+
+
+@command(b"HEXISTS")
+async def hexists(store, args):
+    return int(args[1] in store.get(args[0], {}))
+
+
+@command(b"HDEL")
+async def hdel(store, args):
+    fields = store.get(args[0], {})
+    return sum(fields.pop(field, None) is not None for field in args[1:])
+
+
+@command(b"HLEN")
+async def hlen(store, args):
+    return len(store.get(args[0], {}))
+
+
+@command(b"SADD")
+async def sadd(store, args):
+    members = store.setdefault(args[0], set())
+    added = len(set(args[1:]) - members)
+    members.update(args[1:])
+    return added
+
+
+@command(b"SISMEMBER")
+async def sismember(store, args):
+    return int(args[1] in store.get(args[0], set()))
+
+
+@command(b"SCARD")
+async def scard(store, args):
+    return len(store.get(args[0], set()))
+
+
+@command(b"ZADD")
+async def zadd(store, args):
+    members = store.setdefault(args[0], {})
+    added = 0
+    for score, member in zip(args[1::2], args[2::2]):
+        added += member not in members
+        members[member] = float(score)
+    return added
+
+
+@command(b"ZINCRBY")
+async def zincrby(store, args):
+    members = store.setdefault(args[0], {})
+    members[args[2]] = members.get(args[2], 0.0) + float(args[1])
+    return str(number(members[args[2]])).encode("utf-8")
+
+
+@command(b"ZSCORE")
+async def zscore(store, args):
+    score = store.get(args[0], {}).get(args[1])
+    return None if score is None else str(number(score)).encode("utf-8")
+
+
+@command(b"ZRANGE")
+async def zrange(store, args):
+    ranked = sorted(store.get(args[0], {}).items(), key=lambda item: item[1])
+    start, stop = int(args[1]), int(args[2])
+    # Inclusive stop, negative indexes count from the end
+    stop = len(ranked) + stop if stop < 0 else stop
+    return [member for member, _ in ranked[start : stop + 1]]
+
+
+@command(b"ZREM")
+async def zrem(store, args):
+    members = store.get(args[0], {})
+    return sum(members.pop(member, None) is not None for member in args[1:])
+
+
+@command(b"ZCARD")
+async def zcard(store, args):
+    return len(store.get(args[0], {}))
+
+
+@command(b"ZREMRANGEBYSCORE")
+async def zremrangebyscore(store, args):
+    members = store.get(args[0], {})
+    low, high = float(args[1]), float(args[2])
+    removed = [m for m, score in members.items() if low <= score <= high]
+    for member in removed:
+        del members[member]
+    return len(removed)
+
+
+@command(b"ZPOPMIN")
+async def zpopmin(store, args):
+    members = store.get(args[0], {})
+    count = int(args[1]) if len(args) > 1 else 1
+    popped = sorted(members.items(), key=lambda item: item[1])[:count]
+    for member, _ in popped:
+        del members[member]
+    return [
+        item
+        for member, score in popped
+        for item in (member, str(number(score)).encode("utf-8"))
+    ]
+
+
+@command(b"INFO")
+async def info(store, args):
+    if args and args[0].lower() == b"stats":
+        return (
+            "# Stats\r\n"
+            f"total_net_input_bytes:{store.net_input}\r\n"
+            f"total_net_output_bytes:{store.net_output}\r\n"
+        ).encode("utf-8")
+
+    lines = ["# Commandstats"] + [
+        f"cmdstat_{name}:calls={calls},usec=0,usec_per_call=0.00"
+        for name, calls in sorted(store.calls.items())
+    ]
+    return "\r\n".join(lines).encode("utf-8") + b"\r\n"
+
+
+@command(b"CONFIG")
+async def config(store, args):
+    if args[0].upper() == b"RESETSTAT":
+        store.calls.clear()
+        store.net_input = store.net_output = 0
+        return Simple(b"OK")
+    return []
+
+
+@command(b"FLUSHALL", b"FLUSHDB")
+async def flushall(store, args):
+    store.data.clear()
+    store.expires.clear()
+    return Simple(b"OK")
+
+
+class Simple(bytes):
+    """
+    Simple string reply, e.g. +OK.
+    """
+
+
+class NullArray:
+    """
+    Null array reply, what blocking pops return on timeout.
+    """
+
+
+def encode(reply):
+    if isinstance(reply, Simple):
+        return b"+" + reply + b"\r\n"
+    if isinstance(reply, Exception):
+        return f"-ERR {reply}\r\n".encode("utf-8")
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, NullArray):
+        return b"*-1\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, (list, tuple)):
+        return b"*%d\r\n" % len(reply) + b"".join(encode(r) for r in reply)
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+async def read_command(reader):
+    """
+    Read one command sent as an array of bulk strings, None once the client
+    disconnected.
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+async def execute(store, args):
+    name = args[0].upper()
+    handler = COMMANDS.get(name)
+    if handler is None:
+        return ValueError(f"unknown command '{name.decode('utf-8')}'")
+    try:
+        return await handler(store, args[1:])
+    except (ValueError, TypeError, AttributeError, IndexError) as e:
+        return ValueError(str(e))
+
+
+async def serve_client(store, reader, writer):
+    # Commands queued between MULTI and EXEC, None outside a transaction.
+    # The server runs one command at a time, so EXEC is atomic.
+    transaction = None
+    client.set(reader)
+    try:
+        while True:
+            args = await read_command(reader)
+            if args is None:
+                break
+
+            name = args[0].upper()
+            store.calls[name.decode("utf-8").lower()] += 1
+            # Same bytes as the command the client sent
+            store.net_input += len(encode(args))
+            if name == b"MULTI":
+                transaction, reply = [], Simple(b"OK")
+            elif name == b"DISCARD":
+                transaction, reply = None, Simple(b"OK")
+            elif name == b"EXEC":
+                reply = [await execute(store, queued) for queued in transaction or []]
+                transaction = None
+            elif transaction is not None:
+                transaction.append(args)
+                reply = Simple(b"QUEUED")
+            else:
+                reply = await execute(store, args)
+            reply = encode(reply)
+            store.net_output += len(reply)
+            writer.write(reply)
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start(host="127.0.0.1", port=0):
+    """
+    Start a stand-in in the running event loop, e.g. from a test. Port 0
+    picks a free one.
+
+    Returns
+    -------
+    server : asyncio.Server
+        Listening server, its port is in `server.sockets[0].getsockname()`.
+    store : Store
+        Data and counters of the stand-in.
+    """
+    store = Store()
+    server = await asyncio.start_server(
+        lambda reader, writer: serve_client(store, reader, writer), host, port
+    )
+    return server, store
+
+
+async def main(host, port):
+    server, _ = await start(host, port)
+    print(f"Redis stand-in listening on {host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,368 @@
+"""
+S3 stand-in for offline tests and benchmarks of the object storage backend.
+
+An HTTP server speaking the subset of the S3 API the upload store uses,
+path-style (http://host:port/bucket/key): buckets, objects with ranged
+GETs, multipart uploads and ListObjectsV2. boto3 talks to it with any
+credentials, signatures aren't checked. Data lives in memory.
+
+Like the Redis stand-in, it counts the requests of every operation and
+the bytes exchanged, so benchmarks can report what an image costs.
+
+start() runs it in a thread of the calling process, for tests and
+benchmarks.
+
+💡 NOTE Run with: python3 stress_test/s3_standin.py --port 9000
+"""
+import argparse
+import collections
+import hashlib
+import re
+import threading
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class Store:
+    """
+    Buckets, each a dict of key to (content, ETag), and the multipart
+    uploads in progress, by upload ID.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.uploads = {}
+        self.calls = collections.Counter()
+        self.net_input = 0
+        self.net_output = 0
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls.clear()
+            self.net_input = 0
+            self.net_output = 0
+
+
+def etag(content):
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+def xml(tag, body):
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<{tag} xmlns="{XMLNS}">{body}</{tag}>'
+    ).encode("utf-8")
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive, and "Expect: 100-continue" gets its interim response
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, don't wait for the ACK between
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def parse(self):
+        url = urlsplit(self.path)
+        bucket, _, key = unquote(url.path).lstrip("/").partition("/")
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        # Flags such as ?uploads have no value
+        for name in url.query.split("&"):
+            if name and "=" not in name:
+                query[name] = ""
+        return bucket, key, query
+
+    def read_body(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.store.lock:
+            self.store.net_input += len(body)
+        return body
+
+    def reply(self, status, body=b"", headers=None, length=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body) if length is None else length))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+            with self.store.lock:
+                self.store.net_output += len(body)
+
+    def error(self, status, code, message=""):
+        body = b""
+        # HEAD responses carry the status only
+        if self.command != "HEAD":
+            body = (
+                f'<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>{code}</Code>'
+                f"<Message>{escape(message)}</Message></Error>"
+            ).encode("utf-8")
+        self.reply(status, body, {"Content-Type": "application/xml"})
+
+    def dispatch(self, operation, *args):
+        with self.store.lock:
+            self.store.calls[operation] += 1
+        getattr(self, operation)(*args)
+
+    def do_PUT(self):
+        bucket, key, query = self.parse()
+        if not key:
+            return self.dispatch("create_bucket", bucket)
+        if "uploadId" in query:
+            return self.dispatch("upload_part", query)
+        return self.dispatch("put_object", bucket, key)
+
+    def do_POST(self):
+        bucket, key, query = self.parse()
+        if "uploads" in query:
+            return self.dispatch("create_multipart_upload", bucket, key)
+        return self.dispatch("complete_multipart_upload", bucket, key, query)
+
+    def do_GET(self):
+        bucket, key, query = self.parse()
+        if not key:
+            return self.dispatch("list_objects_v2", bucket, query)
+        return self.dispatch("get_object", bucket, key)
+
+    def do_HEAD(self):
+        bucket, key, _ = self.parse()
+        if not key:
+            return self.dispatch("head_bucket", bucket)
+        return self.dispatch("head_object", bucket, key)
+
+    def do_DELETE(self):
+        bucket, key, query = self.parse()
+        if "uploadId" in query:
+            return self.dispatch("abort_multipart_upload", query)
+        return self.dispatch("delete_object", bucket, key)
+
+    def create_bucket(self, bucket):
+        self.read_body()
+        with self.store.lock:
+            self.store.buckets.setdefault(bucket, {})
+        self.reply(200, headers={"Location": f"/{bucket}"})
+
+    def head_bucket(self, bucket):
+        if bucket not in self.store.buckets:
+            return self.error(404, "NoSuchBucket")
+        self.reply(200)
+
+    def objects(self, bucket):
+        objects = self.store.buckets.get(bucket)
+        if objects is None:
+            self.error(404, "NoSuchBucket", bucket)
+        return objects
+
+    def put_object(self, bucket, key):
+        content = self.read_body()
+        objects = self.objects(bucket)
+        if objects is None:
+            return
+        objects[key] = (content, etag(content))
+        self.reply(200, headers={"ETag": objects[key][1]})
+
+    def head_object(self, bucket, key):
+        objects = self.objects(bucket)
+        if objects is None:
+            return
+        if key not in objects:
+            return self.error(404, "NoSuchKey")
+        content, tag = objects[key]
+        self.reply(200, headers=self.object_headers(tag), length=len(content))
+
+    def object_headers(self, tag):
+        return {
+            "ETag": tag,
+            "Last-Modified": formatdate(usegmt=True),
+            "Accept-Ranges": "bytes",
+            "Content-Type": "binary/octet-stream",
+        }
+
+    def get_object(self, bucket, key):
+        objects = self.objects(bucket)
+        if objects is None:
+            return
+        if key not in objects:
+            return self.error(404, "NoSuchKey", key)
+        content, tag = objects[key]
+        headers = self.object_headers(tag)
+
+        byte_range = self.headers.get("Range")
+        if byte_range is None:
+            return self.reply(200, content, headers)
+
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", byte_range)
+        if not match or match.groups() == ("", ""):
+            return self.reply(200, content, headers)
+        first, last = match.groups()
+        if first == "":
+            # Suffix range, the last bytes
+            first, last = max(len(content) - int(last), 0), len(content) - 1
+        else:
+            first = int(first)
+            last = min(int(last), len(content) - 1) if last else len(content) - 1
+        if first >= len(content) or first > last:
+            return self.error(416, "InvalidRange", byte_range)
+
+        headers["Content-Range"] = f"bytes {first}-{last}/{len(content)}"
+        self.reply(206, content[first : last + 1], headers)
+
+    def delete_object(self, bucket, key):
+        objects = self.objects(bucket)
+        if objects is None:
+            return
+        objects.pop(key, None)
+        self.reply(204)
+
+    def list_objects_v2(self, bucket, query):
+        objects = self.objects(bucket)
+        if objects is None:
+            return
+        prefix = query.get("prefix", "")
+        start = query.get("continuation-token", query.get("start-after", ""))
+        max_keys = int(query.get("max-keys", 1000))
+
+        keys = sorted(k for k in objects if k.startswith(prefix) and k > start)
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        body = "".join(
+            f"<Contents><Key>{escape(k)}</Key><Size>{len(objects[k][0])}</Size>"
+            f"<ETag>{escape(objects[k][1])}</ETag><StorageClass>STANDARD"
+            f"</StorageClass></Contents>"
+            for k in page
+        )
+        body = (
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+            f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>"
+            f"<IsTruncated>{str(truncated).lower()}</IsTruncated>{body}"
+        )
+        if truncated:
+            body += f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>"
+        self.reply(
+            200, xml("ListBucketResult", body), {"Content-Type": "application/xml"}
+        )
+
+    def create_multipart_upload(self, bucket, key):
+        self.read_body()
+        if self.objects(bucket) is None:
+            return
+        upload_id = uuid.uuid4().hex
+        with self.store.lock:
+            self.store.uploads[upload_id] = (bucket, key, {})
+        body = (
+            f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+            f"<UploadId>{upload_id}</UploadId>"
+        )
+        self.reply(
+            200,
+            xml("InitiateMultipartUploadResult", body),
+            {"Content-Type": "application/xml"},
+        )
+
+    def upload_part(self, query):
+        content = self.read_body()
+        upload = self.store.uploads.get(query["uploadId"])
+        if upload is None:
+            return self.error(404, "NoSuchUpload")
+        upload[2][int(query["partNumber"])] = (content, etag(content))
+        self.reply(200, headers={"ETag": etag(content)})
+
+    def complete_multipart_upload(self, bucket, key, query):
+        request = ElementTree.fromstring(self.read_body())
+        with self.store.lock:
+            upload = self.store.uploads.pop(query["uploadId"], None)
+        if upload is None:
+            return self.error(404, "NoSuchUpload")
+
+        parts = []
+        for part in request.iter():
+            if part.tag.endswith("PartNumber"):
+                number = int(part.text)
+                if number not in upload[2]:
+                    return self.error(400, "InvalidPart", str(number))
+                parts.append(upload[2][number][0])
+        content = b"".join(parts)
+        # Multipart ETags are the hash of the part hashes and the part count
+        tag = hashlib.md5(b"".join(hashlib.md5(p).digest() for p in parts))
+        tag = f'"{tag.hexdigest()}-{len(parts)}"'
+        self.store.buckets[bucket][key] = (content, tag)
+
+        body = (
+            f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+            f"<ETag>{escape(tag)}</ETag>"
+        )
+        self.reply(
+            200,
+            xml("CompleteMultipartUploadResult", body),
+            {"Content-Type": "application/xml"},
+        )
+
+    def abort_multipart_upload(self, query):
+        with self.store.lock:
+            self.store.uploads.pop(query["uploadId"], None)
+        self.reply(204)
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, Handler)
+        self.store = Store()
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start(host="127.0.0.1", port=0):
+    """
+    Run the stand-in in a background thread of this process.
+
+    Parameters
+    ----------
+    port : int
+        Port to listen on, any free one by default.
+
+    Returns
+    -------
+    Server
+        The running server, `server.endpoint_url` is its address and
+        `server.shutdown()` stops it.
+    """
+    server = Server((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--bucket", action="append", default=[])
+    args = parser.parse_args()
+
+    server = Server((args.host, args.port))
+    for bucket in args.bucket:
+        server.store.buckets[bucket] = {}
+    print(f"S3 stand-in listening on {server.endpoint_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()